@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class InfraConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "infra"
+
+    def ready(self):
+        # シグナル(NameEntry変更時の置換処理の破棄など)を登録
+        from infra import signals  # noqa: F401
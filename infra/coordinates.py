@@ -0,0 +1,70 @@
+import math
+
+from django.db import models
+
+# << 座標が一致するとみなす誤差(図面の単位、edit_send_dataのepsilonと同じ) >>
+COORDINATE_TOLERANCE = 0.001
+
+# 文字列の座標(damage_coordinate_x など)から作る数値の座標の項目
+COORDINATE_FIELDS = ('damage_x', 'damage_y', 'picture_x', 'picture_y')
+
+# << 座標の文字列('538482.3557216563')を数値に変換(数値にできない場合はNone) >>
+def to_coordinate(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+# << 文字列の座標から数値の座標の項目を設定 >>
+# bulk_createではsave()が呼ばれないため、一括登録の前にも呼ぶ(マイグレーションの過去のモデルにも使える)
+def fill_coordinates(instance):
+    instance.damage_x = to_coordinate(instance.damage_coordinate_x)
+    instance.damage_y = to_coordinate(instance.damage_coordinate_y)
+    instance.picture_x = to_coordinate(instance.picture_coordinate_x)
+    instance.picture_y = to_coordinate(instance.picture_coordinate_y)
+
+# << 数値の座標で検索するクエリセット(prefix：'damage'は損傷座標、'picture'は写真の座標) >>
+class CoordinateQuerySet(models.QuerySet):
+    # 座標(x, y)から誤差以内の行(座標がない場合は、座標が登録されていない行)
+    def near(self, x, y, tolerance=COORDINATE_TOLERANCE, prefix='damage'):
+        x, y = to_coordinate(x), to_coordinate(y)
+        if x is None or y is None:
+            return self.filter(**{f'{prefix}_x__isnull': True, f'{prefix}_y__isnull': True})
+        return self.within(x - tolerance, y - tolerance, x + tolerance, y + tolerance, prefix=prefix)
+
+    # 範囲(左下・右上の座標)の中にある行
+    def within(self, min_x, min_y, max_x, max_y, prefix='damage'):
+        return self.filter(**{f'{prefix}_x__range': (min_x, max_x), f'{prefix}_y__range': (min_y, max_y)})
+
+# << 数値の座標で検索するメモリ上の索引(クエリを1回にまとめた後の突き合わせ用) >>
+# 誤差の大きさのマス目に分けて登録し、検索では周りの9マスだけを調べる
+class CoordinateIndex:
+    def __init__(self, tolerance=COORDINATE_TOLERANCE):
+        self.tolerance = tolerance
+        self.cells = {} # {(マス目x, マス目y, *group): [(登録順, x, y, item), ...]}
+        self.count = 0
+
+    def _cell(self, x, y):
+        return (math.floor(x / self.tolerance), math.floor(y / self.tolerance))
+
+    # group：座標の他に一致させる値(径間・図面など)
+    def add(self, x, y, item, group=()):
+        x, y = to_coordinate(x), to_coordinate(y)
+        cell = (None, None) if x is None or y is None else self._cell(x, y)
+        self.cells.setdefault(cell + tuple(group), []).append((self.count, x, y, item))
+        self.count += 1
+
+    # 座標(x, y)から誤差以内のitem(登録順、座標がない場合は座標なしで登録したitem)
+    def near(self, x, y, group=()):
+        x, y = to_coordinate(x), to_coordinate(y)
+        if x is None or y is None:
+            return [item for _, _, _, item in self.cells.get((None, None) + tuple(group), [])]
+        cell_x, cell_y = self._cell(x, y)
+        found = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for entry in self.cells.get((cell_x + dx, cell_y + dy) + tuple(group), []):
+                    if abs(entry[1] - x) <= self.tolerance and abs(entry[2] - y) <= self.tolerance:
+                        found.append(entry)
+        return [item for _, _, _, item in sorted(found, key=lambda entry: entry[0])]
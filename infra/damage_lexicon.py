@@ -0,0 +1,156 @@
+from collections import namedtuple
+from functools import lru_cache
+import re
+from types import MappingProxyType
+
+# << 損傷の丸番号 → 損傷名 >>
+DAMAGE_NAMES = MappingProxyType({
+    '①': '腐食',
+    '②': '亀裂',
+    '③': 'ゆるみ・脱落',
+    '④': '破断',
+    '⑤': '防食機能の劣化',
+    '⑥': 'ひびわれ',
+    '⑦': '剥離・鉄筋露出',
+    '⑧': '漏水・遊離石灰',
+    '⑨': '抜け落ち',
+    '⑩': '補修・補強材の損傷',
+    '⑪': '床版ひびわれ',
+    '⑫': 'うき',
+    '⑬': '遊間の異常',
+    '⑭': '路面の凹凸',
+    '⑮': '舗装の異常',
+    '⑯': '支承部の機能障害',
+    '⑰': 'その他',
+    '⑱': '定着部の異常',
+    '⑲': '変色・劣化',
+    '⑳': '漏水・滞水',
+    '㉑': '異常な音・振動',
+    '㉒': '異常なたわみ',
+    '㉓': '変形・欠損',
+    '㉔': '土砂詰まり',
+    '㉕': '沈下・移動・傾斜',
+    '㉖': '洗掘',
+})
+
+# << 損傷の丸番号 → 番号(① → 1) >>
+DAMAGE_NUMBERS = MappingProxyType({circle: number for number, circle in enumerate(DAMAGE_NAMES, start=1)})
+
+# << 損傷名 → 丸番号(腐食 → ①) >>
+DAMAGE_CODES = MappingProxyType({name: circle for circle, name in DAMAGE_NAMES.items()})
+
+# << 損傷(丸番号・損傷名・分類・判定) → 写真メモの表現 >>
+DAMAGE_DESCRIPTIONS = MappingProxyType({
+    "①腐食(小小)-b": "腐食", # 1
+    "①腐食(小大)-c": "全体的な腐食",
+    "①腐食(大小)-d": "板厚減少を伴う腐食",
+    "①腐食(大大)-e": "全体的に板厚減少を伴う腐食",
+    "②亀裂-c": "塗膜割れ", # 2
+    "②亀裂-e": "長さのある塗膜割れ・幅0.0mmの亀裂",
+    "③ゆるみ・脱落-c": "ボルト・ナットにゆるみ、脱落(●本中●本)", # 3
+    "③ゆるみ・脱落-e": "ボルト・ナットにゆるみ、脱落(●本中●本)",
+    "④破断-e": "鋼材の破断", # 4
+    "⑤防食機能の劣化(分類1)-c": "塗膜のうき", # 5
+    "⑤防食機能の劣化(分類1)-d": "塗膜の剥離",
+    "⑤防食機能の劣化(分類1)-e": "点錆",
+    "⑤防食機能の劣化(分類2)-c": "点錆",
+    "⑤防食機能の劣化(分類2)-e": "点錆",
+    "⑥ひびわれ(小小)-b": "最大幅0.0mmのひびわれ", # 6
+    "⑥ひびわれ(小大)-c": "最大幅0.0mmかつ間隔0.5m未満のひびわれ",
+    "⑥ひびわれ(中小)-c": "最大幅0.0mmのひびわれ",
+    "⑥ひびわれ(中大)-d": "最大幅0.0mmかつ間隔0.5m未満のひびわれ",
+    "⑥ひびわれ(大小)-d": "最大幅0.0mmのひびわれ",
+    "⑥ひびわれ(大大)-e": "最大幅0.0mmかつ間隔0.5m未満のひびわれ",
+    "⑦剥離・鉄筋露出-c": "コンクリートの剥離", # 7
+    "⑦剥離・鉄筋露出-d": "鉄筋露出",
+    "⑦剥離・鉄筋露出-e": "断面減少を伴う鉄筋露出",
+    "⑧漏水・遊離石灰-c": "漏水", # 8
+    "⑧漏水・遊離石灰-d": "遊離石灰",
+    "⑧漏水・遊離石灰-e": "著しい遊離石灰・泥や錆汁の混入を伴う漏水",
+    "⑨抜け落ち-e": "コンクリート塊の抜け落ち", # 9
+    "⑩補修・補強材の損傷(分類1)-c": "補修・補強材(鋼板)の損傷", # 10
+    "⑩補修・補強材の損傷(分類1)-e": "補修・補強材(鋼板)の損傷",
+    "⑩補修・補強材の損傷(分類2)-c": "補修・補強材(繊維)の損傷",
+    "⑩補修・補強材の損傷(分類2)-e": "補修・補強材(繊維)の損傷",
+    "⑩補修・補強材の損傷(分類3)-c": "補修・補強材(コンクリート)の損傷",
+    "⑩補修・補強材の損傷(分類3)-e": "補修・補強材(コンクリート)の損傷",
+    "⑩補修・補強材の損傷(分類4)-c": "補修・補強材(塗装)の損傷",
+    "⑩補修・補強材の損傷(分類4)-e": "補修・補強材(塗装)の損傷",
+    "⑩補修・補強材の損傷(分類5)-c": "補修・補強材(鋼板)の損傷",
+    "⑩補修・補強材の損傷(分類5)-e": "補修・補強材(鋼板)の損傷",
+    "⑪床版ひびわれ-b": "最大幅0.0mmの1方向ひびわれ", # 11
+    "⑪床版ひびわれ-c": "最大幅0.0mmの1方向ひびわれ",
+    "⑪床版ひびわれ-d": "最大幅0.0mmの1方向ひびわれ",
+    "⑪床版ひびわれ-e": "最大幅0.0mmの角落ちを伴う1方向ひびわれ",
+    "⑫うき-e": "コンクリートのうき", # 12
+    "⑬遊間の異常-c": "遊間の狭まり", # 13
+    "⑬遊間の異常-e": "遊間の接触",
+    "⑭路面の凹凸-c": "段差量0.0mmの凹凸", # 14
+    "⑭路面の凹凸-e": "段差量0.0mmの凹凸",
+    "⑮舗装の異常-c": "最大幅0.0mmのひびわれ", # 15
+    "⑮舗装の異常-e": "最大幅0.0mmのひびわれ・舗装の土砂化",
+    "⑯定着部の異常-c": "定着部の損傷", # 16
+    "⑯定着部の異常-e": "定着部の著しい損傷",
+    "⑱支承部の機能障害(分類1)-e": "●●による機能障害", # 18
+    "⑱支承部の機能障害(分類2)-e": "●●による機能障害",
+    "⑲変色・劣化-e": "劣化", # 19
+    "⑳漏水・滞水-e": "漏水・滞水", # 20
+    "㉑異常な音・振動": "異常な音や振動", # 21
+    "㉒異常なたわみ": "異常なたわみ", # 22
+    "㉓変形・欠損-c": "変形・欠損", # 23
+    "㉓変形・欠損-e": "著しい変形・欠損",
+    "㉔土砂詰まり-e": "土砂詰まり", # 24
+    "㉕沈下・移動・傾斜-e": "下部工や支承部の沈下・移動・傾斜", # 25
+    "㉖洗掘-c": "深さ●●mmの洗掘", # 26
+    "㉖洗掘-e": "深さ●●mmの著しい洗掘",
+})
+
+# 丸番号・損傷名・(分類)・-判定 に分解( ⑤防食機能の劣化(分類1)-e → ⑤, 防食機能の劣化, 分類1, e )
+# 判定の後の変更(㉔土砂詰まり-e→a)は、変更前の判定とする
+DAMAGE_PATTERN = re.compile(r"([①-⑳㉑-㉖])([^(\-]*)(?:\((.*?)\))?(?:-([a-e])(?:→[a-e])?)?")
+OTHER_DAMAGE_PATTERN = re.compile(r"(?<=:)(.*?)(?=\)-e)") # ⑰のコロン(：)と「)-e」の間の文字
+UNREGISTERED_DAMAGE_PATTERN = re.compile(r"[㉈-㉗](.*?)-") # 丸番号(㉑～㉖)と「-」の間の損傷名
+
+ParsedDamage = namedtuple("ParsedDamage", ["number", "name", "category", "rank"])
+
+# << 損傷の文字列を(番号, 損傷名, 分類, 判定)に分解(分解できない場合はNone) >>
+# "⑤防食機能の劣化(分類1)-e" → ParsedDamage(5, '防食機能の劣化', '分類1', 'e')
+@lru_cache(maxsize=1024)
+def parse_damage(damage_name):
+    match = DAMAGE_PATTERN.fullmatch(damage_name.strip())
+    if match is None:
+        return None
+    circle, name, category, rank = match.groups()
+    return ParsedDamage(DAMAGE_NUMBERS[circle], name, category or "", rank or "")
+
+# << 丸番号と判定を除いた損傷名(分解できない場合はNone) >>
+# "⑤防食機能の劣化(分類1)-e" → '防食機能の劣化(分類1)'
+def damage_label(damage_name):
+    parsed = parse_damage(damage_name)
+    if parsed is None:
+        return None
+    return f"{parsed.name}({parsed.category})" if parsed.category else parsed.name
+
+# << 損傷の判定(判定がない・分解できない場合はNone) >>
+# "⑤防食機能の劣化(分類1)-e" → 'e'
+def damage_rank(damage_name):
+    parsed = parse_damage(damage_name)
+    return parsed.rank or None if parsed else None
+
+# << 損傷1つ分の写真メモの表現(表現がない場合はNone) >>
+@lru_cache(maxsize=1024)
+def damage_description(damage_name):
+    if damage_name in DAMAGE_DESCRIPTIONS: # 辞書に一致する場合は登録文字
+        return DAMAGE_DESCRIPTIONS[damage_name]
+    if damage_name.startswith('⑰'): # 17の場合はカッコの中を表示
+        match = OTHER_DAMAGE_PATTERN.search(damage_name)
+        return match.group(1) if match else None
+    match = UNREGISTERED_DAMAGE_PATTERN.search(damage_name) # 登録していない場合は損傷名のみ
+    if match:
+        return match.group(1)
+    return damage_name # 正規表現に一致しない場合はそのまま( 丸番号～判定 )
+
+# << 損傷のリストを写真メモの表現に変換し、コンマ( , )で繋げて返す >>
+def describe_damage(damage_names):
+    descriptions = (damage_description(damage_name) for damage_name in damage_names)
+    return ','.join(description for description in descriptions if description is not None)
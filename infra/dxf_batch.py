@@ -0,0 +1,79 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from infra.dxf_file import dxf_object_key, extract_drawing_spans
+from infra.models import Table
+from infra.storage import get_storage
+
+# << 1図面の抽出が制限時間を超えた場合のエラー >>
+class DxfTimeoutError(Exception):
+    pass
+
+# << 1図面を抽出してキャッシュに保存(ワーカープロセスで実行) >>
+# 引数はバケット名とキーのみ(DB接続やモデルはプロセス間で受け渡さない)
+def extract_one_drawing(bucket_name, object_key, timeout):
+    def on_timeout(signum, frame):
+        raise DxfTimeoutError(f"{timeout}秒以内に抽出が終わりませんでした")
+
+    # signal.alarmはメインスレッドでのみ使用できる
+    use_alarm = bool(timeout) and threading.current_thread() is threading.main_thread()
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, on_timeout)
+        signal.alarm(int(timeout))
+    started = time.perf_counter()
+    try:
+        spans = extract_drawing_spans(bucket_name, object_key)
+        return {
+            "key": object_key,
+            "status": "ok",
+            "spans": {title: (len(flags) if flags is not None else None) for title, flags in spans.items()}, # 径間ごとの旗揚げ数
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+    except Exception as e: # 1つの図面の不備で全体を止めない
+        return {"key": object_key, "status": "error", "error": f"{type(e).__name__}: {e}",
+                "seconds": round(time.perf_counter() - started, 3)}
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previous_handler)
+
+# << 案件に登録されている全橋梁のdxfファイルのキー >>
+def article_dxf_keys(article_id):
+    object_keys = []
+    for table in Table.objects.filter(article_id=article_id).select_related("article", "infra"):
+        object_key = dxf_object_key(table.article, table.infra)
+        if object_key not in object_keys:
+            object_keys.append(object_key)
+    return object_keys
+
+# << 案件内の全図面を事前に抽出し、抽出結果をキャッシュに保存 >>
+def preextract_article(article_id, workers=None, timeout=None):
+    bucket_name = get_storage().bucket_name
+    workers = workers if workers is not None else getattr(settings, "DXF_PREEXTRACT_WORKERS", 4)
+    timeout = timeout if timeout is not None else getattr(settings, "DXF_PREEXTRACT_TIMEOUT", 300)
+    object_keys = article_dxf_keys(article_id)
+    print(f"事前抽出：{len(object_keys)}件の図面を処理します(ワーカー数：{workers})")
+
+    # Celeryのワーカー(デーモンプロセス)は子プロセスを作れないため、順番に処理する
+    if workers <= 1 or len(object_keys) <= 1 or multiprocessing.current_process().daemon:
+        return [extract_one_drawing(bucket_name, object_key, timeout) for object_key in object_keys]
+
+    # 親プロセスのDB接続を子プロセスに引き継がないように閉じておく
+    connections.close_all()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as executor:
+        futures = {executor.submit(extract_one_drawing, bucket_name, object_key, timeout): object_key for object_key in object_keys}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e: # ワーカープロセス自体が異常終了した場合
+                result = {"key": futures[future], "status": "error", "error": f"{type(e).__name__}: {e}"}
+            print(f"事前抽出：{result['key']}：{result['status']}")
+            results.append(result)
+    return results
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+
+# 抽出結果の形式を変えた場合はこの値を上げる(古いキャッシュを使わないようにする)
+CACHE_VERSION = 2
+
+# << DXF抽出結果のキャッシュ(バケット/キー/ETagごと) >>
+# 1段目：プロセス内のLRU(最近使った図面を数件だけメモリに保持)
+# 2段目：ディスク上のJSON(合計サイズが上限を超えたら古いものから削除)
+# キーにETagを含めるため、図面が再アップロードされると自動的に別のキャッシュになる
+class DxfExtractionCache:
+    def __init__(self, directory, max_memory_entries=32, max_disk_bytes=512 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict() # {(bucket, key): (etag, drawing)}
+        self.lock = threading.Lock()
+
+    def _file_prefix(self, bucket_name, object_key):
+        return hashlib.sha256(f"{bucket_name}/{object_key}".encode("utf-8")).hexdigest()[:32]
+
+    def _file_path(self, bucket_name, object_key, etag):
+        etag_hash = hashlib.sha256(f"{CACHE_VERSION}|{etag}".encode("utf-8")).hexdigest()[:16]
+        return self.directory / f"{self._file_prefix(bucket_name, object_key)}_{etag_hash}.json"
+
+    # << キャッシュの取得(見つからなければNone) >>
+    def get(self, bucket_name, object_key, etag):
+        with self.lock:
+            cached = self.memory.get((bucket_name, object_key))
+            if cached and cached[0] == etag:
+                self.memory.move_to_end((bucket_name, object_key))
+                return cached[1]
+
+        file_path = self._file_path(bucket_name, object_key, etag)
+        try:
+            with open(file_path, encoding="utf-8") as f:
+                drawing = json.load(f)
+            os.utime(file_path) # 最終利用日時を更新(削除順の判定に使う)
+        except (OSError, ValueError):
+            return None
+
+        self._remember(bucket_name, object_key, etag, drawing)
+        return drawing
+
+    # << キャッシュの保存 >>
+    def set(self, bucket_name, object_key, etag, drawing):
+        self._remember(bucket_name, object_key, etag, drawing)
+
+        file_path = self._file_path(bucket_name, object_key, etag)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # 一時ファイルに書き込んでから置き換える(他のワーカーが書きかけのファイルを読まないように)
+            temp_path = file_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(drawing, f, ensure_ascii=False)
+            os.replace(temp_path, file_path)
+
+            # 同じ図面の古いETagのキャッシュを削除
+            for old_path in self.directory.glob(f"{self._file_prefix(bucket_name, object_key)}_*.json"):
+                if old_path != file_path:
+                    old_path.unlink(missing_ok=True)
+            self._evict()
+        except OSError as e:
+            print(f"DXFキャッシュの保存に失敗しました: {e}")
+
+    def _remember(self, bucket_name, object_key, etag, drawing):
+        with self.lock:
+            self.memory[(bucket_name, object_key)] = (etag, drawing)
+            self.memory.move_to_end((bucket_name, object_key))
+            while len(self.memory) > self.max_memory_entries:
+                self.memory.popitem(last=False)
+
+    # << ディスクの合計サイズが上限を超えた分を古い順に削除 >>
+    def _evict(self):
+        entries = []
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_disk_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total_size -= size
+
+_cache = None
+_cache_lock = threading.Lock()
+
+# << プロセス共通のキャッシュを取得 >>
+def get_extraction_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DxfExtractionCache(
+                getattr(settings, "DXF_CACHE_DIR", Path(settings.BASE_DIR) / "dxf_cache"),
+                max_memory_entries=getattr(settings, "DXF_CACHE_MEMORY_ENTRIES", 32),
+                max_disk_bytes=getattr(settings, "DXF_CACHE_MAX_BYTES", 512 * 1024 * 1024),
+            )
+        return _cache
+
+# << S3上の図面のETagを取得(HEADリクエストのみ) >>
+def head_etag(storage, bucket_name, object_key):
+    response = storage.head_object(object_key, bucket_name=bucket_name)
+    return response["ETag"].strip('"')
@@ -1,246 +1,487 @@
+from collections import Counter
+import copy
+import logging
 import os
-from pathlib import Path
 import re
 
-import boto3
+from botocore.exceptions import ClientError
+from django.conf import settings
 import ezdxf
+from ezdxf.addons import iterdxf
+import numpy as np
 
+from infra.dxf_cache import get_extraction_cache, head_etag
+from infra.dxf_store import get_dxf_store
 from infra.models import Article, Infra
+from infra.storage import get_storage
 
-# << dxfファイルの座標から、MTextとdefpointsを紐付け >>
-def entity_extension(mtext, neighbor):
+logger = logging.getLogger(__name__)
+
+# 径間ごとのタイトル(1径間、2径間…)と、径間番号がない図面のタイトル
+SPAN_TITLE_PATTERN = re.compile(r"\d+径間")
+DAMAGE_MAP_TITLE = "損傷図"
+
+# << 旗揚げの分類用パターン(モジュール読み込み時に1回だけコンパイル) >>
+FLAG_TEXT = "旗揚げ" # 損傷の旗揚げ(Defpointsの文字と紐付ける)
+SPECIAL_NOTE_TEXT = "特記なき損傷" # 「※」から始まる特記なき損傷
+EXCLUDED_TEXT = "対象外" # 寸法・注記・タイトルなど
+BEARING_BODY_KEYWORD = "支承本体" # 除外キーワードを含んでいても旗揚げとして扱う
+# 旗揚げから除外するキーワード(いずれか1つでも含めば除外)
+EXCLUDED_FLAG_PATTERN = re.compile("|".join(re.escape(keyword) for keyword in ["×", ".", "mm", "本", "/", "損傷図", "NON-a", "⑪-a", "⑪-b", "⑪-c", "⑪-d", "⑪-e"]))
+SPACED_CIRCLE_NUMBER_PATTERN = re.compile(r"\s[\u2460-\u3256]") # 文字列のどこかにスペース丸数字の並びがある
+LEADING_CIRCLE_NUMBER_PATTERN = re.compile(r"^[\u2460-\u3256]") # 文字列の開始が①～㉖
+CIRCLE_NUMBER_PATTERN = re.compile(r"[\u2460-\u3256]") # 文字列のどこかに①～㉖がある
+COMMA_DAMAGE_PATTERN = re.compile(r"[a-z]+,") # コンマ区切りの損傷(例：①-d,⑤-c)
+
+# << 図面から径間の文字列を取り出せなかった場合のエラー >>
+class DxfExtractionError(Exception):
+    pass
+
+# << 図面のMTextを抽出に必要な値だけで保持するレコード >>
+class MTextRecord:
+    __slots__ = ('handle', 'layer', 'text', 'plain_text', 'x', 'y', 'width', 'char_height')
+
+    def __init__(self, mtext):
+        self.handle = mtext.dxf.handle
+        self.layer = mtext.dxf.layer
+        self.text = mtext.dxf.text # 書式コードを含む文字列(タイトル検索用)
+        self.plain_text = mtext.plain_text() # 書式コードを除いた文字列(1エンティティにつき1回だけ変換)
+        insert = mtext.dxf.insert
+        self.x = insert[0]
+        self.y = insert[1]
+        self.width = mtext.dxf.width
+        self.char_height = mtext.dxf.char_height
+
+# << 図面のLWPolylineを頂点座標だけで保持するレコード >>
+class PolylineRecord:
+    __slots__ = ('handle', 'layer', 'points')
+
+    def __init__(self, polyline):
+        self.handle = polyline.dxf.handle
+        self.layer = polyline.dxf.layer
+        self.points = tuple(polyline.get_points('xy')) # ((x, y), ...)
+
+    def __len__(self):
+        return len(self.points)
+
+# << モデルスペースを1回だけ走査してレコードに変換 >>
+# max_records：残すレコード(MTextとDefpointsの枠)の上限(超えた場合はDxfExtractionError、Noneは上限なし)
+def read_drawing_records(entities, max_records=None):
+    mtexts = []
+    polylines = []
+    for entity in entities:
+        if entity.dxftype() == 'MTEXT':
+            mtexts.append(MTextRecord(entity))
+        elif entity.dxftype() == 'LWPOLYLINE' and entity.dxf.layer == 'Defpoints': # 枠はDefpointsレイヤーのみ使用
+            polylines.append(PolylineRecord(entity))
+        else:
+            continue
+        if max_records is not None and len(mtexts) + len(polylines) > max_records:
+            raise DxfExtractionError(f"図面の文字列と枠が上限({max_records}件)を超えたため、読み込みを中止しました")
+    return mtexts, polylines
+
+# << dxfファイルを読み込み、レコードだけを残してezdxfのドキュメントは破棄する >>
+def load_drawing_records(local_file_path):
+    max_records = getattr(settings, 'DXF_MAX_RECORDS', 0) or None
+    # 大きな図面はドキュメント全体をメモリに載せず、1エンティティずつ読み込む(設定した場合のみ)
+    streaming_min_bytes = getattr(settings, 'DXF_STREAMING_MIN_BYTES', -1)
+    if streaming_min_bytes is not None and streaming_min_bytes >= 0 and os.path.getsize(local_file_path) >= streaming_min_bytes:
+        return stream_drawing_records(local_file_path, max_records)
+    doc = ezdxf.readfile(local_file_path)
+    return read_drawing_records(doc.modelspace().query('MTEXT LWPOLYLINE'), max_records)
+
+# << dxfファイルを先頭から順に読み、MTextとLWPolylineだけをレコードに変換(低メモリ) >>
+# メモリ使用量は図面サイズではなく、残したレコードの数で決まる(max_records で上限を設定できる)
+def stream_drawing_records(local_file_path, max_records=None):
+    print("dxfファイルを逐次読み込みで処理します。")
+    return read_drawing_records(iterdxf.modelspace(local_file_path, types=['MTEXT', 'LWPOLYLINE']), max_records)
+
+# << MTextの下・右にあるDefpointsを探す範囲(x_start, x_end, y_start, y_end)を求める >>
+def extension_window(mtext):
     # MTextの挿入点
-    mtext_insertion = mtext.dxf.insert
-    # print(f"Mtextの挿入点(dxf_file.py)：{mtext_insertion}")
-    # print(mtext.dxf)
-    # 特定のプロパティ(Defpoints)で描かれた文字の挿入点
-    neighbor_insertion = neighbor.dxf.insert
-    # print(f"defpointsの挿入点(dxf_file.py)：{neighbor_insertion}")
+    mtext_insertion = (mtext.x, mtext.y)
     # テキストの行数を求める
-    text = mtext.plain_text()
+    text = mtext.plain_text
     text_lines = text.split("\n") if len(text) > 0 else []
     # 改行で区切ったリスト数→行数
     text_lines_count = len(text_lines)
-    # print(f"行数:{text_lines_count}")
     # Defpointsを範囲内とするX座標範囲
     x_start = mtext_insertion[0] # X開始位置(X座標：水平方向)
-    x_end   = mtext_insertion[0] + mtext.dxf.width # X終了位置= 開始位置＋幅
-    y_start = mtext_insertion[1] + mtext.dxf.char_height # Y開始位置(Y座標：上下方向)
-    y_end   = mtext_insertion[1] - mtext.dxf.char_height * (text_lines_count) # 文字の高さ×(行数) (1行分、下方向に余裕を見ている)
+    x_end   = mtext_insertion[0] + mtext.width # X終了位置= 開始位置＋幅
+    y_start = mtext_insertion[1] + mtext.char_height # Y開始位置(Y座標：上下方向)
+    y_end   = mtext_insertion[1] - mtext.char_height * (text_lines_count) # 文字の高さ×(行数) (1行分、下方向に余裕を見ている)
     
     if 2*(y_start - y_end) <= (x_end - x_start): # オブジェクト高さ(y座標)の2倍値よりオブジェクト幅(x座標)の方が大きい場合
-        x_end = mtext_insertion[0] + (mtext.dxf.width * 1/2) # x_endの値を半分にする(横に伸びすぎていると別の defpoints を拾ってしまう)
+        x_end = mtext_insertion[0] + (mtext.width * 1/2) # x_endの値を半分にする(横に伸びすぎていると別の defpoints を拾ってしまう)
     
+    return x_start, x_end, y_start, y_end
+
+# << 挿入点が範囲内にあるか判定 >>
+def in_extension_window(window, insertion_x, insertion_y):
+    x_start, x_end, y_start, y_end = window
     # MTextの下、もしくは右に特定のプロパティで描かれた文字が存在するかどうかを判定する(座標：右が大きく、上が大きい)
-    if (neighbor_insertion[0] >= x_start and neighbor_insertion[0] <= x_end):
+    if (insertion_x >= x_start and insertion_x <= x_end):
         #y_endの方が下部のため、y_end <= neighbor.y <= y_startとする
-        if (neighbor_insertion[1] >= y_end and neighbor_insertion[1] <= y_start):
-            #print("枠内")
+        if (insertion_y >= y_end and insertion_y <= y_start):
             return True
     
     return False
 
-# << 座標値からdefpoints枠内の文字列のみ取得 >>
-def find_square_around_text(article_pk, pk, dxf_filename, search_title_text, second_search_title_text):
-    print("find_square_around_text関数の実行")
-    article = Article.objects.filter(id=article_pk).first()
-    infra = Infra.objects.filter(id=pk).first()
-    
-    # << S3からdxfファイルのダウンロード >>
-    bucket_name = 'infraprotect'
-    object_key = f'{article.案件名}/{infra.title}/{infra.title}.dxf'
-    
-    # ファイルパスにファイル名を含める
-    # local_file_path = f'{str(Path.home() / "Desktop")}\intect_dxf\{article.案件名}\{infra.title}\{infra.title}.dxf'
-    local_file_path = os.path.join(str(Path.home() / "Desktop"), "intect_dxf", article.案件名, infra.title, f'{infra.title}.dxf')
-    def download_dxf_from_s3(bucket_name, object_key, local_file_path):
-        s3 = boto3.client('s3')
-
-        try:
-            # フォルダが存在しない場合は作成
-            os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
-
-            # S3からファイルを指定したパスにダウンロード
-            s3.download_file(bucket_name, object_key, local_file_path)
-            print("ファイルのダウンロードが完了しました。")
-        except Exception as e:
-            print(f"エラーが発生しました: {e}")
-
-    # 関数を呼び出す TODO：遅い箇所
-    download_dxf_from_s3(bucket_name, object_key, local_file_path)
-
-    # ローカルファイルをezdxfで読み込む
+# << dxfファイルの座標から、MTextとdefpointsを紐付け >>
+def entity_extension(mtext, neighbor):
+    # 特定のプロパティ(Defpoints)で描かれた文字の挿入点
+    return in_extension_window(extension_window(mtext), neighbor.x, neighbor.y)
+
+# << DefpointsのMTextを挿入点で格子状に振り分ける空間インデックス >>
+class DefpointsGrid:
+    """
+    DefpointsレイヤーのMTextを挿入点の座標で一様グリッドに登録し、
+    旗揚げごとの探索範囲(extension_window)に重なるセルだけを調べる。
+    結果は図面の順に entity_extension で最初に一致したものと同じになる。
+    """
+    def __init__(self, neighbors):
+        # (図面内の順番, X座標, Y座標, エンティティ)
+        self.points = [(order, neighbor.x, neighbor.y, neighbor) for order, neighbor in enumerate(neighbors)]
+        self.cells = {}
+        if not self.points:
+            self.origin_x = self.origin_y = 0.0
+            self.cell_size = 1.0
+            return
+        
+        x_values = [point[1] for point in self.points]
+        y_values = [point[2] for point in self.points]
+        self.origin_x = min(x_values)
+        self.origin_y = min(y_values)
+        # 1セルあたり数個のDefpointsが入る程度の大きさにする
+        extent = max(max(x_values) - self.origin_x, max(y_values) - self.origin_y)
+        self.cell_size = extent / max(len(self.points) ** 0.5, 1.0) or 1.0
+        
+        for point in self.points:
+            self.cells.setdefault(self._cell(point[1], point[2]), []).append(point)
+
+    def _cell(self, x, y):
+        return (int((x - self.origin_x) // self.cell_size), int((y - self.origin_y) // self.cell_size))
+
+    # << 範囲内で図面上の順番が最初のDefpointsを返す >>
+    def find(self, window):
+        x_start, x_end, y_start, y_end = window
+        if not self.points or x_start > x_end or y_end > y_start:
+            return None
+        
+        min_cell_x, min_cell_y = self._cell(x_start, y_end)
+        max_cell_x, max_cell_y = self._cell(x_end, y_start)
+        # 探索範囲が図面全体より広い場合はセルを辿らずに全件を調べる
+        if (max_cell_x - min_cell_x + 1) * (max_cell_y - min_cell_y + 1) > len(self.cells):
+            candidates = self.points
+        else:
+            candidates = []
+            for cell_x in range(min_cell_x, max_cell_x + 1):
+                for cell_y in range(min_cell_y, max_cell_y + 1):
+                    candidates.extend(self.cells.get((cell_x, cell_y), ()))
+        
+        found = None
+        for point in candidates:
+            if (found is None or point[0] < found[0]) and in_extension_window(window, point[1], point[2]):
+                found = point
+        return found[3] if found else None
+
+# << S3上のdxfファイルのキー >>
+def dxf_object_key(article, infra):
+    return f'{article.案件名}/{infra.title}/{infra.title}.dxf'
+
+# << S3からdxfファイルを取得し、レコードに変換 >>
+# 戻り値：((MTextのレコード, Defpoints枠のレコード), ETag)
+def fetch_drawing_records(storage, bucket_name, object_key, etag=None):
+    # 保存済みの図面と同じETagならダウンロードしない(失敗した場合は例外をそのまま上げる)
     try:
-        doc = ezdxf.readfile(local_file_path)
-        msp = doc.modelspace()
+        local_file_path, etag = get_dxf_store().fetch(storage, bucket_name, object_key, etag)
+    except ClientError as e:
+        print(f"dxfファイルのダウンロードに失敗しました: {e}")
+        raise DxfExtractionError(f"dxfファイルのダウンロードに失敗しました: {object_key}") from e
+
+    # ローカルファイルをezdxfで読み込み、MTextとDefpointsの枠をレコードに変換
+    try:
+        return load_drawing_records(local_file_path), etag
     except IOError as e:
         print(f"ファイルの読み込みに失敗しました: {e}")
+        raise DxfExtractionError(f"ファイルの読み込みに失敗しました: {e}") from e
     except ezdxf.DXFStructureError as e:
         print(f"DXF構造エラー: {e}")
-    
-    text_positions = [] # 見つかったテキストの位置を格納するためのリストを作成
-    extracted_text = []
-    
-    print("dxfファイル読み取り開始")
-    # MTEXTエンティティの各要素をtextという変数に代入してループ処理
-    for mtext_insert_point in msp.query('MTEXT'): # モデルスペース内の「MTEXT」エンティティをすべて照会し、ループ処理
-        #print(f"insert_points：{mtext_insert_point.dxf.text}")
-        if mtext_insert_point.dxf.text == search_title_text:# target_text: # エンティティのテキストが検索対象のテキストと一致した場合
-            text_insertion_point = mtext_insert_point.dxf.insert # テキストの挿入点(dxf.insert)を取得します。
-            #print(f"true_text_insertion_point：{text_insertion_point}")
-            text_positions.append(text_insertion_point[0]) # 挿入点のX座標をリストに保存
-            break
-    if not text_positions: # text_positionsリストが空の場合(見つけられなかった場合)
-        for mtext_insert_point in msp.query('MTEXT'): # モデルスペース内の「MTEXT」エンティティをすべて照会し、ループ処理
-            if mtext_insert_point.dxf.text == second_search_title_text:# second_target_text: # エンティティのテキストが検索対象のテキストと一致した場合
-                text_insertion_point = mtext_insert_point.dxf.insert # テキストの挿入点(dxf.insert)を取得します。
-                #print(f"false_text_insertion_point：{text_insertion_point}")
-                text_positions.append(text_insertion_point[0]) # 挿入点のX座標をリストに保存
-                break
+        raise DxfExtractionError(f"DXF構造エラー: {e}") from e
+
+# << Defpoints枠とMTextの座標をNumPy配列にまとめ、全径間の枠をまとめて判定する >>
+class DrawingLayout:
+    def __init__(self, mtext_records, defpoints_squares):
+        self.mtext_records = mtext_records
+        self.text_x = np.array([record.x for record in mtext_records], dtype=float) # MTextの挿入点のX座標
+        self.is_body_text = np.array([record.layer != 'Defpoints' for record in mtext_records], dtype=bool) # Defpoints以外のMText
         
-    # Defpointsレイヤーで描かれた正方形枠の各要素をsquare変数に代入してループ処理
-    for defpoints_square in msp.query('LWPOLYLINE[layer=="Defpoints"]'): # 
-        if len(defpoints_square) == 4: # 正方形(=4辺)の場合
-            square_x_values = [four_points[0] for four_points in defpoints_square] # squareというリストをループして各点(point)からx座標(インデックス0の要素)を抽出
-            square_min_x = min(square_x_values) # 枠の最小X座標を取得
-            square_max_x = max(square_x_values) # 枠の最大X座標を取得
-        print(f"MAX:{square_min_x}")
-        print(f"MIN:{square_max_x}")
-        print(f"ポジション:{text_positions}")
-        # 文字のX座標が枠の最小X座標と最大X座標の間にあるかチェック
-        # text_positionsの各要素をtext_x_positionという変数に代入してforループを処理
-        for text_x_position in text_positions:
-            # 文字の座標がDefpoints枠のX座標内にある場合
-            if square_min_x <= text_x_position <= square_max_x:
-                # print(list(square)) 4点の座標を求める 
-                left_top_point = list(defpoints_square)[0][0] # 左上の座標
-                right_top_point = list(defpoints_square)[1][0] # 右上の座標
-                right_bottom_point = list(defpoints_square)[2][0] # 右下の座標
-                left_bottom_point = list(defpoints_square)[3][0] # 左下の座標
-                defpoints_max_x = max(left_top_point,right_top_point,left_bottom_point,right_bottom_point) # X座標の最大値
-                defpoints_min_x = min(left_top_point,right_top_point,left_bottom_point,right_bottom_point) # X座標の最小値
-                
-                print(f"defpoints_max_x：{defpoints_max_x}")
-                print(f"defpoints_min_x：{defpoints_min_x}")
-                
-    if len(text_positions) == 0:
-        print("dxfファイルエラー")
-        print("dxfファイル上のタイトル「径間番号」もしくは「損傷図」が見つかりませんでした。")
-        print("マルチテキストで「1径間」もしくは「損傷図」の記載が必要です。")
+        # 枠ごとの先頭4点のX座標(4点未満の枠は足りない分をnanにする)
+        self.square_count = len(defpoints_squares)
+        self.square_lengths = np.array([len(square) for square in defpoints_squares], dtype=int)
+        self.square_x = np.full((self.square_count, 4), np.nan)
+        for i, defpoints_square in enumerate(defpoints_squares):
+            four_points = [point[0] for point in defpoints_square.points[:4]]
+            self.square_x[i, :len(four_points)] = four_points
+
+    # << タイトルのX座標を含むDefpoints枠のX範囲を求める(全タイトルをまとめて判定) >>
+    # 戻り値：(枠の最小X座標, 枠の最大X座標, 枠が見つかったかどうか) の配列
+    def resolve_frames(self, title_x):
+        title_x = np.asarray(title_x, dtype=float)
+        frame_min_x = np.full(len(title_x), np.nan)
+        frame_max_x = np.full(len(title_x), np.nan)
+        resolved = np.zeros(len(title_x), dtype=bool)
+        if self.square_count == 0 or len(title_x) == 0:
+            return frame_min_x, frame_max_x, resolved
         
+        # 4点でない枠は、直前の正方形(=4辺)のX範囲で判定する(従来の判定と同じ)
+        is_square = self.square_lengths == 4
+        carried = np.maximum.accumulate(np.where(is_square, np.arange(self.square_count), -1))
+        if carried[0] < 0: # 最初の枠が正方形でない場合は判定できない
+            print("dxfファイルエラー：最初のDefpoints枠が正方形ではありません。")
+            return frame_min_x, frame_max_x, resolved
+        square_min_x = self.square_x.min(axis=1)[carried]
+        square_max_x = self.square_x.max(axis=1)[carried]
+        
+        # matches[タイトル, 枠]：タイトルのX座標が枠のX範囲内にあるか
+        matches = (square_min_x[None, :] <= title_x[:, None]) & (title_x[:, None] <= square_max_x[None, :])
+        # 4点未満の枠に一致したタイトルは枠を決められない
+        is_broken = np.isnan(self.square_x).any(axis=1)
+        resolved = matches.any(axis=1) & ~(matches & is_broken[None, :]).any(axis=1)
+        # 一致した枠が複数ある場合は、最後の枠を使う
+        last_match = self.square_count - 1 - np.argmax(matches[:, ::-1], axis=1)
+        frame_min_x = np.where(resolved, self.square_x[last_match].min(axis=1), np.nan)
+        frame_max_x = np.where(resolved, self.square_x[last_match].max(axis=1), np.nan)
+        return frame_min_x, frame_max_x, resolved
+
+    # << 枠のX範囲内にあるDefpoints以外のMTextを、全枠まとめて取得 >>
+    # 戻り値：枠ごとのMTextのインデックス配列(図面の順)
+    def texts_in_frames(self, frame_min_x, frame_max_x):
+        frame_min_x = np.asarray(frame_min_x, dtype=float)
+        frame_max_x = np.asarray(frame_max_x, dtype=float)
+        inside = (frame_min_x[:, None] <= self.text_x[None, :]) & (self.text_x[None, :] <= frame_max_x[:, None]) & self.is_body_text[None, :]
+        return [np.flatnonzero(row) for row in inside]
+
+# << MTextの文字列を旗揚げ・特記なき損傷・対象外に分類 >>
+def classify_text(text):
+    if text.startswith("※"):
+        return SPECIAL_NOTE_TEXT
+    # 文字長さが1文字以上あり、除外キーワードを含まない(支承本体は除く)、タイトル(〇径間)でない
+    if len(text) > 0 and (BEARING_BODY_KEYWORD in text or not EXCLUDED_FLAG_PATTERN.search(text)) and not text.endswith("径間"):
+        return FLAG_TEXT
+    return EXCLUDED_TEXT
+
+# << 枠内のMTextをまとめて分類し、分類ごとの件数も返す >>
+def classify_texts(mtext_records):
+    categories = [classify_text(record.plain_text) for record in mtext_records]
+    return categories, Counter(categories)
+
+# << 座標値からdefpoints枠内の文字列のみ取得(1つの枠分) >>
+# handles：旗揚げごとのMTextのハンドルを格納するリスト(特記なき損傷は1つのMTextから複数の旗揚げを作るため 'ハンドル#番号')
+def extract_span_text(frame_mtext_records, defpoints_grid, handles=None):
+    extracted_text = []
+    if handles is None:
+        handles = []
+    defx = defy = None # 直前の旗揚げのDefpointsの座標(見つからない場合に引き継ぐ)
+    split_list = None # 直前のコンマ区切りの損傷
+    
+    categories, category_counts = classify_texts(frame_mtext_records)
+    print(f"文字列の分類：{dict(category_counts)}")
     
     # 指定したX座標範囲内にあるテキストを探す
-    for circle_in_text in msp.query('MTEXT'):
-        # print(f"サークル内(dxf_file.py)：{circle_in_text.dxf.insert.x}")
-        if defpoints_min_x <= circle_in_text.dxf.insert.x <= defpoints_max_x and circle_in_text.dxf.layer != 'Defpoints':
+    for circle_in_text, category in zip(frame_mtext_records, categories):
         # MTextのテキストを抽出する
-            text = circle_in_text.plain_text()
-            #print(text)
-            x, y, _ = circle_in_text.dxf.insert
-            #print(x, y, _)
-            if not text.startswith("※"):
-                #print("※から始まらない")
-                cad_data = text.split("\n") if len(text) > 0 else [] # .split():\nの箇所で配列に分配
-                # if len(cad_data) > 0 and not text.startswith("※") and not any(keyword in text for keyword in ["×", ".", "損傷図"]):
-                if len(cad_data) > 0 and (any(keyword in text for keyword in ["支承本体"]) or not any(keyword in text for keyword in ["×", ".", "mm", "本", "/", "損傷図", "NON-a", "⑪-a", "⑪-b", "⑪-c", "⑪-d", "⑪-e"])) and not text.endswith("径間"):
-                # 文字長さが1文字以上あり、keyword の中に指定した文字が含まれていない    
-            # 改行を含むかどうかをチェックする(and "\n" in cad):# 特定の文字列で始まるかどうかをチェックする: # 特定の文字を含むかどうかをチェックする
-                    #print("有効な文字列")
-                    related_text = "" # 見つけたMTextと関連するDefpointsレイヤの文字列を代入する変数
-            # MTextの下、もしくは右に特定のプロパティ(Defpoints)で描かれた文字を探す
-                    for neighbor in msp.query('MTEXT[layer=="Defpoints"]'): # DefpointsレイヤーのMTextを抽出
-                        #print(f"neighbor:{neighbor}")
-                    # MTextの挿入位置と特定のプロパティで描かれた文字の位置を比較する
-                        if entity_extension(circle_in_text, neighbor):
-                            #print("存在している")
-                        # 特定のプロパティ(Defpoints)で描かれた文字のテキストを抽出する
-                            related_text = neighbor.plain_text()
-                            print(f"DXFテキストデータ:{related_text}")
-                            #print(f"DXFデータ：{neighbor.dxf}")
-                            defx, defy, _ = neighbor.dxf.insert
-                        #extracted_text.append(neighbor_text)
-                            break # 文字列が見つかったらbreakによりforループを終了する
-
-                    if len(related_text) > 0: #related_textに文字列がある＝Defpointsレイヤから見つかった場合
-                       cad_data.append(related_text[:]) # cad_dataに「部材名～使用写真」までを追加
-                       cad_data.append([str(x), str(y)]) # 続いてcad_dataに「MTEXT」のX,Y座標を追加
-                       print(f"cadデータ：{cad_data}")
-                #最後にまとめてcad_dataをextracted_textに追加する
+        text = circle_in_text.plain_text
+        x, y = circle_in_text.x, circle_in_text.y
+        if category == FLAG_TEXT:
+            cad_data = text.split("\n") # .split():\nの箇所で配列に分配
+            related_text = "" # 見つけたMTextと関連するDefpointsレイヤの文字列を代入する変数
+            # MTextの下、もしくは右に特定のプロパティ(Defpoints)で描かれた文字を探す(範囲内のセルのみ)
+            neighbor = defpoints_grid.find(extension_window(circle_in_text))
+            if neighbor is not None:
+                # 特定のプロパティ(Defpoints)で描かれた文字のテキストを抽出する
+                related_text = neighbor.plain_text
+                print(f"DXFテキストデータ:{related_text}")
+                defx, defy = neighbor.x, neighbor.y
+
+            if len(related_text) > 0: #related_textに文字列がある＝Defpointsレイヤから見つかった場合
+               cad_data.append(related_text[:]) # cad_dataに「部材名～使用写真」までを追加
+               cad_data.append([str(x), str(y)]) # 続いてcad_dataに「MTEXT」のX,Y座標を追加
+               print(f"cadデータ：{cad_data}")
+            #最後にまとめてcad_dataをextracted_textに追加する
+            if defx is None:
+                raise DxfExtractionError(f"旗揚げ「{text}」の近くにDefpointsの文字列がありません")
+            
+            #print(f"defpoints_x座標：{defx}")
+            #print(f"defpoints_y座標：{defy}")
+            extracted_text.append(cad_data[:] + [[str(defx), str(defy)]]) # extracted_textに「MTEXTとその座標」およびdefのX,Y座標を追加
+            handles.append(circle_in_text.handle)
+        
+# << ※特記なき損傷の抽出用 ↓ >>                            
+        elif category == SPECIAL_NOTE_TEXT:
+            lines = text.split('\n')# 改行でテキストを分割してリスト化
+            sub_text = [[line] for line in lines]# 各行をサブリストとして持つ多重リストを構築
+
+            last_found_circle_number = None  # 最後に見つかった丸数字を保持する変数
+
+            # リストを逆順でループし、条件に応じて処理
+            for i in range(len(sub_text)-1, -1, -1):  # 後ろから前にループ
+                item = sub_text[i][0]  # textリストの各サブリストの最初の要素（[0]）をitem変数に代入（地覆 ㉓-c）
+                if item.startswith("※"):
+                    sub_text.remove(sub_text[i]) # 配列から除外する
+                elif SPACED_CIRCLE_NUMBER_PATTERN.search(item):  # itemが正規表現patternと一致している場合（スペース丸数字の並びがある）
+                    last_found = item  # last_found変数にitem要素を代入（地覆 ㉓-c）
+                    # print(last_found) 丸数字が付いている要素のみ出力
+                elif 'last_found' in locals():  # last_foundが定義されている（要素が代入されている）場合のみ
+                    space = last_found.replace("　", " ")
+                    # 大文字スペースがあれば小文字に変換
+                    second = space.find(" ", space.find(" ") + 1) # 10
+                    # 2つ目のスペース位置まで抽出
+                    sub_text[i][0] = item + last_found[second:]
+                    # item:スペース丸数字の並びがない文字列
+                    # last_found:スペース丸数字の並びがある文字列
+                    # last_found[second:]:スペースを含めた文字列
+                elif LEADING_CIRCLE_NUMBER_PATTERN.match(item): # 文字列が①～㉖で開始するかチェック
+                    last_found_circle_number = item # 丸数字の入っている要素を保持
+                    sub_text.remove(sub_text[i])
+                else:
+                    if last_found_circle_number is not None and not CIRCLE_NUMBER_PATTERN.search(item):
+                        # 要素に丸数字が含まれておらず、直前に丸数字が見つかっている場合
+                        sub_text[i][0] += " " + last_found_circle_number  # 要素の末尾に丸数字を追加
+                        
+            
+            print("特記なき損傷")
+            for note_index, sub_list in enumerate(sub_text):
+                # サブリストの最初の要素を取得してスペース区切りで分割
+                split_items = sub_list[0].split()
                 
-                    #print(f"defpoints_x座標：{defx}")
-                    #print(f"defpoints_y座標：{defy}")
-                    extracted_text.append(cad_data[:] + [[str(defx), str(defy)]]) # extracted_textに「MTEXTとその座標」およびdefのX,Y座標を追加
+                # 特記なき損傷の「コンマ付きの損傷」を各要素として保存
+                for in_list in split_items:
+                    index_list = ""
+                    if COMMA_DAMAGE_PATTERN.search(in_list):
+                        print(f"in_list：{in_list}")
+                        remove_text = in_list
+                        list_index = split_items.index(in_list)
+                        print("インデックス")
+                        print(list_index) # 2
+                        
+                        split_list = in_list.split(",")
+                        
+                if len(index_list) > 0:
+                    split_items[list_index:list_index] = split_list    
+                    split_items.remove(remove_text)
+
+                # 分割した要素から必要なデータを取り出して新しいサブリストに格納
+                if len(split_items) < 3:
+                    raise DxfExtractionError(f"特記なき損傷「{sub_list[0]}」に部材名・部材番号・損傷がありません")
+                header = split_items[0] + " " + split_items[1]  # 例：'主桁 Mg0101'
+                status = split_items[2:]  # 例：'①-d'
+                # photo_number = '写真番号-00'
+                # defpoints = 'defpoints'
                 
-# << ※特記なき損傷の抽出用 ↓ >>                            
-            else:
-                lines = text.split('\n')# 改行でテキストを分割してリスト化
-                sub_text = [[line] for line in lines]# 各行をサブリストとして持つ多重リストを構築
-
-                pattern = r"\s[\u2460-\u3256]"# 文字列のどこかにスペース丸数字の並びがあるかをチェックする正規表現パターン
-                pattern_start = r"^[\u2460-\u3256]"  # 文字列の開始が①～㉖であることをチェックする正規表現パターン
-                pattern_anywhere = r"[\u2460-\u3256]"  # 文字列のどこかに①～㉖があるかをチェックする正規表現パターン
-                last_found_circle_number = None  # 最後に見つかった丸数字を保持する変数
-
-                # リストを逆順でループし、条件に応じて処理
-                for i in range(len(sub_text)-1, -1, -1):  # 後ろから前にループ
-                    item = sub_text[i][0]  # textリストの各サブリストの最初の要素（[0]）をitem変数に代入（地覆 ㉓-c）
-                    if item.startswith("※"):
-                        sub_text.remove(sub_text[i]) # 配列から除外する
-                    elif re.search(pattern, item):  # itemが正規表現patternと一致している場合（スペース丸数字の並びがある）
-                        last_found = item  # last_found変数にitem要素を代入（地覆 ㉓-c）
-                        # print(last_found) 丸数字が付いている要素のみ出力
-                    elif 'last_found' in locals():  # last_foundが定義されている（要素が代入されている）場合のみ
-                        space = last_found.replace("　", " ")
-                        # 大文字スペースがあれば小文字に変換
-                        second = space.find(" ", space.find(" ") + 1) # 10
-                        # 2つ目のスペース位置まで抽出
-                        sub_text[i][0] = item + last_found[second:]
-                        # item:スペース丸数字の並びがない文字列
-                        # last_found:スペース丸数字の並びがある文字列
-                        # last_found[second:]:スペースを含めた文字列
-                    elif re.match(pattern_start, item): # 文字列が①～㉖で開始するかチェック
-                        last_found_circle_number = item # 丸数字の入っている要素を保持
-                        sub_text.remove(sub_text[i])
-                    else:
-                        if last_found_circle_number is not None and not re.search(pattern_anywhere, item):
-                            # 要素に丸数字が含まれておらず、直前に丸数字が見つかっている場合
-                            sub_text[i][0] += " " + last_found_circle_number  # 要素の末尾に丸数字を追加
-                            
+                if "," in status[0]:
+                    if split_list is None:
+                        raise DxfExtractionError(f"特記なき損傷「{sub_list[0]}」のコンマ区切りの損傷を分けられません")
+                    new_sub_list = [header] + split_list
+                else:
+                    new_sub_list = [header] + status
                 
-                print("特記なき損傷")
-                for sub_list in sub_text:
-                    # サブリストの最初の要素を取得してスペース区切りで分割
-                    split_items = sub_list[0].split()
-                    
-                    # 特記なき損傷の「コンマ付きの損傷」を各要素として保存
-                    for in_list in split_items:
-                        index_list = ""
-                        if re.search(r'[a-z]+,', in_list):
-                            print(f"in_list：{in_list}")
-                            remove_text = in_list
-                            list_index = split_items.index(in_list)
-                            print("インデックス")
-                            print(list_index) # 2
-                            
-                            split_list = in_list.split(",")
-                            
-                    if len(index_list) > 0:
-                        split_items[list_index:list_index] = split_list    
-                        split_items.remove(remove_text)
-
-                    # 分割した要素から必要なデータを取り出して新しいサブリストに格納
-                    header = split_items[0] + " " + split_items[1]  # 例：'主桁 Mg0101'
-                    status = split_items[2:]  # 例：'①-d'
-                    # photo_number = '写真番号-00'
-                    # defpoints = 'defpoints'
-                    
-                    if "," in status[0]:
-                        new_sub_list = [header] + split_list
-                    else:
-                        new_sub_list = [header] + status
-                    
-                    extracted_text.append(new_sub_list)
-
-                    new_sub_list.append([str(x), str(y)])
+                extracted_text.append(new_sub_list)
+                handles.append(f"{circle_in_text.handle}#{note_index}")
+
+                new_sub_list.append([str(x), str(y)])
 # << ※特記なき損傷の抽出用 ↑ >>
-    return extracted_text
\ No newline at end of file
+    return extracted_text
+
+# << 図面内の全タイトル(N径間・損傷図)の文字列を1回の読み込みで取得 >>
+# span_handles：径間ごとの旗揚げのハンドルを格納する辞書({'1径間': ['A1F', 'A2C#0', ...]})
+def extract_all_spans(mtext_records, defpoints_squares, span_handles=None):
+    # DefpointsのMTextは図面ごとに1回だけ空間インデックスに登録する
+    defpoints_grid = DefpointsGrid([record for record in mtext_records if record.layer == 'Defpoints'])
+    
+    # 図面に書かれているタイトルを図面の順に集める(同じタイトルは最初のものを使う)
+    titles = []
+    for mtext_record in mtext_records:
+        if (SPAN_TITLE_PATTERN.fullmatch(mtext_record.text) or mtext_record.text == DAMAGE_MAP_TITLE) and mtext_record.text not in titles:
+            titles.append(mtext_record.text)
+    
+    # 全タイトルの枠と、枠内のMTextをまとめて判定
+    title_x = [next(record.x for record in mtext_records if record.text == title) for title in titles]
+    layout = DrawingLayout(mtext_records, defpoints_squares)
+    frame_min_x, frame_max_x, resolved = layout.resolve_frames(title_x)
+    frame_members = layout.texts_in_frames(frame_min_x, frame_max_x)
+    
+    print("dxfファイル読み取り開始")
+    spans = {} # {'1径間': [旗揚げ, ...], '2径間': [...], '損傷図': [...]}
+    for title, frame_found, min_x, max_x, members in zip(titles, resolved, frame_min_x, frame_max_x, frame_members):
+        handles = []
+        if not frame_found:
+            print(f"{title}を囲むDefpoints枠が見つかりませんでした。")
+            spans[title] = None
+        else:
+            print(f"{title}：defpoints_min_x：{min_x}、defpoints_max_x：{max_x}")
+            try:
+                spans[title] = extract_span_text([mtext_records[i] for i in members], defpoints_grid, handles)
+            except DxfExtractionError: # 1つの径間の図面の不備で他の径間を止めない(プログラムの誤りはそのまま送出)
+                logger.exception("%sの抽出に失敗しました", title)
+                spans[title] = None
+        if span_handles is not None:
+            span_handles[title] = handles if spans[title] is not None else None
+    return spans
+
+# << 全径間の抽出結果から、指定したタイトルの旗揚げを取り出す >>
+def select_span(spans, search_title_text, second_search_title_text):
+    if search_title_text in spans:
+        extracted_text = spans[search_title_text]
+    else: # 「1径間」が見つからない場合は「損傷図」を使う
+        extracted_text = spans.get(second_search_title_text)
+        
+    if extracted_text is None:
+        print("dxfファイルエラー")
+        print("dxfファイル上のタイトル「径間番号」もしくは「損傷図」が見つかりませんでした。")
+        print("マルチテキストで「1径間」もしくは「損傷図」の記載が必要です。")
+        raise DxfExtractionError(f"{search_title_text}（{second_search_title_text}）の旗揚げを取得できませんでした。")
+    # 呼び出し側でリストを書き換えるため、複製を返す
+    return copy.deepcopy(extracted_text)
+
+# << S3上のdxfファイルから全径間の旗揚げとハンドルを取得(DBを使わないため別プロセスからも呼べる) >>
+# 戻り値 {'spans': {タイトル: 旗揚げ}, 'handles': {タイトル: ハンドル}} はキャッシュと共有しているため、書き換える場合はselect_spanで複製を取り出す
+def extract_drawing(bucket_name, object_key):
+    # 図面のETagが変わっていなければ、前回の抽出結果をそのまま使う
+    extraction_cache = get_extraction_cache()
+    storage = get_storage()
+    try:
+        etag = head_etag(storage, bucket_name, object_key)
+    except Exception as e:
+        print(f"ETagの取得に失敗しました: {e}")
+        etag = None
+    if etag:
+        drawing = extraction_cache.get(bucket_name, object_key, etag)
+        if drawing is not None:
+            print("dxfファイルの抽出結果をキャッシュから取得")
+            return drawing
+    
+    (mtext_records, defpoints_squares), etag = fetch_drawing_records(storage, bucket_name, object_key, etag)
+    span_handles = {}
+    drawing = {"spans": extract_all_spans(mtext_records, defpoints_squares, span_handles), "handles": span_handles}
+    if etag:
+        extraction_cache.set(bucket_name, object_key, etag, drawing)
+    return drawing
+
+# << S3上のdxfファイルから全径間の旗揚げを取得 >>
+def extract_drawing_spans(bucket_name, object_key):
+    return extract_drawing(bucket_name, object_key)["spans"]
+
+# << 橋梁のdxfファイルを読み込み、全径間の旗揚げとハンドルを取得 >>
+def find_drawing(article_pk, pk):
+    article = Article.objects.filter(id=article_pk).first()
+    infra = Infra.objects.filter(id=pk).first()
+    
+    return extract_drawing(get_storage().bucket_name, dxf_object_key(article, infra))
+
+# << 指定したタイトルの旗揚げと、旗揚げごとのハンドルを取得 >>
+def find_span_flags(article_pk, pk, search_title_text, second_search_title_text):
+    drawing = find_drawing(article_pk, pk)
+    extracted_text = select_span(drawing["spans"], search_title_text, second_search_title_text)
+    handles = select_span(drawing["handles"], search_title_text, second_search_title_text)
+    return extracted_text, handles
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+# << dxfファイルのローカル保存先(内容のハッシュごとに保存) >>
+# blobs/ab/abcdef….dxf  ：ファイル本体(SHA-256のファイル名、内容が同じなら1つだけ保存)
+# index/<キーのハッシュ>.json：S3のキー → ETag・SHA-256 の対応
+# 書き込みはすべて一時ファイル + os.replace で行うため、複数のgunicornワーカーやCeleryプロセスで共有できる
+# 図面が更新されたら、どのキーからも使われなくなった古い本体を削除する
+# 本体の合計サイズが max_bytes を超えたら、最後に使ったのが古いものから削除(dxf_cache.pyと同じ方法、次回は取得し直す)
+class DxfStore:
+    def __init__(self, directory, max_bytes=2 * 1024 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def _index_path(self, bucket_name, object_key):
+        key_hash = hashlib.sha256(f"{bucket_name}/{object_key}".encode("utf-8")).hexdigest()
+        return self.directory / "index" / f"{key_hash}.json"
+
+    def blob_path(self, sha256):
+        return self.directory / "blobs" / sha256[:2] / f"{sha256}.dxf"
+
+    def _read_index(self, bucket_name, object_key):
+        try:
+            with open(self._index_path(bucket_name, object_key), encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # 本体が削除されている場合は、保存されていないものとして扱う
+        if not self.blob_path(index["sha256"]).exists():
+            return None
+        return index
+
+    def _write_atomic(self, path, write):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+
+    # << S3からdxfファイルを取得(変更がなければダウンロードしない) >>
+    # 戻り値：(ローカルファイルのパス, ETag)
+    def fetch(self, storage, bucket_name, object_key, etag=None):
+        index = self._read_index(bucket_name, object_key)
+        # HEADで確認したETagと保存済みのETagが同じなら、S3へのリクエスト自体を省略
+        if index and etag and index["etag"] == etag:
+            return self._touch(self.blob_path(index["sha256"])), index["etag"]
+
+        request = {}
+        if index:
+            request["IfNoneMatch"] = f'"{index["etag"]}"'
+        try:
+            response = storage.get_object(object_key, bucket_name=bucket_name, **request)
+        except ClientError as e:
+            if index and e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 304: # 変更なし
+                print("dxfファイルは変更されていないため、保存済みのファイルを使用します。")
+                return self._touch(self.blob_path(index["sha256"])), index["etag"]
+            raise
+
+        # ハッシュを計算しながら一時ファイルに書き込み、完了後に本体の場所へ移動
+        digest = hashlib.sha256()
+        incoming_dir = self.directory / "incoming"
+        incoming_dir.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=incoming_dir, suffix=".dxf")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response["Body"].iter_chunks(1024 * 1024):
+                    digest.update(chunk)
+                    f.write(chunk)
+            sha256 = digest.hexdigest()
+            blob_path = self.blob_path(sha256)
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temp_path, blob_path)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+
+        new_etag = response["ETag"].strip('"')
+        previous_sha256 = index["sha256"] if index else None
+        index = {"bucket": bucket_name, "key": object_key, "etag": new_etag, "sha256": sha256}
+        self._write_atomic(self._index_path(bucket_name, object_key),
+                           lambda f: f.write(json.dumps(index, ensure_ascii=False).encode("utf-8")))
+        print("ファイルのダウンロードが完了しました。")
+        if previous_sha256 and previous_sha256 != sha256: # 更新前の本体
+            self._remove_unreferenced(previous_sha256)
+        self._evict(keep=blob_path)
+        return blob_path, new_etag
+
+    # << 最終利用日時を更新(削除順の判定に使う) >>
+    def _touch(self, blob_path):
+        try:
+            os.utime(blob_path)
+        except OSError:
+            pass
+        return blob_path
+
+    # << どのキーの対応からも使われていない本体を削除(内容が同じ図面は本体を共有するため確認してから削除) >>
+    def _remove_unreferenced(self, sha256):
+        for index_path in (self.directory / "index").glob("*.json"):
+            try:
+                with open(index_path, encoding="utf-8") as f:
+                    if json.load(f).get("sha256") == sha256:
+                        return
+            except (OSError, ValueError):
+                continue
+        self.blob_path(sha256).unlink(missing_ok=True)
+
+    # << 本体の合計サイズが上限を超えた分を古い順に削除 >>
+    # keep：これから返すファイル(上限より大きい場合も削除しない)
+    def _evict(self, keep=None):
+        entries = []
+        for path in (self.directory / "blobs").glob("*/*.dxf"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True) # 対応(index)は残す(本体がない場合は _read_index で保存されていないものとして扱う)
+            total_size -= size
+
+_store = None
+_store_lock = threading.Lock()
+
+# << プロセス共通のdxf保存先を取得 >>
+def get_dxf_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = DxfStore(
+                getattr(settings, "DXF_STORE_DIR", Path(settings.BASE_DIR) / "dxf_store"),
+                max_bytes=getattr(settings, "DXF_STORE_MAX_BYTES", 2 * 1024 * 1024 * 1024),
+            )
+        return _store
@@ -0,0 +1,117 @@
+import hashlib
+import json
+
+from django.db import transaction
+
+from infra.models import BridgePicture, FlagFingerprint, FullReportData
+
+# 旗揚げの処理結果(item)のうち、保存しないキー
+FLAG_STATE_KEYS = ('search', 'flag_handle', 'flag_fingerprint', 'unchanged')
+
+# << 旗揚げの指紋(ハンドル・文字列・挿入点と、分解した写真番号・写真指定のハッシュ) >>
+# 図面が更新されたときに、追加・削除・変更された旗揚げだけを処理し直すために使う
+# 写真番号と写真指定の撮影日・イニシャルは前の旗揚げから引き継ぐため、旗揚げの文字列が同じでも前の旗揚げの変更で変わる
+def flag_digest(handle, flag, record):
+    payload = [handle, flag, record.picture_number, record.picture_patterns]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+# << 前回処理した旗揚げの指紋と処理結果 {ハンドル: (指紋, 処理結果)} >>
+def stored_flag_items(table, span_number):
+    return {handle: (fingerprint, item) for handle, fingerprint, item
+            in FlagFingerprint.objects.filter(table=table, span_number=span_number).values_list('handle', 'fingerprint', 'item')}
+
+# << 前回の処理結果を使えるかどうか(指紋が同じ、かつ写真指定の写真が見つかっている場合) >>
+# 写真は図面と別にアップロードされるため、写真が見つかっていない旗揚げは毎回検索し直す
+# 登録済みのデータが残っているかどうかは、登録の前に changed_flag_rows で確認する
+def is_unchanged_flag(stored, fingerprint):
+    return stored is not None and stored[0] == fingerprint and bool(stored[1].get('picture_found'))
+
+# << 旗揚げの座標(損傷座標の文字列) >>
+def flag_coordinate(item):
+    damage_coordinate = item.get('damage_coordinate') or [None, None]
+    return (damage_coordinate[0], damage_coordinate[1])
+
+# << 径間に登録されているデータのid {'report': {座標: [FullReportDataのid]}, 'picture': {座標: [BridgePictureのid]}} >>
+def span_row_ids(table, span_number):
+    rows = {'span_number': span_number, 'infra': table.infra_id, 'article': table.article_id}
+    span_rows = {}
+    for kind, model in (('report', FullReportData), ('picture', BridgePicture)):
+        span_rows[kind] = {}
+        for row_id, x, y in model.objects.filter(**rows).values_list('id', 'damage_coordinate_x', 'damage_coordinate_y'):
+            span_rows[kind].setdefault((x, y), []).append(row_id)
+    return span_rows
+
+# << 旗揚げの座標に登録されているデータの件数 {'report': 件数, 'picture': 件数} >>
+def flag_row_counts(span_rows, item):
+    coordinate = flag_coordinate(item)
+    return {kind: len(span_rows[kind].get(coordinate, [])) for kind in ('report', 'picture')}
+
+# << 前回の登録後に、旗揚げのデータが削除されているかどうか(edit_send_dataなど、図面以外からの削除) >>
+def flag_rows_missing(stored_item, span_rows, item):
+    stored_counts = stored_item.get('row_counts') if stored_item else None
+    if stored_counts is None: # 件数を記録していない場合は確認できないため登録し直す
+        return True
+    current_counts = flag_row_counts(span_rows, item)
+    return any(current_counts[kind] < stored_counts.get(kind, 0) for kind in current_counts)
+
+# << 削除・変更された旗揚げの古いデータのid(データベースへの登録前に呼び出す、ここでは削除しない) >>
+# 変更された旗揚げは損傷写真帳のデータと写真を登録し直す(写真の損傷名・メモも旗揚げから作られるため、全旗揚げを処理した場合と同じ結果にする)
+# 次の旗揚げは変更されていなくても登録し直す(items の 'unchanged' を False にする)
+#   ・登録済みのデータが前回の登録後に削除されている旗揚げ
+#   ・座標が同じ旗揚げが変更された旗揚げ(古いデータの削除で、その旗揚げのデータも削除されるため)
+# 削除は登録と同じトランザクションで prune_flag_rows を呼び出して行う(登録の途中で失敗した場合に、古いデータだけが消えないようにする)
+def changed_flag_rows(table, span_number, items):
+    stored = stored_flag_items(table, span_number)
+    span_rows = span_row_ids(table, span_number)
+    for item in items:
+        if item.get('unchanged') and flag_rows_missing(stored.get(item['flag_handle'], (None, None))[1], span_rows, item):
+            item['unchanged'] = False
+
+    unchanged_handles = {item['flag_handle'] for item in items if item.get('unchanged')}
+    stale_coordinates = {flag_coordinate(stored_item) for handle, (_, stored_item) in stored.items() if handle not in unchanged_handles}
+    for item in items:
+        if item.get('unchanged') and flag_coordinate(item) in stale_coordinates:
+            item['unchanged'] = False
+    return {kind: [row_id for coordinate in stale_coordinates for row_id in span_rows[kind].get(coordinate, [])]
+            for kind in ('report', 'picture')}
+
+# << changed_flag_rows で集めた古いデータを削除 >>
+def prune_flag_rows(span_number, stale, batch_size=1000):
+    deleted = 0
+    with transaction.atomic():
+        for model, ids in ((FullReportData, stale['report']), (BridgePicture, stale['picture'])):
+            for start in range(0, len(ids), batch_size):
+                deleted += model.objects.filter(id__in=ids[start:start + batch_size]).delete()[0]
+    print(f"旗揚げの差分：{span_number}　変更・削除された旗揚げのデータを{deleted}件削除")
+    return deleted
+
+# << 旗揚げの指紋と処理結果を保存し、削除された旗揚げの指紋を削除(データベースへの登録後に呼び出す) >>
+# 旗揚げの座標に登録されているデータの件数も保存する(次回、削除されていないかの確認に使う)
+def save_flag_fingerprints(table, span_number, items):
+    span_rows = span_row_ids(table, span_number)
+    rows = [
+        FlagFingerprint(
+            handle=item['flag_handle'],
+            fingerprint=item['flag_fingerprint'],
+            span_number=span_number,
+            item={**{key: value for key, value in item.items() if key not in FLAG_STATE_KEYS}, 'row_counts': flag_row_counts(span_rows, item)},
+            table=table,
+            infra_id=table.infra_id,
+            article_id=table.article_id,
+        )
+        for item in items if item.get('flag_handle') and not item.get('unchanged')
+    ]
+    handles = [item['flag_handle'] for item in items if item.get('flag_handle')]
+    with transaction.atomic():
+        FlagFingerprint.objects.filter(table=table, span_number=span_number).exclude(handle__in=handles).delete()
+        FlagFingerprint.objects.bulk_create(
+            rows, batch_size=500, update_conflicts=True, unique_fields=['table', 'span_number', 'handle'],
+            update_fields=['fingerprint', 'item', 'updated_at'],
+        )
+
+# << 案件(省略時は全案件)の指紋を破棄(次回は全旗揚げを処理し直す) >>
+def invalidate_flag_fingerprints(article_id=None):
+    fingerprints = FlagFingerprint.objects.all()
+    if article_id is not None:
+        fingerprints = fingerprints.filter(article_id=article_id)
+    return fingerprints.delete()[0]
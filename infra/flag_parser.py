@@ -0,0 +1,237 @@
+import re
+
+# << 旗揚げの文字列の判定 >>
+FLAG_PART_PATTERN = re.compile(r".*?(\s).*?([a-zA-Z]+).*?(\d+)") # 任意の文字(.*?) + スペース(\s) + アルファベット1文字以上 + 任意の文字 + 数字1文字以上( 主桁 Mg0101 )
+FLAG_DAMAGE_PATTERN = re.compile(r'[①-⑳㉑-㉖].*-[a-zA-Z]') # 丸数字とワイルドカードとアルファベット( ⓵腐食-d )
+INITIAL_SPACE_PATTERN = re.compile(r'(?<! )([a-zA-Z]+)(\d{2,})') # 部材記号の前にスペースがない( 主桁Mg0101 )
+NAME_AND_INITIAL_SPLIT_PATTERN = re.compile(r'(?<=[^a-zA-Z])(?=[a-zA-Z])') # アルファベット以外とアルファベットの並び
+NUMBER_RANGE_PATTERN = re.compile(r'[A-Za-z]*(\d+～\d+)') # 省略記号(～)を含む部材番号( Mg0101～0103 )
+PICTURE_COMMA_PATTERN = re.compile(r',(?![^(]*\))') # カッコの外のコンマ
+PICTURE_BRACKET_PATTERN = re.compile(r"\([^()]*\)") # カッコとその中身
+PICTURE_SHORTEST_BRACKET_PATTERN = re.compile(r'\(.*?\)')
+PICTURE_INITIAL_PATTERN = re.compile('[a-zA-Z]+') # 写真のイニシャル
+
+# << 部材種類(主桁 Mg0101)かどうか(撮影日(9月7日)を含むものは除く) >>
+def is_part_text(text):
+    return bool(FLAG_PART_PATTERN.match(text)) and ('月' not in text or '日' not in text)
+
+# << 損傷種類(①腐食(小小)-b)かどうか >>
+def is_damage_text(text):
+    return bool(FLAG_DAMAGE_PATTERN.match(text))
+
+# << コンマで区切られた部材を部材ごとに分ける >>
+# 'Mg0308,0309,対傾構 Cf0209' → ['Mg0308,0309', '対傾構 Cf0209'](先頭が数字の要素は直前の部材に含める)
+def split_comma_parts(text):
+    joined_parts = []
+    one_time_save = ""
+    for item in text.split(","):
+        if item[0].isdigit(): # 先頭が数字の場合(分割してはいけなかった場合)
+            if len(one_time_save) > 0: # 既に格納されている値とコンマで繋げる
+                one_time_save = one_time_save + "," + item
+        else: # 先頭が数字以外の場合
+            if len(one_time_save) > 0: # 前の部材をリストに格納
+                joined_parts.append(one_time_save)
+            one_time_save = item
+    joined_parts.append(one_time_save)
+    return joined_parts
+
+# << 1つの旗揚げを分解した結果 >>
+class FlagRecord:
+    __slots__ = ('texts', 'choiced_picture', 'damage_coordinate', 'picture_coordinate', 'tokens', 'part_texts',
+                 'part_groups', 'damage_groups', 'parts', 'picture_number', 'picture_patterns')
+
+    def __init__(self, texts, choiced_picture, damage_coordinate, picture_coordinate):
+        self.texts = texts # 座標を除いた旗揚げの文字列
+        self.choiced_picture = choiced_picture # 写真指定( 9月7日 S117,253 )
+        self.damage_coordinate = damage_coordinate # 旗揚げの座標
+        self.picture_coordinate = picture_coordinate # 写真指定の座標
+        self.tokens = [] # 部材種類と損傷種類(コンマ区切りの部材は部材ごと)
+        self.part_texts = [] # 部材種類
+        self.part_groups = [] # 損傷が同じ部材ごとのグループ [['主桁 Mg0101'], ['横桁 Cr0102']]
+        self.damage_groups = [] # 部材のグループに対応する損傷 [['①腐食(小小)-b'], ['⑦剥離・鉄筋露出-c']]
+        self.parts = [] # 省略記号(～)とコンマを展開した部材 ['主桁 Mg0101', '主桁 Mg0102']
+        self.picture_number = None # 写真番号( 写真番号-00 )
+        self.picture_patterns = [] # 写真のワイルドカード検索の文字列 ['9月7日 S*/*0117']
+
+    # 部材名称(部材が複数の場合は損傷ごとのグループ)
+    @property
+    def parts_name(self):
+        return self.part_groups if len(self.part_texts) > 1 else [self.parts]
+
+    def __repr__(self):
+        return f"FlagRecord(parts={self.parts!r}, damages={self.damage_groups!r}, pictures={self.picture_patterns!r})"
+
+# << 旗揚げの文字列を分解 >>
+# 写真番号と写真指定のイニシャルは、省略された場合に前の旗揚げの値を引き継ぐため、1径間分を同じパーサーで順番に分解する
+class FlagParser:
+    def __init__(self):
+        self.picture_number = "" # 直前の旗揚げの写真番号
+        self.days_and_initial = "" # 直前の写真指定の撮影日とイニシャル( 9月7日 S )
+
+    # << 旗揚げの文字列を整える(空文字の削除、部材記号の前にスペースを挿入) >>
+    def normalize(self, flag):
+        texts = list(flag)
+        if '' in texts:
+            texts.remove('')
+        if texts and isinstance(texts[0], str) and " " not in texts[0]:
+            texts[0] = INITIAL_SPACE_PATTERN.sub(r' \1\2', texts[0])
+        return texts
+
+    # << 1つの旗揚げを分解 >>
+    def parse(self, flag):
+        texts = self.normalize(flag)
+
+        # 座標(リスト)は末尾にある：[..., 写真指定, 旗揚げの座標, 写真指定の座標] または [..., 旗揚げの座標]
+        list_count = sum(isinstance(text, list) for text in texts)
+        if list_count == 2:
+            record = FlagRecord(texts[:-2], texts[-3], texts[-2], texts[-1])
+        elif list_count == 1:
+            record = FlagRecord(texts[:-1], None, texts[-1], None)
+        else:
+            record = FlagRecord(texts, None, None, None)
+
+        self.parse_parts_and_damages(record)
+        self.parse_picture_number(record)
+        self.parse_picture_patterns(record)
+        return record
+
+    # << 部材種類と損傷種類 >>
+    def parse_parts_and_damages(self, record):
+        for text in record.texts:
+            if is_damage_text(text) or is_part_text(text):
+                record.tokens.extend(split_comma_parts(text) if "," in text else [text])
+        record.part_texts = [token for token in record.tokens if is_part_text(token)]
+
+        if len(record.part_texts) > 1: # 部材名称が2つ以上の場合は、部材と損傷の並び順でグループに分ける
+            record.part_groups, record.damage_groups = self.group_parts_and_damages(record.tokens)
+        else:
+            record.part_groups = [record.part_texts]
+            record.damage_groups = [[text for text in record.texts if is_damage_text(text)]]
+
+        record.parts = self.expand_parts(record.part_groups)
+
+    # << 部材と損傷を並び順でグループに分ける >>
+    # 部材 → 損傷 → 部材 → 損傷 の並びは別々のグループ、部材 → 部材 → 損傷 の並びは同じグループとする
+    def group_parts_and_damages(self, tokens):
+        parts_name_box = []
+        damage_pattern_box = []
+        first_parts_name_box = []
+        first_damage_pattern_box = []
+        sub_parts_name_box = []
+        sub_damage_pattern_box = []
+        parts_name_counter = 1 # 何個目のグループか
+        damage_name_counter = 1
+
+        for token in tokens:
+            if is_part_text(token): # 部材種類の場合
+                if len(first_damage_pattern_box) == 0: # 最初の損傷がまだない場合
+                    first_parts_name_box.append(token)
+                elif parts_name_counter == damage_name_counter + 1: # 新しい部材のグループに、まだ損傷がない場合
+                    sub_parts_name_box.append(token)
+                else:
+                    if parts_name_counter == 1: # 最初のグループを格納
+                        parts_name_box.append(first_parts_name_box)
+                    sub_parts_name_box = [token]
+                    parts_name_box.append(sub_parts_name_box)
+                    parts_name_counter += 1
+            else: # 損傷種類の場合
+                if parts_name_counter == 1:
+                    first_damage_pattern_box.append(token)
+                elif parts_name_counter == damage_name_counter:
+                    sub_damage_pattern_box.append(token)
+                else:
+                    if damage_name_counter == 1: # 最初のグループを格納
+                        damage_pattern_box.append(first_damage_pattern_box)
+                    sub_damage_pattern_box = [token]
+                    damage_pattern_box.append(sub_damage_pattern_box)
+                    damage_name_counter += 1
+
+        if len(parts_name_box) == 0: # 部材は複数だが損傷が同一の場合
+            parts_name_box.append(first_parts_name_box)
+        if len(damage_pattern_box) == 0:
+            damage_pattern_box.append(first_damage_pattern_box)
+        return parts_name_box, damage_pattern_box
+
+    # << 省略記号(～)と番号のみの部材を展開 >>
+    # '主桁 Mg0101～0102' → ['主桁 Mg0101', '主桁 Mg0102']、'主桁 Mg0308,0309' → ['主桁 Mg0308', '主桁 Mg0309']
+    def expand_parts(self, part_groups):
+        parts = []
+        parts_name = None # 直前の部材名称(主桁)
+        parts_initial = None # 直前の部材記号(Mg)
+        for group in part_groups:
+            for text in ",".join(group).split(","):
+                if " " in text: # 部材名称を含んでいる場合
+                    split_name_and_initial = text.split()
+                    parts_name = split_name_and_initial[0]
+                    parts_initial = re.sub(r"[^a-zA-Z]", "", split_name_and_initial[1])
+                else: # 部材記号の前にスペースが含まれていない場合
+                    split_name_and_initial = [split for split in NAME_AND_INITIAL_SPLIT_PATTERN.split(text) if split]
+
+                if parts_name is None: # 部材名称が分からない場合は、そのまま格納
+                    parts.append(text)
+                elif "～" in text:
+                    if len(split_name_and_initial) > 1:
+                        parts_number = split_name_and_initial[1].replace(parts_initial, "")
+                    else:
+                        parts_number = split_name_and_initial[0]
+                    number_part = NUMBER_RANGE_PATTERN.search(parts_number).group(1)
+                    start_number, end_number = number_part.split("～", 1)
+                    # 最初の2桁(径間番号)と最後の2桁(要素番号)の範囲の番号を一つずつ追加
+                    parts_name_and_initial = parts_name + " " + parts_initial
+                    for create_start_number in range(int(start_number[:2]), int(end_number[:2]) + 1):
+                        for create_end_number in range(int(start_number[2:]), int(end_number[2:]) + 1):
+                            parts.append("{}{:02d}{:02d}".format(parts_name_and_initial, create_start_number, create_end_number))
+                elif text.isdigit():
+                    parts.append(parts_name + " " + parts_initial + text)
+                else:
+                    parts.append(text)
+        return parts
+
+    # << 写真番号(写真番号-00)、見つからない場合はNone(旗揚げが空の場合は前の値) >>
+    def parse_picture_number(self, record):
+        for text in record.texts:
+            if "写真" in text:
+                self.picture_number = text
+                break
+            self.picture_number = None
+        record.picture_number = self.picture_number
+
+    # << 写真指定(9月7日 S117,253)をワイルドカード検索の文字列(9月7日 S*/*0117)に変換 >>
+    def parse_picture_patterns(self, record):
+        choiced_picture = record.choiced_picture
+        patterns = []
+
+        if isinstance(choiced_picture, str) and ',' in choiced_picture: # 写真の指定が複数
+            month_and_day = ""
+            for single_choiced_picture in PICTURE_COMMA_PATTERN.split(choiced_picture):
+                single_choiced_picture = PICTURE_BRACKET_PATTERN.sub("", single_choiced_picture) # カッコとその中身を削除
+                # イニシャルの補完(写真番号のみの場合、直前の撮影日とイニシャルを付ける)
+                if single_choiced_picture.isdigit() and len(self.days_and_initial) > 0:
+                    single_choiced_picture = self.days_and_initial + single_choiced_picture
+                # 日付の補完
+                if ' ' in single_choiced_picture: # 日付指定がある場合
+                    month_and_day = single_choiced_picture[:single_choiced_picture.find(' ')]
+                elif len(month_and_day) > 0:
+                    single_choiced_picture = month_and_day + " " + single_choiced_picture
+
+                picture_initial = ",".join(PICTURE_INITIAL_PATTERN.findall(single_choiced_picture))
+                patterns.append(single_choiced_picture.replace(picture_initial, picture_initial + "*/*")) # イニシャルと数字の間に */* を挿入
+                self.days_and_initial = single_choiced_picture[:(single_choiced_picture.index(picture_initial) + len(picture_initial))]
+
+        elif isinstance(choiced_picture, str): # 写真の指定が単一
+            other_delete_choiced_picture = PICTURE_SHORTEST_BRACKET_PATTERN.sub('', choiced_picture)
+            picture_initial = ",".join(PICTURE_INITIAL_PATTERN.findall(other_delete_choiced_picture))
+            if len(picture_initial) > 0: # 写真番号が指定されている場合
+                patterns.append(other_delete_choiced_picture.replace(picture_initial, picture_initial + "*/*"))
+            else:
+                patterns.append("None")
+
+        # 4桁未満の場合は数字の前に 0 を挿入して4桁の数字とする(71 → 0071)
+        for pattern in patterns:
+            pure_number = pattern[pattern.find('*/*') + 3:]
+            record.picture_patterns.append(pattern.replace(pure_number, "") + "{:0>4}".format(pure_number))
+
+# << 1径間分の旗揚げを順番に分解 >>
+def parse_flags(extracted_text):
+    parser = FlagParser()
+    return [parser.parse(flag) for flag in extracted_text]
@@ -0,0 +1,185 @@
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.core.management.base import BaseCommand
+import ezdxf
+
+from infra.dxf_file import classify_texts, extract_all_spans, read_drawing_records, stream_drawing_records
+
+# << 合成図面のレイアウト(図面単位) >>
+SPAN_WIDTH = 1000.0 # 1径間のDefpoints枠の幅
+SPAN_HEIGHT = 700.0 # 1径間のDefpoints枠の高さ
+FLAG_PITCH_X = 24.0 # 旗揚げの横方向の間隔
+FLAG_PITCH_Y = 8.0 # 旗揚げの縦方向の間隔
+CHAR_HEIGHT = 1.0
+SPECIAL_NOTES_PER_SPAN = 2 # 1径間あたりの「※特記なき損傷」の数
+
+# << 合成したdxfファイルを作成(径間ごとにDefpoints枠・タイトル・旗揚げ・写真番号を配置) >>
+def build_synthetic_drawing(file_path, span_count, flag_count):
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    if "Defpoints" not in doc.layers:
+        doc.layers.add("Defpoints")
+
+    flags_per_span = [flag_count // span_count + (1 if i < flag_count % span_count else 0) for i in range(span_count)]
+    columns = max(1, int((SPAN_WIDTH - 2 * FLAG_PITCH_X) // FLAG_PITCH_X))
+    for span_index, span_flags in enumerate(flags_per_span):
+        left = span_index * (SPAN_WIDTH + 100.0)
+        # 径間を囲むDefpoints枠
+        msp.add_lwpolyline([(left, 0), (left + SPAN_WIDTH, 0), (left + SPAN_WIDTH, -SPAN_HEIGHT), (left, -SPAN_HEIGHT)],
+                           close=True, dxfattribs={"layer": "Defpoints"})
+        msp.add_mtext(f"{span_index + 1}径間", dxfattribs={"insert": (left + 10.0, -5.0), "char_height": 5.0, "width": 30.0})
+
+        # 旗揚げ(部材名・損傷名)と、その下のDefpoints(写真番号・撮影日)
+        rows = max(1, -(-span_flags // columns))
+        pitch_y = min(FLAG_PITCH_Y, (SPAN_HEIGHT - 40.0) / rows)
+        for flag_index in range(span_flags):
+            x = left + FLAG_PITCH_X + (flag_index % columns) * FLAG_PITCH_X
+            y = -20.0 - (flag_index // columns) * pitch_y
+            member_number = f"{flag_index % 9 + 1:02}{flag_index // 9 % 99 + 1:02}"
+            msp.add_mtext(f"主桁 Mg{member_number}\\P①腐食(小大)-c",
+                          dxfattribs={"insert": (x, y), "char_height": CHAR_HEIGHT, "width": 10 * CHAR_HEIGHT})
+            msp.add_mtext(f"写真番号-{flag_index % 100:02}\\P10月30日 S{flag_index % 1000:03}",
+                          dxfattribs={"insert": (x + 0.5, y - 1.5 * CHAR_HEIGHT), "char_height": CHAR_HEIGHT * 0.5,
+                                      "width": 10 * CHAR_HEIGHT, "layer": "Defpoints"})
+
+        # 「※特記なき損傷」のまとめ書き
+        for note_index in range(SPECIAL_NOTES_PER_SPAN):
+            msp.add_mtext(f"※特記なき損傷\\P床版 Ds01{note_index + 1:02}\\P横桁 Cr01{note_index + 1:02} ⑦剥離・鉄筋露出-c",
+                          dxfattribs={"insert": (left + SPAN_WIDTH - 150.0, -SPAN_HEIGHT + 30.0 + note_index * 10.0),
+                                      "char_height": CHAR_HEIGHT, "width": 60.0})
+        # 枠内にある寸法などの対象外の文字
+        msp.add_mtext("L=25000mm", dxfattribs={"insert": (left + 500.0, -SPAN_HEIGHT + 5.0), "char_height": CHAR_HEIGHT, "width": 20.0})
+
+    doc.saveas(file_path)
+    return 2 * flag_count + span_count * (SPECIAL_NOTES_PER_SPAN + 2) # MTextの数
+
+# << このプロセスの最大常駐メモリ(KB) >>
+# ru_maxrss は起動元のプロセスの値がexec後も引き継がれるため、Linuxではプロセスごとの VmHWM を使用する
+def peak_rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# << 処理時間・メモリ使用量の計測 >>
+# tracemalloc は処理時間を数倍に延ばすため、trace_memory=True の場合のみ使用する
+def measure(function, entity_count, trace_memory=False):
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull): # 抽出処理のprintは計測に含めるが表示しない
+        result = function()
+    wall_seconds = time.perf_counter() - started
+    measured = {"wall_seconds": round(wall_seconds, 6)}
+    if trace_memory:
+        measured["peak_traced_kb"] = tracemalloc.get_traced_memory()[1] // 1024 # この処理中のPythonのメモリ確保量の最大値
+        tracemalloc.stop()
+    return result, dict(measured, **{
+        "peak_rss_kb": peak_rss_kb(), # このプロセスの最大常駐メモリ
+        "entities_per_second": round(entity_count / wall_seconds, 1) if wall_seconds > 0 else None,
+    })
+
+# << 段階ごとの処理(子プロセスで実行するため、関数は段階名で選ぶ) >>
+# inputs：読み込み済みのレコード(読み込みの段階ではNone)
+def load_with_readfile(file_path, inputs):
+    read_drawing_records(ezdxf.readfile(file_path).modelspace().query('MTEXT LWPOLYLINE'))
+
+def load_with_iterdxf(file_path, inputs):
+    stream_drawing_records(file_path)
+
+def classify_body_texts(file_path, inputs):
+    _, category_counts = classify_texts(inputs)
+    return dict(category_counts)
+
+def extract_flags(file_path, inputs):
+    spans = extract_all_spans(*inputs)
+    return sum(len(flags) for flags in spans.values() if flags is not None)
+
+STAGES = {
+    "readfile": load_with_readfile,
+    "iterdxf": load_with_iterdxf,
+    "classify": classify_body_texts,
+    "extract_all_spans": extract_flags,
+}
+
+# << 1つの段階を計測(子プロセスで実行) >>
+# 最大常駐メモリはプロセスの起動からの最大値のため、段階ごとに新しいプロセスで計測する
+# rss_before_kb：処理前の最大常駐メモリ(Pythonの起動・importと、受け取ったレコードの分)
+def measure_in_child(stage, file_path, inputs, entity_count, trace_memory):
+    rss_before_kb = peak_rss_kb()
+    result, measured = measure(lambda: STAGES[stage](file_path, inputs), entity_count, trace_memory)
+    return result, dict(measured, rss_before_kb=rss_before_kb)
+
+# << 段階ごとに新しいプロセスを起動して計測 >>
+# forkでは親プロセスの常駐メモリが子プロセスの最大値に含まれるため、spawnで起動する
+def measure_stage(stage, file_path, inputs, entity_count, trace_memory):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup) as executor:
+        return executor.submit(measure_in_child, stage, file_path, inputs, entity_count, trace_memory).result()
+
+class Command(BaseCommand):
+    help = "合成した橋梁図面でdxf抽出処理の速度・メモリ使用量を計測し、JSONで出力します(S3・DBは使用しません)。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--spans", type=int, nargs="+", default=[1, 5, 20], help="径間数(複数指定可)")
+        parser.add_argument("--flags", type=int, nargs="+", default=[100, 1000, 10000, 100000], help="1図面あたりの旗揚げ数(複数指定可)")
+        parser.add_argument("--repeat", type=int, default=1, help="1ケースあたりの計測回数(最短の結果を出力)")
+        parser.add_argument("--trace-memory", action="store_true", help="段階ごとのメモリ確保量をtracemallocで計測(処理時間は遅くなる)")
+        parser.add_argument("--output", help="結果を書き込むJSONファイル(省略時は標準出力)")
+        parser.add_argument("--keep-dir", help="合成した図面を保存するフォルダ(省略時は一時フォルダに作成して削除)")
+
+    def handle(self, *args, **options):
+        results = []
+        with tempfile.TemporaryDirectory() as temp_dir:
+            work_dir = options["keep_dir"] or temp_dir
+            os.makedirs(work_dir, exist_ok=True)
+            for span_count in options["spans"]:
+                for flag_count in options["flags"]:
+                    file_path = os.path.join(work_dir, f"bench_{span_count}spans_{flag_count}flags.dxf")
+                    entity_count = build_synthetic_drawing(file_path, span_count, flag_count)
+                    self.stderr.write(f"{span_count}径間・旗揚げ{flag_count}件を計測中…")
+                    results.extend(self.run_case(file_path, span_count, flag_count, entity_count, options["repeat"], options["trace_memory"]))
+
+        output = json.dumps({"ezdxf": ezdxf.__version__, "results": results}, ensure_ascii=False, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    # << 1つの図面について読み込み・分類・抽出の各段階を計測 >>
+    def run_case(self, file_path, span_count, flag_count, entity_count, repeat, trace_memory):
+        case = {"spans": span_count, "flags": flag_count, "mtext_count": entity_count, "file_bytes": os.path.getsize(file_path)}
+        # 分類・抽出の段階に渡すレコード(この読み込みは計測しない)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            records = stream_drawing_records(file_path)
+        body_records = [record for record in records[0] if record.layer != "Defpoints"]
+        stage_inputs = {
+            "readfile": (None, entity_count),
+            "iterdxf": (None, entity_count),
+            "classify": (body_records, len(body_records)),
+            "extract_all_spans": (records, entity_count),
+        }
+        stages = {}
+        stage_results = {}
+        for _ in range(repeat):
+            for stage, (inputs, stage_entity_count) in stage_inputs.items():
+                stage_results[stage], measured = measure_stage(stage, file_path, inputs, stage_entity_count, trace_memory)
+                if stage not in stages or measured["wall_seconds"] < stages[stage]["wall_seconds"]:
+                    stages[stage] = measured
+
+        case["categories"] = stage_results["classify"]
+        case["extracted_flags"] = stage_results["extract_all_spans"]
+        return [dict(case, stage=stage, **measured) for stage, measured in stages.items()]
@@ -0,0 +1,24 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from infra.dxf_batch import preextract_article
+from infra.models import Article
+
+class Command(BaseCommand):
+    help = "案件に登録されている全橋梁のdxfファイルを事前に抽出し、抽出結果をキャッシュに保存します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("article_id", type=int, help="案件(Article)のID")
+        parser.add_argument("--workers", type=int, help="並列に処理するプロセス数(省略時：DXF_PREEXTRACT_WORKERS)")
+        parser.add_argument("--timeout", type=int, help="1図面あたりの制限時間(秒)(省略時：DXF_PREEXTRACT_TIMEOUT)")
+
+    def handle(self, *args, **options):
+        if not Article.objects.filter(id=options["article_id"]).exists():
+            raise CommandError(f"案件が見つかりません: {options['article_id']}")
+
+        results = preextract_article(options["article_id"], workers=options["workers"], timeout=options["timeout"])
+        self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+
+        failed = [result for result in results if result["status"] != "ok"]
+        self.stderr.write(f"完了：{len(results) - len(failed)}件、失敗：{len(failed)}件")
@@ -0,0 +1,16 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from infra.photo_catalog import sync_photo_catalog
+
+class Command(BaseCommand):
+    help = "S3に保存されている写真の一覧(PhotoCatalog)を同期します。通常は追加・変更された写真だけを登録します。"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--article", type=int, help="同期する案件(Article)のID(省略時は全案件)")
+        parser.add_argument("--full", action="store_true", help="全写真を登録し直し、S3から削除された写真も一覧から削除する")
+
+    def handle(self, *args, **options):
+        results = sync_photo_catalog(article_id=options["article"], full=options["full"])
+        self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
@@ -0,0 +1,59 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("infra", "0011_bridgepicture_picture_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PhotoCatalog",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=1024, unique=True)),
+                ("folder", models.CharField(max_length=255)),
+                ("inspector", models.CharField(blank=True, max_length=100)),
+                ("inspector_initial", models.CharField(blank=True, max_length=50)),
+                ("number", models.CharField(blank=True, max_length=4)),
+                ("size", models.BigIntegerField(default=0)),
+                ("etag", models.CharField(blank=True, max_length=255)),
+                ("last_modified", models.DateTimeField(blank=True, null=True)),
+                ("synced_at", models.DateTimeField(auto_now=True)),
+                (
+                    "article",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="infra.article"
+                    ),
+                ),
+                (
+                    "infra",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="infra.infra",
+                        verbose_name="橋梁名",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["infra", "folder", "number"],
+                        name="photo_catalog_lookup",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("infra", "0012_photocatalog"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FlagFingerprint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("handle", models.CharField(max_length=64)),
+                ("fingerprint", models.CharField(max_length=64)),
+                ("span_number", models.CharField(max_length=255)),
+                ("item", models.JSONField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "article",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="infra.article"
+                    ),
+                ),
+                (
+                    "infra",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="infra.infra",
+                        verbose_name="橋梁名",
+                    ),
+                ),
+                (
+                    "table",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="infra.table"
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("table", "span_number", "handle"),
+                        name="unique_flag_fingerprint",
+                    )
+                ],
+            },
+        ),
+    ]
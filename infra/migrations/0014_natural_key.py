@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("infra", "0013_flagfingerprint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bridgepicture",
+            name="natural_key",
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name="fullreportdata",
+            name="natural_key",
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+    ]
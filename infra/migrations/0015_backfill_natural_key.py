@@ -0,0 +1,74 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:40
+
+from django.db import migrations
+
+from infra.natural_key import (
+    BRIDGE_PICTURE_KEY_FIELDS,
+    FULL_REPORT_DATA_KEY_FIELDS,
+    natural_key_digest,
+)
+
+
+# 自動で埋める項目を除いた、行の全ての値のハッシュ(重複した行の内容が同じかどうかの判定用)
+def row_digest(row):
+    field_names = [
+        field.name
+        for field in row._meta.concrete_fields
+        if field.name not in ("id", "natural_key")
+    ]
+    return natural_key_digest(row, field_names)
+
+
+# 登録済みの行にnatural_keyを設定
+# 同じキーの行は、全ての値が同じ場合だけidが最小の行を残して削除する(削除した行と残した行のidを表示)
+# 値が異なる行(測定値などを入力済み)がある場合は削除せずに中止し、該当するidを表示する
+def fill_natural_key(model, field_names, batch_size=1000):
+    seen = {}  # {natural_key: (残す行のid, 行の値のハッシュ)}
+    duplicate_ids = []
+    conflicts = []  # [(残す行のid, 値が異なる行のid), ...]
+    batch = []
+    for row in model.objects.order_by("id").iterator(chunk_size=batch_size):
+        row.natural_key = natural_key_digest(row, field_names)
+        if row.natural_key in seen:
+            kept_id, kept_digest = seen[row.natural_key]
+            if row_digest(row) == kept_digest:
+                print(f"{model.__name__}：id={row.id} は id={kept_id} と同じ内容のため削除します")
+                duplicate_ids.append(row.id)
+            else:
+                conflicts.append((kept_id, row.id))
+            continue
+        seen[row.natural_key] = (row.id, row_digest(row))
+        batch.append(row)
+        if len(batch) >= batch_size:
+            model.objects.bulk_update(batch, ["natural_key"])
+            batch = []
+    if conflicts:
+        pairs = ", ".join(f"{kept_id}/{row_id}" for kept_id, row_id in conflicts)
+        raise RuntimeError(
+            f"{model.__name__}：一意にする項目が同じで内容が異なる行があります。"
+            f"どちらを残すか確認して整理してから、再度マイグレーションしてください(id：{pairs})"
+        )
+    if batch:
+        model.objects.bulk_update(batch, ["natural_key"])
+    for start in range(0, len(duplicate_ids), batch_size):
+        model.objects.filter(id__in=duplicate_ids[start : start + batch_size]).delete()
+
+
+def backfill(apps, schema_editor):
+    fill_natural_key(
+        apps.get_model("infra", "FullReportData"), FULL_REPORT_DATA_KEY_FIELDS
+    )
+    fill_natural_key(
+        apps.get_model("infra", "BridgePicture"), BRIDGE_PICTURE_KEY_FIELDS
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("infra", "0014_natural_key"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("infra", "0015_backfill_natural_key"),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name="bridgepicture",
+            name="unique_bridge_picture",
+        ),
+        migrations.RemoveConstraint(
+            model_name="fullreportdata",
+            name="unique_parts_damage",
+        ),
+        migrations.AlterField(
+            model_name="bridgepicture",
+            name="natural_key",
+            field=models.CharField(editable=False, max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="fullreportdata",
+            name="natural_key",
+            field=models.CharField(editable=False, max_length=64, unique=True),
+        ),
+    ]
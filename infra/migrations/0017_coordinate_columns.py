@@ -0,0 +1,77 @@
+# Generated by Django 5.1.3 on 2026-10-18 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("infra", "0016_natural_key_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bridgepicture",
+            name="damage_x",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="bridgepicture",
+            name="damage_y",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="bridgepicture",
+            name="picture_x",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="bridgepicture",
+            name="picture_y",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="fullreportdata",
+            name="damage_x",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="fullreportdata",
+            name="damage_y",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="fullreportdata",
+            name="picture_x",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="fullreportdata",
+            name="picture_y",
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="bridgepicture",
+            index=models.Index(
+                fields=["damage_x", "damage_y"], name="bridge_picture_damage_point"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bridgepicture",
+            index=models.Index(
+                fields=["picture_x", "picture_y"], name="bridge_picture_picture_point"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fullreportdata",
+            index=models.Index(
+                fields=["damage_x", "damage_y"], name="full_report_damage_point"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fullreportdata",
+            index=models.Index(
+                fields=["picture_x", "picture_y"], name="full_report_picture_point"
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-18 08:05
+
+from django.db import migrations
+
+from infra.coordinates import COORDINATE_FIELDS, fill_coordinates
+
+
+# 登録済みの行に数値の座標を設定
+def fill_model_coordinates(model, batch_size=1000):
+    batch = []
+    for row in model.objects.order_by("id").iterator(chunk_size=batch_size):
+        fill_coordinates(row)
+        batch.append(row)
+        if len(batch) >= batch_size:
+            model.objects.bulk_update(batch, COORDINATE_FIELDS)
+            batch = []
+    if batch:
+        model.objects.bulk_update(batch, COORDINATE_FIELDS)
+
+
+def backfill(apps, schema_editor):
+    fill_model_coordinates(apps.get_model("infra", "FullReportData"))
+    fill_model_coordinates(apps.get_model("infra", "BridgePicture"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("infra", "0017_coordinate_columns"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,8 @@ import re
 import uuid
 from django.db import models
 from django.core.validators import RegexValidator
+from infra.coordinates import COORDINATE_FIELDS, CoordinateQuerySet, fill_coordinates
+from infra.natural_key import BRIDGE_PICTURE_KEY_FIELDS, FULL_REPORT_DATA_KEY_FIELDS, natural_key_digest
 
 # << 案件登録 >>
 CATEGORY = (('bridge', '橋梁'), ('pedestrian', '歩道橋'), ('other', 'その他'))
@@ -172,11 +174,63 @@ class BridgePicture(models.Model):
     table = models.ForeignKey(Table, on_delete=models.CASCADE)
     article = models.ForeignKey(Article, on_delete=models.CASCADE) # 一意にするためのarticle
     infra = models.ForeignKey(Infra, verbose_name="橋梁名", on_delete=models.CASCADE) # 一意にするためのinfra
+    natural_key = models.CharField(max_length=64, unique=True, editable=False) # 一意にする項目のハッシュ(natural_key.py)
+    damage_x = models.FloatField(null=True, editable=False) # 538482.3557216563(damage_coordinate_xの数値、座標の検索用)
+    damage_y = models.FloatField(null=True, editable=False) # 229268.8593029478(damage_coordinate_yの数値、座標の検索用)
+    picture_x = models.FloatField(null=True, editable=False) # picture_coordinate_xの数値(座標の検索用)
+    picture_y = models.FloatField(null=True, editable=False) # picture_coordinate_yの数値(座標の検索用)
+    objects = CoordinateQuerySet.as_manager() # BridgePicture.objects.near(x, y)：座標から誤差以内の写真
+    class Meta:
+        indexes = [
+            models.Index(fields=['damage_x', 'damage_y'], name='bridge_picture_damage_point'),
+            models.Index(fields=['picture_x', 'picture_y'], name='bridge_picture_picture_point'),
+        ]
+    # ユニークの設定(BRIDGE_PICTURE_KEY_FIELDSの組み合わせをハッシュにしてnatural_keyで一意とする)
+    def save(self, *args, **kwargs):
+        if self.image and not self.image._committed: # アップロードされた写真は、保存後のファイル名でハッシュにする
+            self.image.save(self.image.name, self.image.file, save=False)
+        self.natural_key = natural_key_digest(self, BRIDGE_PICTURE_KEY_FIELDS)
+        fill_coordinates(self) # 数値の座標(検索用)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'natural_key', *COORDINATE_FIELDS}
+        super().save(*args, **kwargs)
+
+# << S3に保存されている写真の一覧(写真番号から写真を探すため) >>
+class PhotoCatalog(models.Model):
+    key = models.CharField(max_length=1024, unique=True) # '長生土木13橋/さかもり上/9月7日　佐藤/P9070117.jpg'
+    folder = models.CharField(max_length=255) # '9月7日　佐藤'(橋名の直下のフォルダ)
+    inspector = models.CharField(max_length=100, blank=True) # '佐藤'
+    inspector_initial = models.CharField(max_length=50, blank=True) # 'S'(名前とアルファベットの登録から取得)
+    number = models.CharField(max_length=4, blank=True) # '0117'(ファイル名末尾の4桁)
+    size = models.BigIntegerField(default=0) # ファイルサイズ(バイト)
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.DateTimeField(null=True, blank=True) # S3の最終更新日時
+    synced_at = models.DateTimeField(auto_now=True) # 一覧を取得した日時
+    infra = models.ForeignKey(Infra, verbose_name="橋梁名", on_delete=models.CASCADE)
+    article = models.ForeignKey(Article, on_delete=models.CASCADE)
+    class Meta:
+        indexes = [
+            models.Index(fields=['infra', 'folder', 'number'], name='photo_catalog_lookup')
+        ]
+    def __str__(self):
+        return self.key
+
+# << 旗揚げの指紋(図面が更新されたときに、追加・削除・変更された旗揚げだけを処理し直すため) >>
+class FlagFingerprint(models.Model):
+    handle = models.CharField(max_length=64) # 'A1F'(MTextのハンドル、特記なき損傷は 'A1F#0')
+    fingerprint = models.CharField(max_length=64) # ハンドル・文字列・挿入点・写真番号・写真指定のハッシュ(flag_fingerprint.py)
+    span_number = models.CharField(max_length=255) # 1径間
+    item = models.JSONField() # 損傷写真帳のデータ(create_picturelistの旗揚げ1つ分)
+    updated_at = models.DateTimeField(auto_now=True)
+    table = models.ForeignKey(Table, on_delete=models.CASCADE)
+    infra = models.ForeignKey(Infra, verbose_name="橋梁名", on_delete=models.CASCADE)
+    article = models.ForeignKey(Article, on_delete=models.CASCADE)
     class Meta:
-        # ユニークの設定(fieldsの組み合わせを一意とする。nullが許可されているとデータが重複する可能性があるため、notnullの要素を扱う)
         constraints = [
-            models.UniqueConstraint(fields=['image', 'damage_coordinate_x', 'damage_coordinate_y', 'span_number', 'table', 'infra', 'article'], name='unique_bridge_picture')
+            models.UniqueConstraint(fields=['table', 'span_number', 'handle'], name='unique_flag_fingerprint')
         ]
+    def __str__(self):
+        return f"{self.span_number}　{self.handle}"
 
 # << 損傷用のデータをDBに登録 >>
 class FullReportData(models.Model):
@@ -206,12 +260,25 @@ class FullReportData(models.Model):
     infra = models.ForeignKey(Infra, verbose_name="Infra", on_delete=models.CASCADE)
     article = models.ForeignKey(Article, on_delete=models.CASCADE)
     table = models.ForeignKey(Table, on_delete=models.CASCADE)
+    natural_key = models.CharField(max_length=64, unique=True, editable=False) # 一意にする項目のハッシュ(natural_key.py)
+    damage_x = models.FloatField(null=True, editable=False) # 538482.3557216563(damage_coordinate_xの数値、座標の検索用)
+    damage_y = models.FloatField(null=True, editable=False) # 229268.8593029478(damage_coordinate_yの数値、座標の検索用)
+    picture_x = models.FloatField(null=True, editable=False) # picture_coordinate_xの数値(座標の検索用)
+    picture_y = models.FloatField(null=True, editable=False) # picture_coordinate_yの数値(座標の検索用)
+    objects = CoordinateQuerySet.as_manager() # FullReportData.objects.near(x, y)：座標から誤差以内の損傷
     class Meta:
-        # ユニークの設定(fieldsの組み合わせを一意とする。nullが許可されているとデータが重複する可能性があるため、notnullの要素を扱う)
-        constraints = [
-            models.UniqueConstraint(fields=['parts_name', 'damage_name', 'parts_split', 'join', 'this_time_picture', 'infra', 'article',
-                                            'damage_coordinate_x', 'damage_coordinate_y', 'span_number', 'special_links'], name='unique_parts_damage')
+        indexes = [
+            models.Index(fields=['damage_x', 'damage_y'], name='full_report_damage_point'),
+            models.Index(fields=['picture_x', 'picture_y'], name='full_report_picture_point'),
         ]
+    # ユニークの設定(FULL_REPORT_DATA_KEY_FIELDSの組み合わせをハッシュにしてnatural_keyで一意とする)
+    # 11項目の複合ユニーク制約は、インデックスが大きく、nullの項目(this_time_picture)があると重複を防げないため
+    def save(self, *args, **kwargs):
+        self.natural_key = natural_key_digest(self, FULL_REPORT_DATA_KEY_FIELDS)
+        fill_coordinates(self) # 数値の座標(検索用)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'natural_key', *COORDINATE_FIELDS}
+        super().save(*args, **kwargs)
     def __str__(self):
         return f"{self.parts_name}　{self.damage_name}：{self.span_number}　({self.special_links})"
 
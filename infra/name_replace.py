@@ -0,0 +1,51 @@
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from infra.models import NameEntry
+
+# << 写真名のイニシャル(アルファベット)を登録した名前に置換する >>
+# 全ての置換対象を1つの正規表現(長いものを優先)にまとめ、1回の走査で置換する
+class NameReplacer:
+    def __init__(self, replacements):
+        self.mapping = {}
+        for alphabet, name in replacements:
+            if alphabet: # 空文字は置換対象にしない
+                self.mapping.setdefault(alphabet, name) # 同じアルファベットは先に登録したものを使う
+        keys = sorted(self.mapping, key=len, reverse=True)
+        self.pattern = re.compile("|".join(re.escape(key) for key in keys)) if keys else None
+
+    def __call__(self, text):
+        if self.pattern is None:
+            return text
+        return self.pattern.sub(lambda match: self.mapping[match.group(0)], text)
+
+# 案件ごとの置換処理 {article_id: (作成時刻, NameReplacer)}
+_replacers = {}
+_replacers_lock = threading.Lock()
+
+# << 案件の置換処理を取得(作成済みならクエリなし) >>
+# 同じプロセス内の変更はシグナルで即時反映し、他のプロセス(gunicornワーカー等)での変更は NAME_REPLACER_TTL 秒で反映する
+def get_name_replacer(article_id):
+    ttl = getattr(settings, "NAME_REPLACER_TTL", 60)
+    with _replacers_lock:
+        cached = _replacers.get(article_id)
+        if cached and time.monotonic() - cached[0] < ttl:
+            return cached[1]
+
+    name_entries = NameEntry.objects.filter(article=article_id)
+    replacements = [(entry.alphabet, entry.name) for entry in name_entries] + [(" ", "　")]
+    replacer = NameReplacer(replacements)
+    with _replacers_lock:
+        _replacers[article_id] = (time.monotonic(), replacer)
+    return replacer
+
+# << 案件の置換処理を破棄(NameEntryの登録・削除時に呼び出す) >>
+def invalidate_name_replacer(article_id=None):
+    with _replacers_lock:
+        if article_id is None:
+            _replacers.clear()
+        else:
+            _replacers.pop(article_id, None)
@@ -0,0 +1,18 @@
+import hashlib
+import json
+
+# << 行を一意にする項目(これまでの複合ユニーク制約の項目) >>
+FULL_REPORT_DATA_KEY_FIELDS = ('parts_name', 'damage_name', 'parts_split', 'join', 'this_time_picture', 'infra', 'article',
+                               'damage_coordinate_x', 'damage_coordinate_y', 'span_number', 'special_links')
+BRIDGE_PICTURE_KEY_FIELDS = ('image', 'damage_coordinate_x', 'damage_coordinate_y', 'span_number', 'table', 'infra', 'article')
+
+# << 一意にする項目の値から、固定長(64文字)のキーを作成 >>
+# 値はデータベースに保存する形(外部キーはid、写真はファイル名、リストは文字列)に変換してからハッシュ化する
+# マイグレーション(過去のモデル)からも同じキーを作れるように、モデルに依存しない関数にしている
+def natural_key_digest(instance, field_names):
+    values = []
+    for name in field_names:
+        field = instance._meta.get_field(name)
+        values.append(field.get_prep_value(getattr(instance, field.attname)))
+    payload = json.dumps(values, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,114 @@
+import re
+
+from django.db import transaction
+from django.db.models import Q
+
+from infra.models import NameEntry, PhotoCatalog, Table
+from infra.storage import get_storage
+
+PHOTO_NUMBER_PATTERN = re.compile(r"(\d{4})\.jpg$") # ファイル名末尾の4桁(P9070117.jpg → 0117)
+
+# << S3のキーから写真一覧の1行を作成 >>
+def catalog_row(obj, article, infra, infra_prefix, initials):
+    folder = obj['Key'][len(infra_prefix):].split("/", 1)[0] # '9月7日　佐藤'
+    folder_words = folder.replace(" ", "　").split("　")
+    inspector = folder_words[1] if len(folder_words) >= 2 else ""
+    number_match = PHOTO_NUMBER_PATTERN.search(obj['Key'])
+    return PhotoCatalog(
+        key=obj['Key'],
+        folder=folder,
+        inspector=inspector,
+        inspector_initial=initials.get(inspector, ""),
+        number=number_match.group(1) if number_match else "",
+        size=obj.get('Size', 0),
+        etag=obj.get('ETag', "").strip('"'),
+        last_modified=obj.get('LastModified'),
+        infra=infra,
+        article=article,
+    )
+
+# << 1橋梁分の写真一覧をS3から同期 >>
+# 差分同期：フォルダごとに全件を一覧し、登録済みの写真と比べて、追加された写真とETagが変わった写真だけを登録する
+#           (前の番号のファイル名で追加された写真や、サブフォルダ(Resized/など)の写真も対象にするため、続きだけを一覧しない)
+#           (すべての写真が登録済みでETagも同じフォルダは、何も登録しない)
+# 全件同期(full=True)：全フォルダの写真を登録し直し、S3から削除された写真も一覧から削除する
+def sync_infra_photos(article, infra, storage=None, full=False):
+    storage = storage or get_storage()
+    infra_prefix = f"{article.案件名}/{infra.title}/"
+    initials = {entry.name: entry.alphabet for entry in NameEntry.objects.filter(article=article)} # 撮影者名 → イニシャル
+
+    # 橋名の直下のフォルダ(撮影日 撮影者)を取得
+    folders = storage.list_folders(infra_prefix)
+
+    stored_etags = {} # {キー: ETag}(登録済みの写真)
+    if not full:
+        stored_etags = dict(PhotoCatalog.objects.filter(infra=infra, article=article).values_list('key', 'etag'))
+
+    rows = []
+    listed_keys = set()
+    changed_folders = 0
+    for folder_prefix in folders:
+        objects = storage.list_objects(folder_prefix)
+        listed_keys.update(obj['Key'] for obj in objects)
+        if not full:
+            # 追加された写真と、同じキーで上書きされた写真(ETagが変わった写真)だけを登録する
+            objects = [obj for obj in objects if stored_etags.get(obj['Key']) != obj.get('ETag', "").strip('"')]
+        if objects:
+            changed_folders += 1
+        rows.extend(catalog_row(obj, article, infra, infra_prefix, initials) for obj in objects)
+
+    with transaction.atomic():
+        PhotoCatalog.objects.bulk_create(
+            rows, batch_size=1000, update_conflicts=True, unique_fields=['key'],
+            update_fields=['folder', 'inspector', 'inspector_initial', 'number', 'size', 'etag', 'last_modified', 'synced_at', 'infra', 'article'],
+        )
+        deleted = delete_missing_keys(infra, article, listed_keys) if full else 0 # S3から削除された写真を一覧から削除
+
+    print(f"写真一覧の同期：{infra_prefix}　{len(folders)}フォルダ(変更あり：{changed_folders})、{len(rows)}件を登録、{deleted}件を削除")
+    return {"prefix": infra_prefix, "folders": len(folders), "changed_folders": changed_folders, "synced": len(rows), "deleted": deleted}
+
+# << 一覧に残っているが、S3に存在しない写真を削除 >>
+def delete_missing_keys(infra, article, listed_keys):
+    missing_ids = [photo_id for photo_id, key in PhotoCatalog.objects.filter(infra=infra, article=article).values_list('id', 'key')
+                   if key not in listed_keys]
+    deleted = 0
+    for start in range(0, len(missing_ids), 1000):
+        deleted += PhotoCatalog.objects.filter(id__in=missing_ids[start:start + 1000]).delete()[0]
+    return deleted
+
+# << 案件(省略時は全案件)に登録されている全橋梁の写真一覧を同期 >>
+def sync_photo_catalog(article_id=None, full=False):
+    storage = get_storage()
+    tables = Table.objects.select_related('article', 'infra').exclude(article=None)
+    if article_id is not None:
+        tables = tables.filter(article_id=article_id)
+
+    results = []
+    synced = set()
+    for table in tables:
+        if (table.article_id, table.infra_id) in synced:
+            continue
+        synced.add((table.article_id, table.infra_id))
+        try:
+            results.append(sync_infra_photos(table.article, table.infra, storage=storage, full=full))
+        except Exception as e: # 1橋梁の失敗で他の橋梁の同期を止めない
+            print(f"写真一覧の同期に失敗しました：{table.infra.title}：{e}")
+            results.append({"prefix": f"{table.article.案件名}/{table.infra.title}/", "error": str(e)})
+    return results
+
+# << 写真一覧から、フォルダと写真番号が一致する写真のキーを取得(1回のクエリ) >>
+# searches：[(フォルダ, 写真番号), ...]  戻り値：{(フォルダ, 写真番号): [キー, ...]}
+def find_catalog_photos(infra, article, searches):
+    condition = Q()
+    for folder, number in set(searches):
+        condition |= Q(folder=folder, number=number)
+    found = {}
+    if not condition:
+        return found
+    for folder, number, key in PhotoCatalog.objects.filter(condition, infra=infra, article=article).order_by('key').values_list('folder', 'number', 'key'):
+        found.setdefault((folder, number), []).append(key)
+    return found
+
+# << 橋梁の写真一覧が同期済みかどうか >>
+def has_catalog(infra, article):
+    return PhotoCatalog.objects.filter(infra=infra, article=article).exists()
@@ -0,0 +1,62 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+# << S3の写真フォルダ(案件名/橋名/撮影日 撮影者/)ごとのキー一覧 >>
+# 一覧の取得と写真番号のワイルドカード検索は photo_resolver.py で行い、ここでは取得した一覧を保持する
+# 写真はアプリ外からアップロードされるため、一覧は ttl 秒で取り直す
+# 保持するフォルダは最大 max_folders 件(期限切れの一覧は検索・登録のたびに破棄し、上限を超えた分は使っていない順に破棄)
+class PhotoFolderIndex:
+    def __init__(self, ttl=300, max_folders=1024):
+        self.ttl = ttl
+        self.max_folders = max_folders
+        self.folders = OrderedDict() # {(bucket, prefix): (取得時刻, [キー, ...])}(最近使った順)
+        self.lock = threading.Lock()
+
+    def _purge_expired(self, now):
+        for folder in [folder for folder, (fetched_at, _) in self.folders.items() if now - fetched_at >= self.ttl]:
+            del self.folders[folder]
+
+    # << 有効期限内のフォルダの一覧(なければNone) >>
+    def cached_keys(self, bucket_name, prefix):
+        with self.lock:
+            self._purge_expired(time.monotonic())
+            cached = self.folders.get((bucket_name, prefix))
+            if cached is None:
+                return None
+            self.folders.move_to_end((bucket_name, prefix))
+            return cached[1]
+
+    # << photo_resolver.py で取得したフォルダの一覧を登録 >>
+    def store(self, bucket_name, prefix, folder_keys):
+        with self.lock:
+            now = time.monotonic()
+            self._purge_expired(now)
+            self.folders[(bucket_name, prefix)] = (now, folder_keys)
+            self.folders.move_to_end((bucket_name, prefix))
+            while len(self.folders) > self.max_folders:
+                self.folders.popitem(last=False)
+
+    # << フォルダの一覧を破棄(次の検索で取り直す) >>
+    def invalidate(self, bucket_name=None, prefix=None):
+        with self.lock:
+            if bucket_name is None:
+                self.folders.clear()
+            else:
+                self.folders.pop((bucket_name, prefix), None)
+
+_index = None
+_index_lock = threading.Lock()
+
+# << プロセス共通の写真フォルダ一覧を取得 >>
+def get_photo_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = PhotoFolderIndex(
+                ttl=getattr(settings, "PHOTO_INDEX_TTL", 300),
+                max_folders=getattr(settings, "PHOTO_INDEX_MAX_FOLDERS", 1024),
+            )
+        return _index
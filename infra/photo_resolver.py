@@ -0,0 +1,90 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import fnmatch
+import time
+
+from aiobotocore.session import get_session
+from django.conf import settings
+
+from infra.photo_index import get_photo_index
+from infra.storage import get_storage
+
+# << 写真指定の写真をまとめて検索(asyncio) >>
+# 1径間分(または全径間分)の写真指定から写真フォルダを重複なく集め、
+# フォルダの一覧を同時に最大 concurrency 件まで取得してから、写真番号のワイルドカード検索をメモリ上で行う
+# 取得した一覧はプロセス共通の写真フォルダ一覧(photo_index.py)に登録し、有効期限内は取り直さない
+class PhotoResolver:
+    def __init__(self, bucket_name, concurrency=None, index=None, storage=None):
+        self.bucket_name = bucket_name
+        self.storage = storage or get_storage() # 接続設定(再試行・タイムアウト)と所要時間の記録はゲートウェイと共通
+        self.concurrency = concurrency or getattr(settings, "PHOTO_RESOLVER_CONCURRENCY", 16)
+        self.index = index or get_photo_index()
+
+    # << 1フォルダ分のキーを取得 >>
+    async def _list_folder(self, client, semaphore, prefix):
+        async with semaphore:
+            start = time.perf_counter()
+            folder_keys = []
+            try:
+                paginator = client.get_paginator("list_objects_v2")
+                async for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+                    folder_keys.extend(obj['Key'] for obj in page.get('Contents', []))
+            except Exception:
+                self.storage.record('list_objects_async', time.perf_counter() - start, failed=True)
+                raise
+            self.storage.record('list_objects_async', time.perf_counter() - start)
+            return prefix, folder_keys
+
+    # << 一覧のないフォルダをまとめて取得 >>
+    async def _list_folders(self, prefixes):
+        if self.storage.async_listing:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            async with get_session().create_client('s3', config=self.storage.config) as client:
+                results = await asyncio.gather(*(self._list_folder(client, semaphore, prefix) for prefix in prefixes), return_exceptions=True)
+        else: # ローカルのストレージ(LocalStorage)は順番に一覧
+            results = []
+            for prefix in prefixes:
+                try:
+                    results.append((prefix, [obj['Key'] for obj in self.storage.list_objects(prefix, bucket_name=self.bucket_name)]))
+                except Exception as e:
+                    results.append(e)
+        listed = {}
+        for prefix, result in zip(prefixes, results):
+            if isinstance(result, BaseException): # 1フォルダの失敗で他のフォルダの検索を止めない
+                print(f"写真フォルダの一覧の取得に失敗しました：{prefix}：{result}")
+                continue
+            listed[prefix] = result[1]
+            self.index.store(self.bucket_name, prefix, result[1])
+        return listed
+
+    # << 写真の検索 searches：[(フォルダのプレフィックス, 写真番号), ...]  戻り値：{(プレフィックス, 写真番号): [キー, ...]} >>
+    async def resolve_async(self, searches):
+        searches = list(dict.fromkeys(searches))
+        folders = {}
+        missing = []
+        for prefix in dict.fromkeys(prefix for prefix, _ in searches):
+            cached = self.index.cached_keys(self.bucket_name, prefix)
+            if cached is None:
+                missing.append(prefix)
+            else:
+                folders[prefix] = cached
+        if missing:
+            print(f"写真フォルダの一覧を取得：{len(missing)}フォルダ(同時に最大{self.concurrency}件)")
+            folders.update(await self._list_folders(missing))
+        return {(prefix, pattern): fnmatch.filter(folders.get(prefix, []), f"{prefix}*{pattern}.jpg") for prefix, pattern in searches}
+
+    # << 同期処理(ビュー・Celeryタスク)から呼び出す場合 >>
+    def resolve(self, searches):
+        if not searches:
+            return {}
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError: # イベントループが動いていないスレッドでは、そのまま実行
+            return asyncio.run(self.resolve_async(searches))
+        # イベントループが動いているスレッド(ASGIなど)では、別スレッドで実行
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(asyncio.run, self.resolve_async(searches)).result()
+
+# << 写真の検索(同期処理用) >>
+def resolve_photos(bucket_name, searches, concurrency=None):
+    return PhotoResolver(bucket_name, concurrency=concurrency).resolve(searches)
@@ -1,6 +1,7 @@
 from io import BytesIO
 from zipfile import ZipFile
-import requests
+
+from infra.storage import read_url
 
 
 def download_and_zip_images(image_files):
@@ -17,21 +18,20 @@ def download_and_zip_images(image_files):
         for index, image_file in enumerate(image_files):
             # ImageFieldFileオブジェクトからURLを取得
             if hasattr(image_file, 'url'):
-                url = image_file
+                url = image_file.url
             elif isinstance(image_file, str):
                 url = image_file
             else:
                 raise ValueError("Invalid type passed to the function. Expected a URL string or an ImageFieldFile object.")
 
-            # URLから画像を取得
-            response = requests.get(url)
-            response.raise_for_status()
+            # URLから画像を取得(ストレージの写真はstorage.pyから取得)
+            image_data = read_url(url)
 
             # インデックスを用いてファイル名に一意性を与える
             image_name = f"{index+1}.jpg"
 
             # 画像データをZIP内に追加
-            zip_file.writestr(image_name, response.content)
+            zip_file.writestr(image_name, image_data)
 
     zip_buffer.seek(0)  # ZIPファイルの先頭にポインターを戻す
     return zip_buffer
\ No newline at end of file
@@ -0,0 +1,85 @@
+from django.db import transaction
+
+from infra.coordinates import fill_coordinates
+from infra.models import BridgePicture
+from infra.natural_key import BRIDGE_PICTURE_KEY_FIELDS, natural_key_digest
+
+# << 損傷写真(BridgePicture)の1径間分の差分登録 >>
+# 径間の登録済みの写真を1回のクエリで読み込み、旗揚げのループではメモリ上で検索・追加・メモの変更を行う
+# ループの後に、追加・メモの変更・旗揚げがなくなった写真の削除を1回のトランザクションでまとめて反映する
+class BridgePictureReconciler:
+    # exclude_ids：反映と同じトランザクションで削除する予定の写真のid(登録済みとして扱わない)
+    def __init__(self, table, infra, article, span_number, exclude_ids=()):
+        self.table = table
+        self.infra = infra
+        self.article = article
+        self.span_number = span_number
+        self.pictures = list(BridgePicture.objects.filter(table=table, infra=infra, article=article, span_number=span_number)
+                             .exclude(id__in=exclude_ids).order_by('id'))
+        self.new_pictures = []
+        self.changed_pictures = {} # {id: BridgePicture}(メモを変更した登録済みの写真)
+        self.damage_pictures = {} # {(損傷座標x, 損傷座標y): [BridgePicture, ...]}(登録済み → 追加した順)
+        self.natural_keys = set()
+        self.skipped = 0
+        for picture in self.pictures:
+            self._index(picture)
+
+    # << データベースと同じ形に変換した値(数字の文字列の写真番号など) >>
+    @staticmethod
+    def _value(name, value):
+        return BridgePicture._meta.get_field(name).get_prep_value(value)
+
+    def _coordinate(self, damage_coordinate_x, damage_coordinate_y):
+        return (self._value('damage_coordinate_x', damage_coordinate_x), self._value('damage_coordinate_y', damage_coordinate_y))
+
+    def _index(self, picture):
+        self.damage_pictures.setdefault(self._coordinate(picture.damage_coordinate_x, picture.damage_coordinate_y), []).append(picture)
+        self.natural_keys.add(picture.natural_key)
+
+    # << 損傷座標が同じ写真(登録予定を含む) >>
+    def pictures_at(self, damage_coordinate_x, damage_coordinate_y):
+        return list(self.damage_pictures.get(self._coordinate(damage_coordinate_x, damage_coordinate_y), []))
+
+    # << 損傷座標・写真の座標と、写真番号(または写真)が一致する写真(ない場合はNone) >>
+    def find(self, damage_coordinate_x, damage_coordinate_y, picture_coordinate_x, picture_coordinate_y, **conditions):
+        wanted = {name: self._value(name, value) for name, value in
+                  dict(conditions, picture_coordinate_x=picture_coordinate_x, picture_coordinate_y=picture_coordinate_y).items()}
+        for picture in self.pictures_at(damage_coordinate_x, damage_coordinate_y):
+            if all(self._value(name, getattr(picture, name)) == value for name, value in wanted.items()):
+                return picture
+        return None
+
+    # << メモを変更した写真を記録(登録予定の写真はそのまま登録される) >>
+    def changed(self, picture):
+        if picture.pk is not None:
+            self.changed_pictures[picture.pk] = picture
+
+    # << 写真を追加(natural_keyが同じ写真が登録済み・登録予定の場合は追加しない) >>
+    # bulk_createではsave()が呼ばれないため、ここでnatural_keyと数値の座標を設定する
+    def add(self, picture):
+        picture.natural_key = natural_key_digest(picture, BRIDGE_PICTURE_KEY_FIELDS)
+        fill_coordinates(picture)
+        if picture.natural_key in self.natural_keys:
+            print("保存失敗(同じ写真が登録されています)")
+            self.skipped += 1
+            return False
+        self.new_pictures.append(picture)
+        self._index(picture)
+        return True
+
+    # << 追加・変更・削除をまとめて反映(旗揚げの損傷座標にない写真は削除) >>
+    # 戻り値：{'inserted': 追加した写真数, 'updated': メモを変更した写真数, 'deleted': 削除した写真数, 'skipped': 追加しなかった写真数}
+    def flush(self, items):
+        current = {self._coordinate(*(item.get('damage_coordinate') or [None, None])) for item in items}
+        deleted_ids = [picture.pk for picture in self.pictures
+                       if self._coordinate(picture.damage_coordinate_x, picture.damage_coordinate_y) not in current]
+        changed = [picture for picture_id, picture in self.changed_pictures.items() if picture_id not in set(deleted_ids)]
+        with transaction.atomic():
+            deleted = 0
+            for start in range(0, len(deleted_ids), 1000):
+                deleted += BridgePicture.objects.filter(id__in=deleted_ids[start:start + 1000]).delete()[0]
+            updated = BridgePicture.objects.bulk_update(changed, ['memo'], batch_size=500) if changed else 0
+            BridgePicture.objects.bulk_create(self.new_pictures, batch_size=500, ignore_conflicts=True)
+        result = {'inserted': len(self.new_pictures), 'updated': updated, 'deleted': deleted, 'skipped': self.skipped}
+        print(f"損傷写真の登録：{self.span_number}　{result['inserted']}件を追加、{updated}件のメモを変更、{deleted}件を削除、{self.skipped}件は追加しない")
+        return result
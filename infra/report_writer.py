@@ -0,0 +1,71 @@
+from django.db import transaction
+
+from infra.coordinates import CoordinateIndex, fill_coordinates
+from infra.models import FullReportData
+from infra.natural_key import FULL_REPORT_DATA_KEY_FIELDS, natural_key_digest
+
+# << 損傷写真帳(FullReportData)の1径間分の一括登録 >>
+# 旗揚げのループでは行をメモリ上に集めるだけにして、ループの後に1回のトランザクションでまとめて登録する
+# 一意にする項目(natural_key)が一致する行が登録済みの場合は上書きしない
+# (これまでの exists() → update_or_create() と同じく、画面で編集した内容を残すため、登録済みの行は更新しない)
+class FullReportDataWriter:
+    # exclude_ids：登録と同じトランザクションで削除する予定の行のid(登録済みとして扱わない)
+    def __init__(self, table, infra, article, span_number, exclude_ids=()):
+        self.table = table
+        self.infra = infra
+        self.article = article
+        self.span_number = span_number
+        self.rows = {} # {natural_key: FullReportData}(同じキーの行は最初の1行だけ登録)
+        self.pending_joins = {} # {(損傷座標x, 損傷座標y): join}(登録予定の行)
+        self.stored_joins = CoordinateIndex() # 損傷座標 → join(登録済みの行、id順)
+        self.skipped = 0
+        self.required_fields = [field for field in FullReportData._meta.concrete_fields
+                                if not field.null and not field.primary_key and field.name != 'natural_key']
+        # 登録済みの行のjoinは1回のクエリで読み込む(損傷座標ごとに検索しない)
+        for damage_x, damage_y, join in FullReportData.objects.filter(
+            table=table, infra=infra, article=article,
+        ).exclude(id__in=exclude_ids).order_by('id').values_list('damage_x', 'damage_y', 'join'):
+            self.stored_joins.add(damage_x, damage_y, join)
+
+    # << 登録する行を追加(update_fieldsはこの後に書き換えられる場合があるため複製する) >>
+    def add(self, update_fields):
+        row = FullReportData(**dict(update_fields))
+        if any(getattr(row, field.attname) is None for field in self.required_fields):
+            print("必須の項目が空白のため登録できません。")
+            self.skipped += 1
+            return
+        # bulk_createではsave()が呼ばれないため、ここでnatural_keyと数値の座標を設定する
+        row.natural_key = natural_key_digest(row, FULL_REPORT_DATA_KEY_FIELDS)
+        fill_coordinates(row)
+        if row.natural_key in self.rows:
+            print("データが既に存在しています。")
+            self.skipped += 1
+            return
+        self.rows[row.natural_key] = row
+        self.pending_joins.setdefault((row.damage_coordinate_x, row.damage_coordinate_y), row.join)
+
+    # << 損傷座標に登録済み(登録予定を含む)の行のjoin(写真のメモの作成用、ない場合は空白) >>
+    def first_join(self, damage_coordinate_x, damage_coordinate_y):
+        stored = self.stored_joins.near(damage_coordinate_x, damage_coordinate_y) # 損傷座標が誤差以内の行(id順)
+        return (stored[0] if stored else None) or self.pending_joins.get((damage_coordinate_x, damage_coordinate_y), "")
+
+    # << 集めた行をまとめて登録 >>
+    # 戻り値：{'inserted': 登録した行数, 'updated': 更新した行数(登録済みの行は更新しないため常に0), 'existing': 登録済みだった行数, 'skipped': 登録しなかった行数}
+    def flush(self):
+        rows = list(self.rows.values())
+        with transaction.atomic():
+            # 登録済みの行はこの一括登録のnatural_keyで確認する(件数の差分は他の処理の登録・削除の影響を受けるため使わない)
+            natural_keys = [row.natural_key for row in rows]
+            existing = 0
+            for start in range(0, len(natural_keys), 500):
+                existing += FullReportData.objects.filter(natural_key__in=natural_keys[start:start + 500]).count()
+            FullReportData.objects.bulk_create(rows, batch_size=500, ignore_conflicts=True)
+        inserted = len(rows) - existing
+        result = {'inserted': inserted, 'updated': 0, 'existing': existing, 'skipped': self.skipped}
+        print(f"損傷写真帳の登録：{self.span_number}　{inserted}件を登録、0件を更新、{existing}件は登録済み(更新しない)、{self.skipped}件は登録しない")
+        for row in rows: # 登録した行(登録済みだった行を含む)は、以降は登録済みとして扱う
+            self.stored_joins.add(row.damage_x, row.damage_y, row.join)
+        self.rows = {}
+        self.pending_joins = {}
+        self.skipped = 0
+        return result
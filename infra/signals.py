@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from infra.models import NameEntry
+from infra.flag_fingerprint import invalidate_flag_fingerprints
+from infra.name_replace import invalidate_name_replacer
+
+# << 名前とアルファベットが変更されたら、案件の置換処理を作り直す >>
+@receiver(post_save, sender=NameEntry)
+@receiver(post_delete, sender=NameEntry)
+def name_entry_changed(sender, instance, **kwargs):
+    # 案件を付け替えた場合に備えて、全案件分を破棄する(件数が少ないため作り直しは軽い)
+    invalidate_name_replacer()
+    # 写真の検索結果が変わるため、案件の旗揚げは次回すべて処理し直す
+    invalidate_flag_fingerprints(instance.article_id)
@@ -0,0 +1,436 @@
+import datetime
+import hashlib
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import unquote, urlsplit
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+import requests
+
+# << S3の「変更なし(304)」の応答かどうか(条件付き取得の正常な結果) >>
+def is_not_modified(error):
+    return isinstance(error, ClientError) and error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 304
+
+# << ストレージ(一覧・取得・HEAD・アップロード)の共通部分 >>
+# 実装：S3Storage(S3)、CachedS3Storage(S3 + ローカルのキャッシュ)、LocalStorage(ローカルのフォルダ)
+# 戻り値はすべてboto3のS3クライアントと同じ形({'Key', 'ETag', ...}・ClientError)にそろえる
+class Storage:
+    async_listing = False # aiobotocoreで一覧を取得できるかどうか(photo_resolver.py)
+
+    def __init__(self, bucket_name):
+        self.bucket_name = bucket_name
+        self.lock = threading.Lock()
+        self.latency = {} # {操作名: {'count': 回数, 'errors': 失敗回数, 'seconds': 合計秒数, 'max_seconds': 最大秒数}}
+
+    # << 操作ごとの所要時間を記録 >>
+    def record(self, operation, seconds, failed=False):
+        with self.lock:
+            counter = self.latency.setdefault(operation, {'count': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            counter['count'] += 1
+            counter['errors'] += int(failed)
+            counter['seconds'] += seconds
+            counter['max_seconds'] = max(counter['max_seconds'], seconds)
+
+    @contextmanager
+    def timed(self, operation):
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception as e:
+            failed = not is_not_modified(e)
+            raise
+        finally:
+            self.record(operation, time.perf_counter() - start, failed)
+
+    # << 操作ごとの回数と所要時間(平均は秒) >>
+    def stats(self):
+        with self.lock:
+            return {operation: dict(counter, average_seconds=counter['seconds'] / counter['count'] if counter['count'] else 0.0)
+                    for operation, counter in self.latency.items()}
+
+    def log_stats(self):
+        for operation, counter in sorted(self.stats().items()):
+            print(f"{type(self).__name__} {operation}：{counter['count']}回(失敗{counter['errors']}回)　"
+                  f"平均{counter['average_seconds'] * 1000:.1f}ms　最大{counter['max_seconds'] * 1000:.1f}ms")
+
+    # << プレフィックスの直下のフォルダ(末尾は「/」) >>
+    def list_folders(self, prefix, bucket_name=None):
+        folders = []
+        for obj in self.list_objects(prefix, bucket_name=bucket_name):
+            rest = obj['Key'][len(prefix):]
+            if "/" in rest:
+                folder = prefix + rest.split("/", 1)[0] + "/"
+                if folder not in folders:
+                    folders.append(folder)
+        return folders
+
+    # << オブジェクトのURLからキーを取得(このストレージのURLでなければNone) >>
+    def key_from_url(self, url):
+        return None
+
+    # << オブジェクトの内容をすべて読み込む >>
+    def read(self, key, bucket_name=None):
+        response = self.get_object(key, bucket_name=bucket_name)
+        try:
+            return response["Body"].read()
+        finally:
+            response["Body"].close()
+
+# << S3へのアクセスをまとめたゲートウェイ >>
+# boto3のクライアントはスレッドセーフのため、プロセスで1つだけ作成して全スレッドで共有する
+# (呼び出しごとにクライアントを作ると、認証情報の解決と接続の準備が毎回行われる)
+# fork後の子プロセス(Celeryのprefork・事前抽出のプロセスプール)では親の接続を使えないため作り直す
+class S3Storage(Storage):
+    async_listing = True
+
+    def __init__(self, bucket_name, region_name, max_pool_connections=32, max_attempts=5, connect_timeout=5, read_timeout=60):
+        super().__init__(bucket_name)
+        self.region_name = region_name
+        self.config = Config(
+            region_name=region_name,
+            max_pool_connections=max_pool_connections, # 写真フォルダの同時一覧取得(photo_resolver.py)より多くする
+            retries={"max_attempts": max_attempts, "mode": "adaptive"}, # スロットリング(503 SlowDown)時は間隔を空けて再試行
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            tcp_keepalive=True,
+        )
+        self._client = None
+        self._client_pid = None
+
+    # << プロセス共通のクライアント >>
+    @property
+    def client(self):
+        with self.lock:
+            if self._client is None or self._client_pid != os.getpid():
+                self._client = boto3.session.Session().client('s3', config=self.config)
+                self._client_pid = os.getpid()
+            return self._client
+
+    # << プレフィックスに一致する全オブジェクト(1000件を超える場合もすべて取得) >>
+    def list_objects(self, prefix, bucket_name=None, **kwargs):
+        objects = []
+        with self.timed('list_objects'):
+            paginate = self.client.get_paginator("list_objects_v2")
+            for page in paginate.paginate(Bucket=bucket_name or self.bucket_name, Prefix=prefix, **kwargs):
+                objects.extend(page.get('Contents', []))
+        return objects
+
+    def list_folders(self, prefix, bucket_name=None):
+        folders = []
+        with self.timed('list_folders'):
+            paginate = self.client.get_paginator("list_objects_v2")
+            for page in paginate.paginate(Bucket=bucket_name or self.bucket_name, Prefix=prefix, Delimiter="/"):
+                folders.extend(common_prefix['Prefix'] for common_prefix in page.get('CommonPrefixes', []))
+        return folders
+
+    def get_object(self, key, bucket_name=None, **kwargs):
+        with self.timed('get_object'):
+            return self.client.get_object(Bucket=bucket_name or self.bucket_name, Key=key, **kwargs)
+
+    def head_object(self, key, bucket_name=None, **kwargs):
+        with self.timed('head_object'):
+            return self.client.head_object(Bucket=bucket_name or self.bucket_name, Key=key, **kwargs)
+
+    def put_object(self, key, body, bucket_name=None, **kwargs):
+        with self.timed('put_object'):
+            return self.client.put_object(Bucket=bucket_name or self.bucket_name, Key=key, Body=body, **kwargs)
+
+    # << オブジェクトのURL(エンコード前) >>
+    def object_url(self, key, bucket_name=None):
+        return f"https://{bucket_name or self.bucket_name}.s3.{self.region_name}.amazonaws.com/{key}"
+
+    def key_from_url(self, url):
+        parts = urlsplit(url)
+        if parts.netloc in (f"{self.bucket_name}.s3.{self.region_name}.amazonaws.com", f"{self.bucket_name}.s3.amazonaws.com"):
+            return unquote(parts.path.lstrip("/"))
+        return None
+
+# << S3 + ローカルのキャッシュ >>
+# 一覧：list_ttl 秒の間はプロセス内に保持した結果を返す(最大 max_listings 件)
+# 取得：ダウンロードしたオブジェクトをETagと一緒に cache_dir に保存し、次回からは条件付き取得(304なら保存済みのファイル)
+#       保存済みのファイルの合計が max_disk_bytes を超えたら、最後に使ったのが古いものから削除
+class CachedS3Storage(S3Storage):
+    def __init__(self, bucket_name, region_name, cache_dir, list_ttl=60, max_listings=1024, max_disk_bytes=1024 * 1024 * 1024, **kwargs):
+        super().__init__(bucket_name, region_name, **kwargs)
+        self.cache_dir = Path(cache_dir)
+        self.list_ttl = list_ttl
+        self.max_listings = max_listings
+        self.max_disk_bytes = max_disk_bytes
+        self.listings = OrderedDict() # {(操作名, バケット, プレフィックス, 条件): (取得時刻, 結果)}(最近使った順)
+
+    def _cached_listing(self, operation, bucket_name, prefix, kwargs, fetch):
+        listing_key = (operation, bucket_name or self.bucket_name, prefix, tuple(sorted(kwargs.items())))
+        with self.lock:
+            cached = self.listings.get(listing_key)
+            if cached and time.monotonic() - cached[0] < self.list_ttl:
+                self.listings.move_to_end(listing_key)
+            else:
+                cached = None
+        if cached:
+            self.record(f'{operation}_cached', 0.0)
+            return cached[1]
+        result = fetch()
+        with self.lock:
+            self._remember_listing(listing_key, result)
+        return result
+
+    # << 一覧を保持(期限切れの一覧を破棄し、上限を超えた分は使っていない順に破棄) >>
+    def _remember_listing(self, listing_key, result):
+        now = time.monotonic()
+        for expired_key in [key for key, (fetched_at, _) in self.listings.items() if now - fetched_at >= self.list_ttl]:
+            del self.listings[expired_key]
+        self.listings[listing_key] = (now, result)
+        self.listings.move_to_end(listing_key)
+        while len(self.listings) > self.max_listings:
+            self.listings.popitem(last=False)
+
+    def list_objects(self, prefix, bucket_name=None, **kwargs):
+        return self._cached_listing('list_objects', bucket_name, prefix, kwargs,
+                                    lambda: super(CachedS3Storage, self).list_objects(prefix, bucket_name=bucket_name, **kwargs))
+
+    def list_folders(self, prefix, bucket_name=None):
+        return self._cached_listing('list_folders', bucket_name, prefix, {},
+                                    lambda: super(CachedS3Storage, self).list_folders(prefix, bucket_name=bucket_name))
+
+    def _cache_path(self, bucket_name, key):
+        key_hash = hashlib.sha256(f"{bucket_name}/{key}".encode("utf-8")).hexdigest()
+        return self.cache_dir / key_hash[:2] / key_hash
+
+    def get_object(self, key, bucket_name=None, **kwargs):
+        if kwargs: # 条件付き取得・範囲指定は呼び出し側に任せる(dxf_store.pyなど)
+            return super().get_object(key, bucket_name=bucket_name, **kwargs)
+        bucket_name = bucket_name or self.bucket_name
+        path = self._cache_path(bucket_name, key)
+        etag_path = path.with_suffix(".etag")
+        try:
+            cached_etag = etag_path.read_text(encoding="utf-8")
+        except OSError:
+            cached_etag = None
+        if cached_etag and path.exists():
+            try:
+                response = super().get_object(key, bucket_name=bucket_name, IfNoneMatch=f'"{cached_etag}"')
+            except ClientError as e:
+                if is_not_modified(e):
+                    os.utime(path) # 最終利用日時を更新(削除順の判定に使う)
+                    return local_object_response(path, f'"{cached_etag}"')
+                raise
+        else:
+            response = super().get_object(key, bucket_name=bucket_name)
+
+        # 一時ファイルに書き込み、完了後にキャッシュの場所へ移動(ETagは本体の後に書き込む)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response["Body"].iter_chunks(1024 * 1024):
+                    f.write(chunk)
+            os.replace(temp_path, path)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+        etag_path.write_text(response["ETag"].strip('"'), encoding="utf-8")
+        self._evict(keep=path)
+        return local_object_response(path, response["ETag"])
+
+    # << 保存済みのファイルの合計サイズが上限を超えた分を古い順に削除(dxf_cache.pyと同じ方法) >>
+    # keep：これから返すファイル(上限より大きい場合も削除しない)
+    def _evict(self, keep=None):
+        entries = []
+        for path in self.cache_dir.glob("*/*"):
+            if path.suffix: # ETag(.etag)と書き込み中の一時ファイル(.tmp)
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_disk_bytes:
+                break
+            if path == keep:
+                continue
+            path.with_suffix(".etag").unlink(missing_ok=True) # ETagを先に削除(ETagだけ残ると本体なしで304を使ってしまう)
+            path.unlink(missing_ok=True)
+            total_size -= size
+
+    def put_object(self, key, body, bucket_name=None, **kwargs):
+        response = super().put_object(key, body, bucket_name=bucket_name, **kwargs)
+        bucket_name = bucket_name or self.bucket_name
+        # アップロードしたキーを含む一覧と、保存済みのファイルを破棄
+        with self.lock:
+            for listing_key in [listing_key for listing_key in self.listings
+                                if listing_key[1] == bucket_name and key.startswith(listing_key[2])]:
+                del self.listings[listing_key]
+        self._cache_path(bucket_name, key).with_suffix(".etag").unlink(missing_ok=True)
+        return response
+
+# << ローカルファイルの内容(boto3のStreamingBodyと同じ読み方ができる) >>
+class LocalBody:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+
+    def read(self, amt=None):
+        return self.file.read() if amt is None else self.file.read(amt)
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        while chunk := self.file.read(chunk_size):
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# << ローカルファイルのETag(内容のハッシュではなく、更新時刻とサイズから作る) >>
+def local_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+def local_object_metadata(path, etag=None):
+    stat = path.stat()
+    return {
+        "ETag": etag or local_etag(stat),
+        "ContentLength": stat.st_size,
+        "LastModified": datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc),
+    }
+
+def local_object_response(path, etag=None):
+    return dict(local_object_metadata(path, etag), Body=LocalBody(path))
+
+# << ローカルのフォルダをS3の代わりに使うストレージ(オフラインでの確認・負荷試験用) >>
+# root/バケット名/キー の構成でファイルを置く(S3と同じ「案件名/橋名/…」のフォルダ構成)
+class LocalStorage(Storage):
+    def __init__(self, bucket_name, root, url_prefix="/local-storage/"):
+        super().__init__(bucket_name)
+        self.root = Path(root)
+        self.url_prefix = url_prefix
+
+    def _path(self, bucket_name, key):
+        bucket_root = (self.root / (bucket_name or self.bucket_name)).resolve()
+        path = (bucket_root / key).resolve()
+        if path != bucket_root and bucket_root not in path.parents: # 「../」でバケットの外を指定させない
+            raise ValueError(f"バケットの外のキーは指定できません：{key}")
+        return path
+
+    @staticmethod
+    def _missing(operation, key):
+        return ClientError({"Error": {"Code": "NoSuchKey", "Message": key}, "ResponseMetadata": {"HTTPStatusCode": 404}}, operation)
+
+    def list_objects(self, prefix, bucket_name=None, StartAfter=None, **kwargs):
+        with self.timed('list_objects'):
+            bucket_root = self._path(bucket_name, "")
+            # プレフィックスの最後の「/」までがフォルダ、それ以降はファイル名・フォルダ名の先頭部分
+            search_root = self._path(bucket_name, prefix.rsplit("/", 1)[0]) if "/" in prefix else bucket_root
+            objects = []
+            for directory, _, filenames in os.walk(search_root):
+                for filename in filenames:
+                    path = Path(directory) / filename
+                    key = path.relative_to(bucket_root).as_posix()
+                    if key.startswith(prefix) and not filename.endswith(".tmp"):
+                        objects.append(dict(local_object_metadata(path), Key=key, Size=path.stat().st_size))
+            objects.sort(key=lambda obj: obj['Key'].encode("utf-8")) # S3と同じくUTF-8のバイト順
+            if StartAfter:
+                objects = [obj for obj in objects if obj['Key'].encode("utf-8") > StartAfter.encode("utf-8")]
+        return objects
+
+    def get_object(self, key, bucket_name=None, IfNoneMatch=None, **kwargs):
+        with self.timed('get_object'):
+            path = self._path(bucket_name, key)
+            if not path.is_file():
+                raise self._missing("GetObject", key)
+            etag = local_etag(path.stat())
+            if IfNoneMatch and IfNoneMatch == etag: # 変更なし(S3と同じく304)
+                raise ClientError({"Error": {"Code": "304", "Message": "Not Modified"}, "ResponseMetadata": {"HTTPStatusCode": 304}}, "GetObject")
+            return local_object_response(path, etag)
+
+    def head_object(self, key, bucket_name=None, **kwargs):
+        with self.timed('head_object'):
+            path = self._path(bucket_name, key)
+            if not path.is_file():
+                raise self._missing("HeadObject", key)
+            return local_object_metadata(path)
+
+    def put_object(self, key, body, bucket_name=None, **kwargs):
+        with self.timed('put_object'):
+            path = self._path(bucket_name, key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(body if isinstance(body, bytes) else body.read())
+                os.replace(temp_path, path)
+            except BaseException:
+                Path(temp_path).unlink(missing_ok=True)
+                raise
+            return {"ETag": local_etag(path.stat())}
+
+    def object_url(self, key, bucket_name=None):
+        return f"{self.url_prefix}{bucket_name or self.bucket_name}/{key}"
+
+    def key_from_url(self, url):
+        path = unquote(urlsplit(url).path)
+        bucket_prefix = f"{self.url_prefix}{self.bucket_name}/"
+        return path[len(bucket_prefix):] if path.startswith(bucket_prefix) else None
+
+# << 設定(STORAGE_BACKEND)に合わせてストレージを作成 >>
+def create_storage(backend=None):
+    backend = backend or getattr(settings, "STORAGE_BACKEND", "s3")
+    bucket_name = getattr(settings, "S3_BUCKET_NAME", "infraprotect")
+    if backend == "local":
+        return LocalStorage(
+            bucket_name,
+            getattr(settings, "LOCAL_STORAGE_ROOT", Path(settings.BASE_DIR) / "local_storage"),
+            url_prefix=getattr(settings, "LOCAL_STORAGE_URL", "/local-storage/"),
+        )
+    s3_options = {
+        "max_pool_connections": getattr(settings, "S3_MAX_POOL_CONNECTIONS", 32),
+        "max_attempts": getattr(settings, "S3_MAX_ATTEMPTS", 5),
+    }
+    region_name = getattr(settings, "S3_REGION_NAME", "ap-northeast-1")
+    if backend == "cached_s3":
+        return CachedS3Storage(
+            bucket_name, region_name,
+            getattr(settings, "STORAGE_CACHE_DIR", Path(settings.BASE_DIR) / "storage_cache"),
+            list_ttl=getattr(settings, "STORAGE_LIST_TTL", 60),
+            max_listings=getattr(settings, "STORAGE_LIST_MAX_ENTRIES", 1024),
+            max_disk_bytes=getattr(settings, "STORAGE_CACHE_MAX_BYTES", 1024 * 1024 * 1024),
+            **s3_options,
+        )
+    if backend == "s3":
+        return S3Storage(bucket_name, region_name, **s3_options)
+    raise ValueError(f"STORAGE_BACKEND が不正です：{backend}(s3 / cached_s3 / local)")
+
+_storage = None
+_storage_lock = threading.Lock()
+
+# << プロセス共通のストレージを取得 >>
+def get_storage():
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage()
+        return _storage
+
+# << URLの写真などを取得(ストレージのURLはストレージから、それ以外はHTTPで取得) >>
+def read_url(url, timeout=30):
+    storage = get_storage()
+    key = storage.key_from_url(url)
+    if key is not None:
+        return storage.read(key)
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.content
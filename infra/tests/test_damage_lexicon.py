@@ -0,0 +1,20 @@
+from django.test import SimpleTestCase
+
+from infra.damage_lexicon import ParsedDamage, damage_label, damage_rank, parse_damage
+
+class ParseDamageTest(SimpleTestCase):
+    def test_parse_damage(self):
+        self.assertEqual(parse_damage('⑤防食機能の劣化(分類1)-e'), ParsedDamage(5, '防食機能の劣化', '分類1', 'e'))
+        self.assertEqual(parse_damage('㉑異常な音・振動'), ParsedDamage(21, '異常な音・振動', '', ''))
+        self.assertEqual(parse_damage('㉔土砂詰まり-e→a'), ParsedDamage(24, '土砂詰まり', '', 'e'))
+        self.assertIsNone(parse_damage('腐食'))
+        self.assertIsNone(parse_damage('NON'))
+
+    # bridge_tableで登録する excel_damage_name / excel_damage_lank と写真メモの損傷名
+    def test_label_and_rank(self):
+        self.assertEqual(damage_label('⑦剥離・鉄筋露出-c'), '剥離・鉄筋露出')
+        self.assertEqual(damage_label('⑰その他(分類6:異物混入)-e'), 'その他(分類6:異物混入)')
+        self.assertEqual(damage_rank('⑦剥離・鉄筋露出-c'), 'c')
+        self.assertIsNone(damage_rank('㉑異常な音・振動'))
+        self.assertIsNone(damage_label('剥離・鉄筋露出')) # 丸番号と判定を除いた後
+        self.assertIsNone(damage_rank('剥離・鉄筋露出'))
@@ -0,0 +1,46 @@
+import copy
+import json
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from infra.flag_parser import parse_flags
+
+# << 分離前のcreate_picturelist(tasks.py)で旗揚げを分解した結果 >>
+# 旗揚げごとに parts_name / damage_name / picture_number / format_four_number_picture を記録したもの
+# (コンマ区切りの部材、省略記号(～)、数字だけの部材、複数グループの旗揚げ、
+#  撮影日とイニシャルの引き継ぎ、写真番号の有無、実際の図面の径間)
+GOLDEN_PATH = Path(__file__).resolve().parent / 'fixtures' / 'flag_parser_golden.json'
+
+class FlagParserGoldenTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(GOLDEN_PATH, encoding='utf-8') as f:
+            cls.cases = json.load(f)
+
+    def test_parse_flags_reproduces_create_picturelist(self):
+        for case in self.cases:
+            with self.subTest(case=case['name']):
+                records = parse_flags(copy.deepcopy(case['flags']))
+                self.assertEqual(len(records), len(case['expected']))
+                for index, (record, expected) in enumerate(zip(records, case['expected'])):
+                    with self.subTest(case=case['name'], flag=index):
+                        self.assertEqual(record.parts_name, expected['parts_name'])
+                        self.assertEqual(record.damage_groups, expected['damage_name'])
+                        self.assertEqual(record.picture_number, expected['picture_number'])
+                        self.assertEqual(record.picture_patterns, expected['picture_patterns'])
+
+    # 写真指定の撮影日とイニシャルは、省略された場合に直前の旗揚げから引き継ぐ
+    def test_picture_initial_carries_over_between_flags(self):
+        case = next(case for case in self.cases if case['name'] == 'picture_carry_over')
+        records = parse_flags(copy.deepcopy(case['flags']))
+        self.assertEqual(records[1].picture_patterns, ['9月7日 S*/*0120', '9月7日 S*/*0121'])
+        self.assertEqual(records[2].picture_patterns, ['9月8日 T*/*0005', '9月8日 U*/*0006', '9月8日 U*/*0007'])
+
+    # 旗揚げの文字列(flags)は分解しても変更しない
+    def test_parse_flags_does_not_change_input(self):
+        case = self.cases[0]
+        flags = copy.deepcopy(case['flags'])
+        parse_flags(flags)
+        self.assertEqual(flags, case['flags'])
@@ -29,6 +29,7 @@ urlpatterns = [
     path('ajax-get-symbol/', views.get_symbol, name='ajax_get_symbol'),# 部材名と部材記号の紐付け（Ajax）
     # << 損傷写真帳 >>
     path('article/<int:article_pk>/infra/<int:pk>/bridge-table/', views.bridge_table, name='bridge-table'),# 損傷写真帳の作成
+    path('bridge-table/status/<str:task_id>/', views.picturelist_status, name='picturelist-status'),# 損傷写真帳のデータ作成の進捗
     path('article/<int:article_pk>/infra/<int:pk>/bridge-table/upload/', views.upload_picture, name='upload-picture'),# 写真の変更を管理サイトに反映
     #　<< 旗揚げの内容を編集 >>
     path('bridge_table_edit/<int:damage_pk>/<int:table_pk>/', views.edit_report_data, name='edit_report_data'), # 旗揚げの内容を受信
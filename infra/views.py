@@ -13,9 +13,10 @@ import re
 import tempfile
 import time
 from urllib.parse import unquote
-import boto3
+from botocore.exceptions import ClientError
+from celery.result import AsyncResult
 from django.conf import settings
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.db.models import Count
 from django.http import FileResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
@@ -32,9 +33,15 @@ from openpyxl.drawing.image import Image as OpenpyxlImage
 from PIL import Image as PILImage
 import requests
 
+from infra.coordinates import CoordinateIndex
+from infra.damage_lexicon import DAMAGE_CODES, DAMAGE_NAMES, damage_label, damage_rank
+from infra.flag_fingerprint import changed_flag_rows, prune_flag_rows, save_flag_fingerprints
 from infra.number_replace import process_inspection_data
 from infra.picture_download import download_and_zip_images
-from infra.tasks import create_picturelist
+from infra.picture_reconciler import BridgePictureReconciler
+from infra.report_writer import FullReportDataWriter
+from infra.storage import get_storage, read_url
+from infra.tasks import create_picturelist, create_picturelist_task
 
 from .forms import DamageCommentCauseEditForm, DamageCommentEditForm, DamageCommentJadgementEditForm, NameEntryForm, PartsNumberForm, TableForm
 from .models import Approach, Article, BridgePicture, DamageComment, DamageList, FullReportData, Infra, LoadGrade, LoadWeight, NameEntry, PartsName, PartsNumber, Regulation, Rulebook, Table, Thirdparty, UnderCondition
@@ -388,13 +395,10 @@ def number_view(request):
     print(result)
 
 def match_s3_objects_with_prefix(bucket_name, prefix, pattern):
-    s3 = boto3.client('s3')
     # プレフィックス(特定のフォルダ)を指定して、オブジェクトをリスト
-    response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-    if 'Contents' not in response:
-        return []
+    objects = get_storage().list_objects(prefix, bucket_name=bucket_name)
     # パターンに基づいてオブジェクトをフィルタリング
-    matched_keys = [obj['Key'] for obj in response['Contents'] if fnmatch.fnmatch(obj['Key'], pattern)]
+    matched_keys = [obj['Key'] for obj in objects if fnmatch.fnmatch(obj['Key'], pattern)]
     return matched_keys
 
 
@@ -410,10 +414,8 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
     infra = Infra.objects.filter(id=pk).first()
     table = Table.objects.filter(infra=pk).first()
     # << 案件名とファイル名を連結してdxfファイルのURLを取得する >>
-    # AWSクライアントを作成
-    s3 = boto3.client('s3')
-    
-    bucket_name = 'infraprotect'
+    # S3のバケットはゲートウェイ(storage.py)の設定から取得
+    bucket_name = get_storage().bucket_name
     print(bucket_name)
     folder_name = article.案件名+"/"
     print(folder_name)
@@ -429,9 +431,9 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
         print(f"該当オブジェクト：{matched_objects}")
         # 結果を表示
         for obj_key in matched_objects:
-            encode_dxf_filename = f"https://{bucket_name}.s3.ap-northeast-1.amazonaws.com/{obj_key}"
+            encode_dxf_filename = get_storage().object_url(obj_key)
     else:
-        encode_dxf_filename = f"https://{bucket_name}.s3.ap-northeast-1.amazonaws.com/{sub_obj_key}" # 「*」を含めない
+        encode_dxf_filename = get_storage().object_url(sub_obj_key) # 「*」を含めない
         print("ファイルが見つかりません")
     
     dxf_filename = urllib.parse.quote(encode_dxf_filename, safe='/:') # スラッシュとコロン以外をエンコード
@@ -449,9 +451,33 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
         search_title_text = request.GET["search_title_text"]# 検索URL内のsearch_title_textの値（1径間）を取得する
     else:
         search_title_text = "1径間" # 検索URLにsearch_title_textがない場合
-    sub_database_sorted_items = create_picturelist(request, table, dxf_filename, search_title_text, second_search_title_text) # tasks.py
+    if settings.PICTURELIST_ASYNC: # Celeryワーカーで作成し、完了するまで進捗画面を表示
+        task_id = request.GET.get("task_id")
+        if task_id and not known_picturelist_task(request, task_id): # 受け付けていない・結果の期限が切れたタスクは作成し直す
+            print(f"不明または期限切れのタスクのため作成し直します：{task_id}")
+            task_id = None
+        if task_id:
+            result = AsyncResult(task_id)
+        else:
+            result = create_picturelist_task.delay(table.id, search_title_text, second_search_title_text)
+            remember_picturelist_task(request, result.id)
+        if not result.ready():
+            return render(request, 'infra/bridge_table_progress.html', {'article_pk': article_pk, 'pk': pk, 'task_id': result.id, 'search_title_text': search_title_text})
+        if result.successful():
+            sub_database_sorted_items = result.get()
+        else: # タスクが失敗した場合はリクエスト内で作成し直す
+            print(f"損傷写真帳のデータ作成(タスク)に失敗しました：{result.result}")
+            sub_database_sorted_items = create_picturelist(request, table, dxf_filename, search_title_text, second_search_title_text) # tasks.py
+        # 結果は削除せず、CELERY_RESULT_EXPIRESで期限切れになるまで残す(同じURLの再読み込みで再利用する)
+    else:
+        sub_database_sorted_items = create_picturelist(request, table, dxf_filename, search_title_text, second_search_title_text) # tasks.py
     
     database_sorted_items = [{'search': search_title_text, **item} for item in sub_database_sorted_items]
+    # 前回から削除・変更された旗揚げの古いデータを集める(変更されていない旗揚げは登録し直さない)
+    # 登録済みのデータが削除されている旗揚げは、変更されていなくても登録し直す
+    # 削除はループの後に、登録・指紋の保存と同じトランザクションで行う
+    flag_table = table
+    stale_flag_rows = changed_flag_rows(flag_table, search_title_text, database_sorted_items)
 
     """辞書型の多重リストをデータベースに登録"""
     # << ['']を外してフラットにする >>
@@ -485,11 +511,31 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
         matches = re.findall(pattern, text)
         return matches
     
+    # << 旗揚げ1つで進める写真番号(picture_counter)の数(下の登録処理の分岐と同じ数え方) >>
+    def count_picture_numbers(split_names, damages, this_time_picture):
+        list_in_picture = this_time_picture.split(",")
+        picture_length = len([single_picture for single_picture in list_in_picture if single_picture])
+        multi_list = any(isinstance(i, list) for i in split_names) or any(isinstance(i, list) for i in damages)
+        if not multi_list and len(split_names) == 1: # 部材名が1つの場合
+            return len(damages) * picture_length
+        if not multi_list and len(split_names) >= 2: # 部材名が2つ以上の場合
+            if len(damages) == 1:
+                return len(split_names) * picture_length
+            return len(split_names) * len(damages) * picture_length if len(damages) >= 2 else 0
+        # 多重リストの場合(空白の写真も数える)
+        return sum(len(split_names[i]) * len(damages[i]) for i in range(len(split_names))) * len(list_in_picture)
+
     picture_counter = 1
     index_counter = 0
     picture_number_box = []
     
     print("database_sorted_itemsの解析開始")
+    # 損傷写真帳のデータは全旗揚げ分を集めてから、まとめて登録する(report_writer.py)
+    report_infra = Infra.objects.filter(id=pk).first()
+    report_table = Table.objects.filter(infra=report_infra.id, article=report_infra.article.id).first()
+    report_writer = FullReportDataWriter(report_table, report_infra, report_infra.article, search_title_text, exclude_ids=stale_flag_rows['report'])
+    # 損傷写真は径間の登録済みの写真を1回で読み込み、差分だけを反映する(picture_reconciler.py)
+    picture_reconciler = BridgePictureReconciler(report_table, report_infra, report_infra.article, search_title_text, exclude_ids=stale_flag_rows['picture'])
     create_picture_number = 1 # 写真番号-00の場合、コード側で1から順に番号を作成
     # print(f"旗揚げチェック　{database_sorted_items}")
     
@@ -654,10 +700,14 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
 
             result = parts_join + split_number  # 結果を組み立てる
             return result
-            # 共通のフィールドを辞書に格納
-        infra = Infra.objects.filter(id=pk).first()
-        article = infra.article
-        table = Table.objects.filter(infra=infra.id, article=article.id).first()
+        if damage_data.get('unchanged'): # 前回から変更されていない旗揚げは登録済み
+            # 写真番号は全旗揚げの通し番号のため、登録する場合と同じ数だけ進めてから飛ばす(全旗揚げを処理した場合と同じ番号にする)
+            picture_counter += count_picture_numbers(split_names, damages, this_time_picture)
+            continue
+            # 共通のフィールドを辞書に格納(旗揚げごとに検索せず、ループの前に取得したものを使う)
+        infra = report_infra
+        article = report_infra.article
+        table = report_table
         #print(table) # 旗揚げチェック：お試し（infra/table/dxf/121_2径間番号違い.dxf）
         
         start2 = time.time()
@@ -706,8 +756,8 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                         'special_links': '/'.join([str(parts_split), str(damage_name), str(span_number)]),
                         'excel_parts_name': print(parts_name[:parts_name.find(" ")]),
                         'excel_parts_number': four_numbers,
-                        'excel_damage_name': damage_name[1:-2] if len(damage_name) > 3 else None,
-                        'excel_damage_lank': damage_name[-1] if damage_name[-2] == "-" else None,
+                        'excel_damage_name': damage_label(damage_name),
+                        'excel_damage_lank': damage_rank(damage_name),
                         'infra': infra,
                         'article': article,
                         'table': table
@@ -738,21 +788,19 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                                     print(f"保存後：{current_picture_number}")
                                     #print("---------")
                                     if current_picture_number is None: # 写真がない
-                                        join_picture_damage_name = BridgePicture.objects.filter(damage_coordinate_x=damage_coordinate_x, damage_coordinate_y=damage_coordinate_y, table=table, infra=infra, article=article)
+                                        join_picture_damage_name = picture_reconciler.pictures_at(damage_coordinate_x, damage_coordinate_y) # 損傷座標が同じ写真(登録予定を含む)
                                         # print(f"join_picture_damage_name：{join_picture_damage_name}")
-                                        if join_picture_damage_name.first():
+                                        if join_picture_damage_name:
                                             for picture in join_picture_damage_name:
                                                 #print(picture)
                                                 if picture.damage_name:
                                                     # print(f"損傷名：{picture.damage_name}") # 損傷名
                                                     edited_result_parts_name = re.sub(pattern, remove_alphabets, parts_split)
-                                                    new_damage_name = re.sub(r'^[\u2460-\u2473\u3251-\u3256]', '', damage_name)
-                                                    # 末尾のハイフン+任意の1文字を削除
-                                                    damage_name = re.sub(r'-.{1}$', '', new_damage_name)
+                                                    damage_name = damage_label(damage_name) or damage_name # 丸番号と判定を除いた損傷名
                                                     picture.memo = f"{picture.memo} / {parts_split},{damage_name}"
                                                 else:
                                                     picture.memo = f"{parts_split},{damage_name}"
-                                                picture.save()
+                                                picture_reconciler.changed(picture) # メモの変更はループの後にまとめて反映
                                             #print(join_picture_damage_name)
                                         #print("picture_number_boxのインデックスが範囲外です")
                                         continue
@@ -763,33 +811,17 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                                         # マッチした文字列からアルファベット部分を削除
                                         return re.sub(r'[A-Za-z]+', '', match.group())
                                             
-                                    joined_picture_damage_name = FullReportData.objects.filter(damage_coordinate_x=damage_coordinate_x, damage_coordinate_y=damage_coordinate_y, table=table, infra=infra, article=article)
-                                    #print(f"joined_picture_damage_name：{joined_picture_damage_name}")
-                                    
-                                    loop_change = True
-                                    full_damaged_name = ""
-                                    for full_damaged_name in joined_picture_damage_name:
-                                        if loop_change:
-                                            # print(full_damaged_name)
-                                            full_damaged_name = full_damaged_name.join
-                                            loop_change = False
+                                    # 同じ損傷座標に登録済み(登録予定を含む)の行のjoin
+                                    full_damaged_name = report_writer.first_join(damage_coordinate_x, damage_coordinate_y)
                                             
                                     # re.subでパターンにマッチする部分を編集
                                     edited_result_parts_name = re.sub(pattern, remove_alphabets, parts_split)
-                                    new_damage_name = re.sub(r'^[\u2460-\u2473\u3251-\u3256]', '', damage_name)
-                                    damage_name = re.sub(r'-.{1}$', '', new_damage_name)
+                                    damage_name = damage_label(damage_name) or damage_name # 丸番号と判定を除いた損傷名
                                     # 写真の重複チェック(写真番号が同じ、損傷座標・def座標が同じ、径間番号・dxfファイル名・案件名・橋梁名が同じ)
-                                    existing_picture = BridgePicture.objects.filter(
+                                    existing_picture = picture_reconciler.find(
+                                        damage_coordinate_x, damage_coordinate_y, picture_coordinate_x, picture_coordinate_y,
                                         picture_number=current_picture_number,
-                                        damage_coordinate_x=damage_coordinate_x,
-                                        damage_coordinate_y=damage_coordinate_y,
-                                        picture_coordinate_x=picture_coordinate_x,
-                                        picture_coordinate_y=picture_coordinate_y,
-                                        span_number=span_number,
-                                        table=table,
-                                        article=article,
-                                        infra=infra
-                                    ).first()
+                                    )
                                     
                                     if existing_picture is None:
                                         bridge_picture = BridgePicture(
@@ -808,7 +840,7 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                                             article=article,
                                             infra=infra
                                         )
-                                        bridge_picture.save()
+                                        picture_reconciler.add(bridge_picture) # 追加はループの後にまとめて反映
                                         picture_number_index += 1
                                 except FileNotFoundError:
                                     print(f"ファイルが見つかりません: {absolute_image_path}")
@@ -816,15 +848,7 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                     else:
                         update_fields['picture_number'] = ""
                     
-                report_data_exists = FullReportData.objects.filter(**update_fields).exists()
-                if report_data_exists:
-                    print("データが存在しています。")
-                else:
-                    try:
-                        damage_obj, created = FullReportData.objects.update_or_create(**update_fields)
-                        damage_obj.save()
-                    except IntegrityError:
-                        print("ユニーク制約に違反しています。")
+                report_writer.add(update_fields) # 登録する行を追加(登録は全旗揚げの処理後にまとめて行う)
                     
                     
         elif not split_items_table and not damages_items_table and name_length >= 2: # 部材名が2つ以上の場合
@@ -862,8 +886,8 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                             'special_links': '/'.join([str(parts_split), str(damage_name), str(span_number)]),
                             'excel_parts_name': print(parts_name[:parts_name.find(" ")]),
                             'excel_parts_number': four_numbers,
-                            'excel_damage_name': damage_name[1:-2] if len(damage_name) > 3 else None,
-                            'excel_damage_lank': damage_name[-1] if damage_name[-1] == "-" else None,
+                            'excel_damage_name': damage_label(damage_name),
+                            'excel_damage_lank': damage_rank(damage_name),
                             'infra': infra,
                             'article': article,
                             'table': table
@@ -894,21 +918,19 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                                         print(f"保存後：{current_picture_number}")
                                         #print("---------")
                                         if current_picture_number is None: # 写真がない
-                                            join_picture_damage_name = BridgePicture.objects.filter(damage_coordinate_x=damage_coordinate_x, damage_coordinate_y=damage_coordinate_y, table=table, infra=infra, article=article)
+                                            join_picture_damage_name = picture_reconciler.pictures_at(damage_coordinate_x, damage_coordinate_y) # 損傷座標が同じ写真(登録予定を含む)
                                             
                                             # print(f"join_picture_damage_name：{join_picture_damage_name}")
-                                            if join_picture_damage_name.first():
+                                            if join_picture_damage_name:
                                                 for picture in join_picture_damage_name:
                                                     if picture.damage_name:
                                                         # print(f"損傷名：{picture.damage_name}") # 損傷名
                                                         edited_result_parts_name = re.sub(pattern, remove_alphabets, parts_split)
-                                                        new_damage_name = re.sub(r'^[\u2460-\u2473\u3251-\u3256]', '', damage_name)
-                                                        # 末尾のハイフン+任意の1文字を削除
-                                                        damage_name = re.sub(r'-.{1}$', '', new_damage_name)
+                                                        damage_name = damage_label(damage_name) or damage_name # 丸番号と判定を除いた損傷名
                                                         picture.memo = f"{picture.memo} / {parts_split},{damage_name}"
                                                     else:
                                                         picture.memo = f"{parts_split},{damage_name}"
-                                                    picture.save()
+                                                    picture_reconciler.changed(picture) # メモの変更はループの後にまとめて反映
                                                 #print(join_picture_damage_name)
                                             #print("picture_number_boxのインデックスが範囲外です")
                                             continue
@@ -919,32 +941,16 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                                             # マッチした文字列からアルファベット部分を削除
                                             return re.sub(r'[A-Za-z]+', '', match.group())
                                             
-                                        joined_picture_damage_name = FullReportData.objects.filter(damage_coordinate_x=damage_coordinate_x, damage_coordinate_y=damage_coordinate_y, table=table, infra=infra, article=article)
-                                        # print(f"joined_picture_damage_name：{joined_picture_damage_name}")
-                                        
-                                        loop_change = True
-                                        full_damaged_name = ""
-                                        for full_damaged_name in joined_picture_damage_name:
-                                            if loop_change:
-                                                # print(f"full_damaged_name(views.py)　{full_damaged_name}")
-                                                full_damaged_name = full_damaged_name.join
-                                                loop_change = False
+                                        # 同じ損傷座標に登録済み(登録予定を含む)の行のjoin
+                                        full_damaged_name = report_writer.first_join(damage_coordinate_x, damage_coordinate_y)
                                                 
                                         # re.subでパターンにマッチする部分を編集
                                         edited_result_parts_name = re.sub(pattern, remove_alphabets, parts_split)
-                                        new_damage_name = re.sub(r'^[\u2460-\u2473\u3251-\u3256]', '', damage_name)
-                                        damage_name = re.sub(r'-.{1}$', '', new_damage_name)
-                                        existing_picture = BridgePicture.objects.filter(
+                                        damage_name = damage_label(damage_name) or damage_name # 丸番号と判定を除いた損傷名
+                                        existing_picture = picture_reconciler.find(
+                                            damage_coordinate_x, damage_coordinate_y, picture_coordinate_x, picture_coordinate_y,
                                             picture_number=current_picture_number,
-                                            damage_coordinate_x=damage_coordinate_x,
-                                            damage_coordinate_y=damage_coordinate_y,
-                                            picture_coordinate_x=picture_coordinate_x,
-                                            picture_coordinate_y=picture_coordinate_y,
-                                            span_number=span_number,
-                                            table=table,
-                                            article=article,
-                                            infra=infra
-                                        ).first()
+                                        )
                                         
                                         if existing_picture is None:
                                             bridge_picture = BridgePicture(
@@ -963,7 +969,7 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                                                 article=article,
                                                 infra=infra
                                             )
-                                            bridge_picture.save()
+                                            picture_reconciler.add(bridge_picture) # 追加はループの後にまとめて反映
                                             picture_number_index += 1
                                     except FileNotFoundError:
                                         print(f"ファイルが見つかりません: {absolute_image_path}")
@@ -971,15 +977,7 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                         else:
                             update_fields['picture_number'] = ""
                     
-                    report_data_exists = FullReportData.objects.filter(**update_fields).exists()
-                    if report_data_exists:
-                        print("データが存在しています。")
-                    else:
-                        try:
-                            damage_obj, created = FullReportData.objects.update_or_create(**update_fields)
-                            damage_obj.save()
-                        except IntegrityError:
-                            print("ユニーク制約に違反しています。")
+                    report_writer.add(update_fields) # 登録する行を追加(登録は全旗揚げの処理後にまとめて行う)
                         
             elif not split_items_table and not damages_items_table and damage_length >= 2: # かつ損傷名が2つ以上の場合
                 picture_number_index = 0
@@ -1017,8 +1015,8 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                                 'special_links': '/'.join([str(parts_split), str(damage_name), str(span_number)]),
                                 'excel_parts_name': print(parts_name[:parts_name.find(" ")]),
                                 'excel_parts_number': four_numbers,
-                                'excel_damage_name': damage_name[1:-2] if len(damage_name) > 3 else None,
-                                'excel_damage_lank': damage_name[-1] if damage_name[-1] == "-" else None,
+                                'excel_damage_name': damage_label(damage_name),
+                                'excel_damage_lank': damage_rank(damage_name),
                                 'infra': infra,
                                 'article': article,
                                 'table': table
@@ -1049,22 +1047,20 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                                             print(f"保存後：{current_picture_number}")
                                             # print("---------")
                                             if current_picture_number is None: # 写真がない
-                                                join_picture_damage_name = BridgePicture.objects.filter(damage_coordinate_x=damage_coordinate_x, damage_coordinate_y=damage_coordinate_y, table=table, infra=infra, article=article)
+                                                join_picture_damage_name = picture_reconciler.pictures_at(damage_coordinate_x, damage_coordinate_y) # 損傷座標が同じ写真(登録予定を含む)
                                                 # print(f"join_picture_damage_name：{join_picture_damage_name}")
                                                     
-                                                if join_picture_damage_name.first():
+                                                if join_picture_damage_name:
                                                     for picture in join_picture_damage_name:
                                                         #print(picture)
                                                         if picture.damage_name:
                                                             # print(f"損傷名：{picture.damage_name}") # 損傷名
                                                             edited_result_parts_name = re.sub(pattern, remove_alphabets, parts_split)
-                                                            new_damage_name = re.sub(r'^[\u2460-\u2473\u3251-\u3256]', '', damage_name)
-                                                            # 末尾のハイフン+任意の1文字を削除
-                                                            damage_name = re.sub(r'-.{1}$', '', new_damage_name)
+                                                            damage_name = damage_label(damage_name) or damage_name # 丸番号と判定を除いた損傷名
                                                             picture.memo = f"{picture.memo} / {parts_split},{damage_name}"
                                                         else:
                                                             picture.memo = f"{parts_split},{damage_name}"
-                                                        picture.save()
+                                                        picture_reconciler.changed(picture) # メモの変更はループの後にまとめて反映
                                                     
                                                 #print("picture_number_boxのインデックスが範囲外です")
                                                 continue
@@ -1075,32 +1071,16 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                                                 # マッチした文字列からアルファベット部分を削除
                                                 return re.sub(r'[A-Za-z]+', '', match.group())
                                             
-                                            joined_picture_damage_name = FullReportData.objects.filter(damage_coordinate_x=damage_coordinate_x, damage_coordinate_y=damage_coordinate_y, table=table, infra=infra, article=article)
-                                            # print(f"joined_picture_damage_name：{joined_picture_damage_name}")
-                                            
-                                            loop_change = True
-                                            full_damaged_name = ""
-                                            for full_damaged_name in joined_picture_damage_name:
-                                                if loop_change:
-                                                    # print(f"full_damaged_name(views.py)　{full_damaged_name}")
-                                                    full_damaged_name = full_damaged_name.join
-                                                    loop_change = False
+                                            # 同じ損傷座標に登録済み(登録予定を含む)の行のjoin
+                                            full_damaged_name = report_writer.first_join(damage_coordinate_x, damage_coordinate_y)
                                                     
                                             # re.subでパターンにマッチする部分を編集
                                             edited_result_parts_name = re.sub(pattern, remove_alphabets, parts_split)
-                                            new_damage_name = re.sub(r'^[\u2460-\u2473\u3251-\u3256]', '', damage_name)
-                                            damage_name = re.sub(r'-.{1}$', '', new_damage_name)
-                                            existing_picture = BridgePicture.objects.filter(
+                                            damage_name = damage_label(damage_name) or damage_name # 丸番号と判定を除いた損傷名
+                                            existing_picture = picture_reconciler.find(
+                                                damage_coordinate_x, damage_coordinate_y, picture_coordinate_x, picture_coordinate_y,
                                                 picture_number=current_picture_number,
-                                                damage_coordinate_x=damage_coordinate_x,
-                                                damage_coordinate_y=damage_coordinate_y,
-                                                picture_coordinate_x=picture_coordinate_x,
-                                                picture_coordinate_y=picture_coordinate_y,
-                                                span_number=span_number,
-                                                table=table,
-                                                article=article,
-                                                infra=infra
-                                            ).first()
+                                            )
                                             
                                             if existing_picture is None:
                                                 bridge_picture = BridgePicture(
@@ -1119,7 +1099,7 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                                                     article=article,
                                                     infra=infra
                                                 )
-                                                bridge_picture.save()
+                                                picture_reconciler.add(bridge_picture) # 追加はループの後にまとめて反映
                                                 picture_number_index += 1
                                         except FileNotFoundError:
                                             print(f"ファイルが見つかりません: {absolute_image_path}")
@@ -1127,15 +1107,7 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                             else:
                                 update_fields['picture_number'] = ""
                             
-                        report_data_exists = FullReportData.objects.filter(**update_fields).exists()
-                        if report_data_exists:
-                            print("データが存在しています。")
-                        else:
-                            try:
-                                damage_obj, created = FullReportData.objects.update_or_create(**update_fields)
-                                damage_obj.save()
-                            except IntegrityError:
-                                print("ユニーク制約に違反しています。")
+                        report_writer.add(update_fields) # 登録する行を追加(登録は全旗揚げの処理後にまとめて行う)
                                  
         else: # 多重リストの場合
             picture_number_index = 0
@@ -1180,8 +1152,8 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                             'special_links': '/'.join([str(parts_split), str(original_damage_name), str(span_number)]),
                             'excel_parts_name': print(parts_name[:parts_name.find(" ")]),
                             'excel_parts_number': four_numbers,
-                            'excel_damage_name': str(original_damage_name)[1:-2] if len(str(original_damage_name)) > 3 else None,
-                            'excel_damage_lank': str(original_damage_name)[-1] if str(original_damage_name)[-1] == "-" else None,
+                            'excel_damage_name': damage_label(original_damage_name),
+                            'excel_damage_lank': damage_rank(original_damage_name),
                             'infra': infra,
                             'article': article,
                             'table': table
@@ -1189,15 +1161,7 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                         # print(f"update_fields_4：{update_fields}")
                         
                         # この部分で今生成したupdate_fieldsでデータを保存または更新します
-                        report_data_exists = FullReportData.objects.filter(**update_fields).exists()
-                        if report_data_exists:
-                            print("データが既に存在しています。")
-                        else:
-                            try:
-                                damage_obj, created = FullReportData.objects.update_or_create(**update_fields)
-                                damage_obj.save()
-                            except IntegrityError:
-                                print("ユニーク制約に違反しています。")
+                        report_writer.add(update_fields) # 登録する行を追加(登録は全旗揚げの処理後にまとめて行う)
                         
                         if list_in_picture:# single_picture:
                             for single_picture in list_in_picture:
@@ -1239,21 +1203,19 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                                                 print(f"保存後：{current_picture_number}")
                                                 #print("---------")
                                                 if current_picture_number is None: # 写真がない
-                                                    join_picture_damage_name = BridgePicture.objects.filter(damage_coordinate_x=damage_coordinate_x, damage_coordinate_y=damage_coordinate_y, table=table, infra=infra, article=article)
+                                                    join_picture_damage_name = picture_reconciler.pictures_at(damage_coordinate_x, damage_coordinate_y) # 損傷座標が同じ写真(登録予定を含む)
                                                     # print(f"join_picture_damage_name：{join_picture_damage_name}")
-                                                    if join_picture_damage_name.first():
+                                                    if join_picture_damage_name:
                                                         for picture in join_picture_damage_name:
                                                             # print(picture)
                                                             if picture.damage_name:
                                                                 # print(f"損傷名：{picture.damage_name}") # 損傷名
                                                                 edited_result_parts_name = re.sub(pattern, remove_alphabets, parts_split)
-                                                                new_damage_name = re.sub(r'^[\u2460-\u2473\u3251-\u3256]', '', original_damage_name)
-                                                                # 末尾のハイフン+任意の1文字を削除
-                                                                damage_name = re.sub(r'-.{1}$', '', new_damage_name)
+                                                                damage_name = damage_label(original_damage_name) or original_damage_name # 丸番号と判定を除いた損傷名
                                                                 picture.memo = f"{picture.memo} / {parts_split},{damage_name}"
                                                             else:
                                                                 picture.memo = f"{parts_split},{damage_name}"
-                                                            picture.save()
+                                                            picture_reconciler.changed(picture) # メモの変更はループの後にまとめて反映
                                                         #print(join_picture_damage_name)
                                                     #print("picture_number_boxのインデックスが範囲外です")
                                                     continue
@@ -1263,81 +1225,35 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                                                 def remove_alphabets(match):
                                                     # マッチした文字列からアルファベット部分を削除
                                                     return re.sub(r'[A-Za-z]+', '', match.group())
-                                                joined_picture_damage_name = FullReportData.objects.filter(damage_coordinate_x=damage_coordinate_x, damage_coordinate_y=damage_coordinate_y, table=table, infra=infra, article=article)
-                                                #print(f"joined_picture_damage_name：{joined_picture_damage_name.first()}")
-                                                
-                                                loop_change = True
-                                                full_damaged_name = ""
-                                                for full_damaged_name in joined_picture_damage_name:
-                                                    if loop_change:
-                                                        # print(full_damaged_name)
-                                                        full_damaged_name = full_damaged_name.join
-                                                        loop_change = False
+                                                # 同じ損傷座標に登録済み(登録予定を含む)の行のjoin
+                                                full_damaged_name = report_writer.first_join(damage_coordinate_x, damage_coordinate_y)
 
                                                 # re.subでパターンにマッチする部分を編集
                                                 edited_result_parts_name = re.sub(pattern, remove_alphabets, parts_split)
                                                 # print(f"original_damage_name:{original_damage_name}")
-                                                new_damage_name = re.sub(r'^[\u2460-\u2473\u3251-\u3256]', '', original_damage_name)
-                                                # print(f"new_damage_name：{new_damage_name}")
-                                                # damage_name = re.sub(r'-.{1}$', '', new_damage_name)
-                                                # print(damage_name)
-                                                existing_picture = BridgePicture.objects.filter(
+                                                existing_picture = picture_reconciler.find(
+                                                    damage_coordinate_x, damage_coordinate_y, picture_coordinate_x, picture_coordinate_y,
                                                     image=absolute_image_path,
-                                                    # picture_number=current_picture_number,
-                                                    damage_coordinate_x=damage_coordinate_x,
-                                                    damage_coordinate_y=damage_coordinate_y,
-                                                    picture_coordinate_x=picture_coordinate_x,
-                                                    picture_coordinate_y=picture_coordinate_y,
-                                                    span_number=span_number,
-                                                    table=table,
-                                                    article=article,
-                                                    infra=infra
-                                                ).first()
+                                                )
                                                 
                                                 if existing_picture is None:
-                                                    try:
-                                                        bridge_picture = BridgePicture(
-                                                            image=absolute_image_path, 
-                                                            picture_number=current_picture_number,
-                                                            picture_count=damage_data.get('this_time_picture', ''),
-                                                            damage_name=original_damage_name,
-                                                            parts_split=edited_result_parts_name,
-                                                            memo=process_inspection_data(full_damaged_name),
-                                                            damage_coordinate_x=damage_coordinate_x,
-                                                            damage_coordinate_y=damage_coordinate_y,
-                                                            picture_coordinate_x=picture_coordinate_x,
-                                                            picture_coordinate_y=picture_coordinate_y,
-                                                            span_number=span_number,
-                                                            table=table,
-                                                            article=article,
-                                                            infra=infra
-                                                        )
-                                                        bridge_picture.save()
-                                                    except:
-                                                        # index = images.index(absolute_image_path)
-                                                        # if index +1 >= len(images):
-                                                        #     index = len(images) -1
-                                                        bridge_picture = BridgePicture(
-                                                            image=absolute_image_path, # images[index], 
-                                                            picture_number=current_picture_number,
-                                                            picture_count=damage_data.get('this_time_picture', ''),
-                                                            damage_name=original_damage_name,
-                                                            parts_split=edited_result_parts_name,
-                                                            memo=process_inspection_data(full_damaged_name),
-                                                            damage_coordinate_x=damage_coordinate_x,
-                                                            damage_coordinate_y=damage_coordinate_y,
-                                                            picture_coordinate_x=picture_coordinate_x,
-                                                            picture_coordinate_y=picture_coordinate_y,
-                                                            span_number=span_number,
-                                                            table=table,
-                                                            article=article,
-                                                            infra=infra
-                                                        )
-                                                        # print(f"image：{images[index]}")
-                                                        try:
-                                                            bridge_picture.save()
-                                                        except:
-                                                            print("保存失敗")
+                                                    bridge_picture = BridgePicture(
+                                                        image=absolute_image_path, 
+                                                        picture_number=current_picture_number,
+                                                        picture_count=damage_data.get('this_time_picture', ''),
+                                                        damage_name=original_damage_name,
+                                                        parts_split=edited_result_parts_name,
+                                                        memo=process_inspection_data(full_damaged_name),
+                                                        damage_coordinate_x=damage_coordinate_x,
+                                                        damage_coordinate_y=damage_coordinate_y,
+                                                        picture_coordinate_x=picture_coordinate_x,
+                                                        picture_coordinate_y=picture_coordinate_y,
+                                                        span_number=span_number,
+                                                        table=table,
+                                                        article=article,
+                                                        infra=infra
+                                                    )
+                                                    picture_reconciler.add(bridge_picture) # 同じ写真が登録済みの場合は追加しない
                                                     # print(f"bridge_picture：{bridge_picture}")
                                                     picture_number_index += 1
                                             except FileNotFoundError:
@@ -1347,16 +1263,14 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
                         else:
                             update_fields['picture_number'] = ""
                         # 「for single_picture in list_in_picture」のコメントアウトで↑までを左にインデックス移動
-                        report_data_exists = FullReportData.objects.filter(**update_fields).exists()
-                        if report_data_exists:
-                            print("データが存在しています。")
-                        else:
-                            try:
-                                damage_obj, created = FullReportData.objects.update_or_create(**update_fields)
-                                damage_obj.save()
-                            except IntegrityError:
-                                print("ユニーク制約に違反しています。")
+                        report_writer.add(update_fields) # 登録する行を追加(登録は全旗揚げの処理後にまとめて行う)
         print("管理サイトの登録までかかった時間_time2: ", time.time() - start2 )
+    # 古いデータの削除・登録・指紋の保存を1回のトランザクションで行う(途中で失敗した場合は全て元に戻る)
+    with transaction.atomic():
+        prune_flag_rows(search_title_text, stale_flag_rows) # 削除・変更された旗揚げの古いデータを削除
+        report_writer.flush() # 全旗揚げ分の損傷写真帳のデータを登録
+        picture_reconciler.flush(database_sorted_items) # 損傷写真の追加・メモの変更・削除を反映
+        save_flag_fingerprints(flag_table, search_title_text, database_sorted_items) # 次回の差分の判定用に旗揚げの指紋を保存
                 
     """辞書型の多重リストをデータベースに登録(ここまで)"""
 
@@ -1389,21 +1303,21 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
     article_pk = infra.article.id
     print(f"案件番号:{article_pk}") # 案件番号:1
     
+    # 径間の写真を1回のクエリで取得し、写真の座標(誤差以内で一致)・径間・図面で索引を作成
+    span_pictures = CoordinateIndex()
+    for picture in BridgePicture.objects.filter(infra=pk, span_number=search_title_text).order_by('id'):
+        span_pictures.add(picture.picture_x, picture.picture_y, picture,
+                          group=(picture.span_number, picture.table_id, picture.infra_id, picture.article_id))
+
     picture_data = [] # ここで毎回初期化されます
     for data in bridges:
-        # クエリセットでフィルタリング
-        matches = BridgePicture.objects.filter(
-            picture_coordinate_x=data.picture_coordinate_x,
-            picture_coordinate_y=data.picture_coordinate_y,
-            span_number=data.span_number,
-            table=data.table,
-            infra=data.infra,
-            article=data.article
-        ).distinct()
+        # 索引から写真の座標が一致する写真を取得
+        matches = span_pictures.near(data.picture_x, data.picture_y,
+                                     group=(data.span_number, data.table_id, data.infra_id, data.article_id))
         # picture_data.append({"full_report": data, "matches": matches})
         # matches の各要素に対して個別に処理
 
-        # matches に QuerySet を含めるために新たに作成
+        # matches の写真番号・写真から作成
         match_details = [
             {"id": match.picture_number, "other_field": match.image}
             for match in matches
@@ -1416,7 +1330,7 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
     # matchesのキーに基づき、picturesを交互に選択してユニークに
     matches_seen = {}
     for entry in picture_data:
-        matches_key = tuple(entry['matches'].values_list('id', flat=True))
+        matches_key = tuple(match.id for match in entry['matches'])
         if matches_key not in matches_seen:
             matches_seen[matches_key] = 0
         
@@ -1434,9 +1348,37 @@ def bridge_table(request, article_pk, pk): # idの紐付け infra/bridge_table.h
     # print("損傷写真帳の表示までかかった時間_time1: ", time.time() - start1 )
     return render(request, 'infra/bridge_table.html', context)
 
+# << 損傷写真帳のデータ作成(Celeryタスク)の受付記録 >>
+# 結果バックエンドは、知らないタスクIDも期限切れの結果も PENDING(順番待ち)と返すため、
+# 受け付けたタスクIDと受付時刻をセッションに記録して見分ける(結果と同じくCELERY_RESULT_EXPIRESで期限切れ)
+PICTURELIST_TASKS_SESSION_KEY = 'picturelist_tasks'
+
+def remember_picturelist_task(request, task_id):
+    now = time.time()
+    tasks = {key: issued for key, issued in request.session.get(PICTURELIST_TASKS_SESSION_KEY, {}).items()
+             if now - issued < settings.CELERY_RESULT_EXPIRES} # 期限切れの記録は削除
+    tasks[task_id] = now
+    request.session[PICTURELIST_TASKS_SESSION_KEY] = tasks
+
+def known_picturelist_task(request, task_id):
+    issued = request.session.get(PICTURELIST_TASKS_SESSION_KEY, {}).get(task_id)
+    return issued is not None and time.time() - issued < settings.CELERY_RESULT_EXPIRES
+
+# << 損傷写真帳のデータ作成(Celeryタスク)の進捗を返す >>
+def picturelist_status(request, task_id):
+    if not known_picturelist_task(request, task_id): # 順番待ちと区別できないため、完了扱いにして画面側で作成し直させる
+        return JsonResponse({'state': 'UNKNOWN', 'ready': True})
+    result = AsyncResult(task_id)
+    status = {'state': result.state, 'ready': result.ready()}
+    if result.state == "PROGRESS": # {stage: 段階, current: 処理済みの旗揚げ数, total: 全旗揚げ数}
+        status.update(result.info or {})
+    elif result.failed():
+        status['error'] = str(result.result)
+    return JsonResponse(status)
+
 # << entity_extension 　　　　関数をdxf_file.py(別モジュール)に移動 >>
 
-# << find_square_around_text 関数をdxf_file.py(別モジュール)に移動 >>
+# << find_square_around_text 関数はdxf_file.pyのfind_span_flagsに置き換え >>
 
 # << create_picturelist 　　 関数をtasks.py    (非同期処理) に移動 >>
 
@@ -1460,7 +1402,7 @@ def handle_uploaded_file(f):
 
 # << 写真の変更内容を反映 >>
 def upload_picture(request, article_pk, pk):
-    bucket_name = "infraprotect"
+    bucket_name = get_storage().bucket_name
     
     article = get_object_or_404(FullReportData, id=article_pk)
     print(article)
@@ -1539,7 +1481,7 @@ def observations_list(request, article_pk, pk):
     # table = Table.objects.filter(id=pk).first()
     print(f"table_name:{table}")
 
-    bucket_name = 'infraprotect'
+    bucket_name = get_storage().bucket_name
     print(bucket_name)
     folder_name = article.案件名+"/"
     print(folder_name)
@@ -1555,9 +1497,9 @@ def observations_list(request, article_pk, pk):
         print(f"該当オブジェクト：{matched_objects}")
         # 結果を表示
         for obj_key in matched_objects:
-            encode_dxf_filename = f"https://{bucket_name}.s3.ap-northeast-1.amazonaws.com/{obj_key}"
+            encode_dxf_filename = get_storage().object_url(obj_key)
     else:
-        encode_dxf_filename = f"https://{bucket_name}.s3.ap-northeast-1.amazonaws.com/{sub_obj_key}" # 「*」を含めない
+        encode_dxf_filename = get_storage().object_url(sub_obj_key) # 「*」を含めない
         print("ファイルが見つかりません")
     
     dxf_filename = urllib.parse.quote(encode_dxf_filename, safe='/:') # スラッシュとコロン以外をエンコード
@@ -1586,35 +1528,6 @@ def observations_list(request, article_pk, pk):
         "塩ビ": "V",
         "その他": "X",
     }
-    
-    number_change = {
-        '①': '腐食',
-        '②': '亀裂',
-        '③': 'ゆるみ・脱落',
-        '④': '破断',
-        '⑤': '防食機能の劣化',
-        '⑥': 'ひびわれ',
-        '⑦': '剥離・鉄筋露出',
-        '⑧': '漏水・遊離石灰',
-        '⑨': '抜け落ち',
-        '⑩': '補修・補強材の損傷',
-        '⑪': '床版ひびわれ',
-        '⑫': 'うき',
-        '⑬': '遊間の異常',
-        '⑭': '路面の凹凸',
-        '⑮': '舗装の異常',
-        '⑯': '支承部の機能障害',
-        '⑰': 'その他',
-        '⑱': '定着部の異常',
-        '⑲': '変色・劣化',
-        '⑳': '漏水・滞水',
-        '㉑': '異常な音・振動',
-        '㉒': '異常なたわみ',
-        '㉓': '変形・欠損',
-        '㉔': '土砂詰まり',
-        '㉕': '沈下・移動・傾斜',
-        '㉖': '洗掘',
-    }
 
     # lank_order = ['a', 'b', 'c', 'd', 'e']  # ランクの順序をリストで定義
     # def get_lank_value(damage_name):
@@ -1657,7 +1570,7 @@ def observations_list(request, article_pk, pk):
                 if damage_name == "NON":
                     damage_name = damage_name
                 elif damage_name[0] != '⑰': #　(17)以外
-                    damage_name = number_change[damage_name[0]]
+                    damage_name = DAMAGE_NAMES[damage_name[0]]
                 else: # (17)の場合
                     pattern = r'\(.*?\:'
                     result_1 = re.sub(pattern, '', damage_name)
@@ -1771,7 +1684,7 @@ def observations_list(request, article_pk, pk):
                 if damage_name == "NON":
                     damage_name = damage_name
                 elif damage_name[0] != '⑰':
-                    damage_name = number_change[damage_name[0]]
+                    damage_name = DAMAGE_NAMES[damage_name[0]]
                 # else:
                     # damage_name = damage_name[1:]
                 else: # (17)の場合
@@ -1991,20 +1904,15 @@ def observations_list(request, article_pk, pk):
         if observer_data.damage_name.startswith("その他"):
             damage_name_result = "その他"
         else:
-            pattern = r'^[①-㉖]|-[a-zA-Z]$'# 「その他」の場合、「の他」と変換されてしまう
-            damage_name_result = re.sub(pattern, '', observer_data.damage_name)
+            damage_name_result = damage_label(observer_data.damage_name) or observer_data.damage_name # 丸番号と判定を除いた損傷名
         print(f"123:{damage_name_result}")
         
-        for key, value in number_change.items():
-            print(f"value：{value}")
-            print(f"damage_name_result：{damage_name_result}")
-            if value == damage_name_result:# 「その他(分類)」では番号は見つからない。そのため ↑ で「その他」としている
-                print(f"123:{damage_name_result}")
-                # 一致する場合、丸番号を text の先頭に追加
-                number_and_text = key + damage_name_result
-                print(f"number_and_text:{number_and_text}")
-            elif damage_name_result == "NON":
-                number_and_text = "NON"
+        if damage_name_result in DAMAGE_CODES:# 「その他(分類)」では番号は見つからない。そのため ↑ で「その他」としている
+            # 一致する場合、丸番号を text の先頭に追加
+            number_and_text = DAMAGE_CODES[damage_name_result] + damage_name_result
+            print(f"number_and_text:{number_and_text}")
+        elif damage_name_result == "NON":
+            number_and_text = "NON"
         
         span_number_data = observer_data.span_number + "径間"
         # クエリセットでフィルタリング
@@ -2384,17 +2292,15 @@ def excel_output(request, article_pk, pk):
 
     # FullReportDataをリスト化
     no10_records_list = list(no10_records)
-    # 座標によってFullReportDataを辞書に格納
-    full_report_dict = defaultdict(list)
+    # 座標によってFullReportDataを索引に格納(座標は誤差以内で一致させる)
+    full_report_index = CoordinateIndex()
     for record in no10_records_list:
-        key = (record.damage_coordinate_x, record.damage_coordinate_y, record.table, record.infra, record.article)
-        full_report_dict[key].append(record)
+        full_report_index.add(record.damage_x, record.damage_y, record, group=(record.table_id, record.infra_id, record.article_id))
         
     damage_picture_data = BridgePicture.objects.filter(infra=pk, article=article_pk)
     # BridgePictureのデータを処理
     for picture in damage_picture_data:
-        key = (picture.damage_coordinate_x, picture.damage_coordinate_y, picture.table, picture.infra, picture.article)
-        matching_records = full_report_dict.get(key) # キー一致のレコードを取得
+        matching_records = full_report_index.near(picture.damage_x, picture.damage_y, group=(picture.table_id, picture.infra_id, picture.article_id)) # 座標が一致するレコードを取得
 
         # print(picture.image)
         print(f"combined_result：{picture.picture_count}")
@@ -2504,39 +2410,9 @@ def excel_output(request, article_pk, pk):
             parts_number = ""
         # 損傷名を入力形式に分ける( ⑦剥離・鉄筋露出-e )
         if "-" in record['damage_name']:
-            # 置き換え用の辞書
-            number_change = {
-                '①': '腐食',
-                '②': '亀裂',
-                '③': 'ゆるみ・脱落',
-                '④': '破断',
-                '⑤': '防食機能の劣化',
-                '⑥': 'ひびわれ',
-                '⑦': '剥離・鉄筋露出',
-                '⑧': '漏水・遊離石灰',
-                '⑨': '抜け落ち',
-                '⑩': '補修・補強材の損傷',
-                '⑪': '床版ひびわれ',
-                '⑫': 'うき',
-                '⑬': '遊間の異常',
-                '⑭': '路面の凹凸',
-                '⑮': '舗装の異常',
-                '⑯': '支承部の機能障害',
-                '⑰': 'その他',
-                '⑱': '定着部の異常',
-                '⑲': '変色・劣化',
-                '⑳': '漏水・滞水',
-                '㉑': '異常な音・振動',
-                '㉒': '異常なたわみ',
-                '㉓': '変形・欠損',
-                '㉔': '土砂詰まり',
-                '㉕': '沈下・移動・傾斜',
-                '㉖': '洗掘',
-            }
-
             first_char = record['damage_name'][0] # 先頭の1文字を取得                
             # print(f"first_char　{first_char}")
-            damage_name = number_change.get(first_char, "") # 辞書で値を取得
+            damage_name = DAMAGE_NAMES.get(first_char, "") # 辞書(damage_lexicon.py)で値を取得
             damage_lank = record['damage_name'][-1]
             # print(f"3-damage_name　{damage_name}") # 損傷種類（ ひびわれ ）
             # print(f"4-damage_lank　{damage_lank}") # 損傷程度（    d    ）
@@ -2625,10 +2501,7 @@ def excel_output(request, article_pk, pk):
         # TODO：openpyxlはローカル写真の貼付けのみ、S3バケットの写真をDLせず貼付けることは不可能
         # 画像をS3からダウンロードしてメモリ上に保存
         try:
-            response = requests.get(image_path) # 指定したURLから画像データを取得
-            response.raise_for_status()  # リクエストが成功したか確認(失敗したら例外処理となる)
-
-            image_data = response.content
+            image_data = read_url(image_path) # 指定したURLから画像データを取得(失敗したら例外処理となる)
             pil_img = PILImage.open(io.BytesIO(image_data))
             
             width, height = pil_img.size
@@ -2653,7 +2526,7 @@ def excel_output(request, article_pk, pk):
             img.anchor = ws[join_picture_cell[i10]].coordinate
             ws.add_image(img)
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ClientError, OSError) as e: # ストレージからの取得失敗も含む
             print(f"写真貼付けエラー: {e}")
             
         ws[join_damage_memo_cell[i10]] = record['textarea_content'] # メモ
@@ -2807,7 +2680,7 @@ def edit_send_data(request, damage_pk, table_pk):
         print(f"ターゲット アタッチメント ポイント (初期設定): {target_attachment_point}")
         
         x_points, y_points = map(float, points.split(','))
-        damage_points_text = FullReportData.objects.filter(damage_coordinate_x=x_points, damage_coordinate_y=y_points)
+        damage_points_text = FullReportData.objects.near(x_points, y_points) # 座標が誤差以内の旗揚げ
         print(f"削除対象:{damage_points_text}")
         
 
@@ -2823,7 +2696,7 @@ def edit_send_data(request, damage_pk, table_pk):
                 print("削除できませんでした")
         else:
             print("削除対象が見つかりません")
-        if not FullReportData.objects.filter(damage_coordinate_x=x_points, damage_coordinate_y=y_points):
+        if not FullReportData.objects.near(x_points, y_points):
             print("削除しました")
         
         def find_square_around_text(dxf_filename, new_text):
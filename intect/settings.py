@@ -134,6 +134,50 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 LOGIN_REDIRECT_URL = 'list-article' # ログイン時に表示するページ
 LOGOUT_REDIRECT_URL = '/'
 
+# S3(storage.py)：図面と写真を保存しているバケットと接続の設定
+S3_BUCKET_NAME = os.environ.get("S3_BUCKET_NAME", "infraprotect")
+S3_REGION_NAME = os.environ.get("S3_REGION_NAME", "ap-northeast-1")
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", 32)) # プロセス共通クライアントの最大接続数
+S3_MAX_ATTEMPTS = int(os.environ.get("S3_MAX_ATTEMPTS", 5)) # 失敗時の最大試行回数
+# 図面と写真の保存先(storage.py)　s3：S3　cached_s3：S3 + ローカルのキャッシュ　local：ローカルのフォルダ(オフライン・負荷試験用)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "s3")
+STORAGE_CACHE_DIR = os.environ.get("STORAGE_CACHE_DIR", BASE_DIR / "storage_cache") # cached_s3：取得したオブジェクトの保存先
+STORAGE_LIST_TTL = int(os.environ.get("STORAGE_LIST_TTL", 60)) # cached_s3：一覧を再利用する時間(秒)
+STORAGE_LIST_MAX_ENTRIES = 1024 # cached_s3：プロセス内に保持する一覧の数
+STORAGE_CACHE_MAX_BYTES = int(os.environ.get("STORAGE_CACHE_MAX_BYTES", 1024 * 1024 * 1024)) # cached_s3：保存先の上限サイズ
+LOCAL_STORAGE_ROOT = os.environ.get("LOCAL_STORAGE_ROOT", BASE_DIR / "local_storage") # local：バケット名/キー の構成でファイルを置くフォルダ
+LOCAL_STORAGE_URL = "/local-storage/" # local：写真を配信するURL
+
+# DXF抽出結果のキャッシュ(バケット/キー/ETagごと)
+DXF_CACHE_DIR = os.environ.get("DXF_CACHE_DIR", BASE_DIR / "dxf_cache") # ディスクキャッシュの保存先
+DXF_CACHE_MEMORY_ENTRIES = 32 # プロセス内に保持する図面数
+DXF_CACHE_MAX_BYTES = 512 * 1024 * 1024 # ディスクキャッシュの上限サイズ
+DXF_STORE_DIR = os.environ.get("DXF_STORE_DIR", BASE_DIR / "dxf_store") # S3から取得したdxfファイルの保存先(ワーカー間で共有可)
+DXF_STORE_MAX_BYTES = int(os.environ.get("DXF_STORE_MAX_BYTES", 2 * 1024 * 1024 * 1024)) # dxfファイルの保存先の上限サイズ
+DXF_STREAMING_MIN_BYTES = int(os.environ.get("DXF_STREAMING_MIN_BYTES", -1)) # このサイズ以上のdxfファイルは逐次読み込み(-1:使わない　0:常に逐次読み込み)
+DXF_MAX_RECORDS = int(os.environ.get("DXF_MAX_RECORDS", 0)) # 1図面で読み込む文字列(MText)とDefpoints枠の上限(超えたら抽出を中止　0:上限なし)
+DXF_PREEXTRACT_WORKERS = int(os.environ.get("DXF_PREEXTRACT_WORKERS", 4)) # 事前抽出の並列プロセス数
+DXF_PREEXTRACT_TIMEOUT = int(os.environ.get("DXF_PREEXTRACT_TIMEOUT", 300)) # 事前抽出の1図面あたりの制限時間(秒)
+
+# S3の写真フォルダ一覧を再利用する時間(秒)
+PHOTO_INDEX_TTL = int(os.environ.get("PHOTO_INDEX_TTL", 300))
+PHOTO_INDEX_MAX_FOLDERS = 1024 # プロセス内に保持する写真フォルダの一覧の数
+# 写真フォルダの一覧を同時に取得する数(photo_resolver.py)
+PHOTO_RESOLVER_CONCURRENCY = int(os.environ.get("PHOTO_RESOLVER_CONCURRENCY", 16))
+# 名前の置換処理(NameEntry)を他のプロセスでの変更に合わせて作り直す間隔(秒)
+NAME_REPLACER_TTL = int(os.environ.get("NAME_REPLACER_TTL", 60))
+
+# Celeryの設定(ブローカーと結果の保存先)
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
+CELERY_RESULT_EXPIRES = 60 * 60 # タスクの結果を保持する時間(秒)
+CELERY_TASK_TRACK_STARTED = True
+CELERY_TASK_SERIALIZER = "json"
+CELERY_RESULT_SERIALIZER = "json"
+CELERY_ACCEPT_CONTENT = ["json"]
+# 損傷写真帳のデータ作成をCeleryワーカーで行う(False：リクエスト内で作成)
+PICTURELIST_ASYNC = os.environ.get("PICTURELIST_ASYNC", "False") == "True"
+
 if not DEBUG:
     # Herokuデプロイ時に必要になるライブラリのインポート
     import django_heroku
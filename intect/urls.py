@@ -14,11 +14,18 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
+from django.views.static import serve
 
 urlpatterns = [
     path("admin/", admin.site.urls, name="admin"),
     path('accounts/', include('accounts.urls')),
     path('', include('infra.urls')),
-]
\ No newline at end of file
+]
+
+# ローカルのストレージ(storage.py)を使う場合は、写真もローカルのフォルダから配信
+# (開発時はinfra/urls.pyのMEDIA_URL「/」がすべてのURLに一致するため、先頭に追加する)
+if settings.STORAGE_BACKEND == "local":
+    urlpatterns.insert(0, re_path(r"^%s(?P<path>.*)$" % settings.LOCAL_STORAGE_URL.lstrip("/"), serve, {"document_root": settings.LOCAL_STORAGE_ROOT}))
\ No newline at end of file